@@ -0,0 +1,223 @@
+"""Benchmark KnowledgeLibrary and KnowledgeApi on synthetic catalogs.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --sizes 1000,10000,100000
+    python -m benchmarks.run --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+Every operation is timed (best of --repeat runs for queries, one run for
+loading, generating and exporting) and run once more under tracemalloc
+for its peak Python memory. Results are printed and stored as JSON in
+benchmarks/results/, named after the time and the current commit.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from edu_graph import KnowledgeApi, KnowledgeLibrary
+
+from . import synthetic
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results')
+
+# JSON-LD is by far the slowest format, skip it on the biggest catalogs
+JSONLD_LIMIT = 100000
+# odfpy writes spreadsheets slowly, generate from .ods only up to this size
+ODS_LIMIT = 10000
+
+
+def __commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def __measure(operation, repeat):
+    """Return (best seconds of repeat runs, peak traced bytes of one run)
+    """
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def __loaded(filename, format, snapshot=False):
+    library = KnowledgeLibrary()
+    library.load(filename, format, snapshot=snapshot)
+    return library
+
+
+def __filtered(library, cached=False, **filters):
+    def run():
+        if not cached:
+            library.cache.clear()
+        api = KnowledgeApi(library)
+        api.user_data = dict(filters)
+        return api.search()
+
+    return run
+
+
+def __lister(library, method, **filters):
+    def run():
+        library.cache.clear()
+        api = KnowledgeApi(library)
+        api.user_data = dict(filters)
+        return getattr(api, method)()
+
+    return run
+
+
+def operations(size, directory):
+    """Yield (name, operation, repeat) for one catalog size
+    """
+    df = synthetic.catalog(size)
+    ids = list(df.index)
+    sample = random.Random(size).sample(ids, min(100, len(ids)))
+
+    library = KnowledgeLibrary()
+    yield 'generate', lambda: KnowledgeLibrary().generate(df), 1
+
+    if size <= ODS_LIMIT:
+        ods = os.path.join(directory, 'catalog.ods')
+        synthetic.write_ods(df, ods)
+        yield 'generate (ods)', lambda: KnowledgeLibrary().generate(ods), 1
+
+    library.generate(df)
+
+    nt = os.path.join(directory, 'catalog.nt')
+    jsonld = os.path.join(directory, 'catalog.json')
+
+    yield 'export nt', lambda: library.export(nt, 'nt'), 1
+    yield 'export nt.gz', lambda: library.export(nt + '.gz', 'nt'), 1
+    yield 'load nt', lambda: __loaded(nt, 'nt'), 1
+
+    if size <= JSONLD_LIMIT:
+        yield 'export json-ld', lambda: library.export(jsonld, 'json-ld'), 1
+        yield 'load json-ld', lambda: __loaded(jsonld, 'json-ld'), 1
+
+    if not os.path.exists(nt):  # export skipped by --only
+        library.export(nt, 'nt')
+    __loaded(nt, 'nt', snapshot=True)
+    yield 'load snapshot', lambda: __loaded(nt, 'nt', snapshot=True), 1
+
+    yield 'search', __filtered(library), 5
+    yield 'search age+topic', __filtered(library, age='10-14', topic='Програмиране'), 5
+    yield 'search age+topic+lang', __filtered(library, age='10-14', topic='Програмиране', language='Python'), 5
+    yield 'search non-specific', __filtered(library, language='Non-specific', concept='Non-specific'), 5
+    yield 'search cached', __filtered(library, cached=True, age='10-14', topic='Програмиране'), 5
+
+    for method in ('list_ages', 'list_topics', 'list_languages', 'list_concepts', 'list_educations'):
+        yield method, __lister(library, method, age='10-14', topic='Програмиране'), 5
+
+    yield 'facets', __lister(library, 'facets', age='10-14', topic='Програмиране'), 5
+
+    def deps():
+        library.cache.clear()
+        api = KnowledgeApi(library)
+        for material in sample:
+            api.search_deps(material)
+
+    def deps_bulk():
+        KnowledgeApi(library).search_deps_bulk(sample)
+
+    yield f'search_deps x{len(sample)}', deps, 5
+    yield f'search_deps_bulk x{len(sample)}', deps_bulk, 5
+
+
+def run(sizes, repeat, only=None):
+    results = {}
+
+    for size in sizes:
+        results[size] = {}
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, operation, times in operations(size, directory):
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+
+                seconds, peak = __measure(operation, repeat if times > 1 else 1)
+                results[size][name] = {"seconds": seconds, "peak_bytes": peak}
+                print(f'{size:>9} {name:<28} {seconds * 1000:>12.2f} ms {peak / 2**20:>10.1f} MiB',
+                      flush=True)
+
+    return results
+
+
+def compare(old, new):
+    with open(old) as file:
+        old = json.load(file)
+    with open(new) as file:
+        new = json.load(file)
+
+    print(f'{old["commit"]} -> {new["commit"]}')
+
+    for size, operations in new["results"].items():
+        for name, result in operations.items():
+            before = old["results"].get(size, {}).get(name)
+            if not before:
+                continue
+
+            ratio = result["seconds"] / before["seconds"] if before["seconds"] else float('inf')
+            print(f'{size:>9} {name:<28} {before["seconds"] * 1000:>12.2f} ms -> '
+                  f'{result["seconds"] * 1000:>12.2f} ms  x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='comma separated catalog sizes (materials), e.g. 1000,10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs per query operation, the best one is reported')
+    parser.add_argument('--only', default=None,
+                        help='comma separated operation name prefixes to run')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two stored result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    only = args.only.split(',') if args.only else None
+    commit = __commit()
+
+    results = run(sizes, args.repeat, only)
+
+    os.makedirs(RESULTS, exist_ok=True)
+    filename = os.path.join(RESULTS, time.strftime('%Y%m%d-%H%M%S') + f'-{commit}.json')
+
+    with open(filename, 'w') as file:
+        json.dump({
+            "commit": commit,
+            "python": platform.python_version(),
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "results": results,
+        }, file, indent=2)
+
+    print(f'Results stored in {filename}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
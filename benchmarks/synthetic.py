@@ -0,0 +1,79 @@
+"""Synthetic catalogs shaped like data/1619073985303267.ods, for benchmarks.
+
+Materials are grouped in courses (T1, T2, ...) of a few to a few dozen
+materials. Every material depends on the previous one of its course,
+some depend on whole earlier courses or on ranges like T3.1-T3.8, and
+the facet columns are drawn from vocabularies with a realistic share of
+empty cells.
+"""
+import random
+
+import pandas as pd
+
+# empty cells read from a spreadsheet are NaN
+EMPTY = float('nan')
+
+COLUMNS = ['Учебна Единица', 'Зависи от ', 'възрастова група',
+           'области', 'под-теми', 'концепции', 'тагове', 'background']
+
+AGES = ['8-10', '10-14', '14-18', '18-58', '58-70']
+TOPICS = ['Програмиране', 'Алгоритми', 'Бази от данни', 'Мрежи', 'Операционни системи']
+LANGUAGES = ['Python', 'C', 'C++', 'Pascal', 'Java', 'JavaScript', 'Go', 'Rust']
+EDUCATIONS = ['всички', 'математици', 'биолози', 'статистици',
+              'начинаещи', 'data scientists', 'computer scientists']
+
+
+def __sample(rng, vocabulary, most, empty):
+    if rng.random() < empty:
+        return EMPTY
+
+    return ', '.join(rng.sample(vocabulary, rng.randint(1, most)))
+
+
+def catalog(materials, seed=0):
+    """Return a DataFrame with the given number of materials, indexed by
+    material id like the spreadsheet read by KnowledgeLibrary.generate
+    """
+    rng = random.Random(seed)
+
+    concepts = [f'концепция_{i}' for i in range(max(10, materials // 50))]
+    tags = [f'таг_{i}' for i in range(max(20, materials // 20))]
+
+    ids = []
+    rows = []
+    course = 0
+
+    while len(ids) < materials:
+        course += 1
+        size = min(rng.randint(3, 40), materials - len(ids))
+
+        for number in range(1, size + 1):
+            if number > 1:
+                deps = [f'T{course}.{number - 1}']
+            elif course > 1:
+                deps = [f'T{rng.randint(1, course - 1)}']
+            else:
+                deps = []
+
+            if number > 3 and rng.random() < 0.1:
+                deps.append(f'T{course}.1-T{course}.{rng.randint(2, number - 1)}')
+            if course > 1 and rng.random() < 0.05:
+                deps.append(f'T{rng.randint(1, course - 1)}')
+
+            ids.append(f'T{course}.{number}')
+            rows.append([
+                f'Материал {course}.{number}',
+                ', '.join(deps) or EMPTY,
+                __sample(rng, AGES, len(AGES), 0.02),
+                __sample(rng, TOPICS, 1, 0.0),
+                __sample(rng, LANGUAGES, 2, 0.3),
+                __sample(rng, concepts, 3, 0.25),
+                __sample(rng, tags, 3, 0.1),
+                'всички' if rng.random() < 0.9 else __sample(rng, EDUCATIONS, 2, 0.0),
+            ])
+
+    return pd.DataFrame(rows, index=pd.Index(ids, name='id'), columns=COLUMNS)
+
+
+def write_ods(df, filename):
+    df.to_excel(filename, engine='odf')
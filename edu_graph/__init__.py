@@ -1,44 +1,56 @@
 import click
 import json
+import signal
+import sys
 
-from .knowledge_api import KnowledgeApi as KnowledgeApi
-from .knowledge_library import KnowledgeLibrary as KnowledgeLibrary
+from . import knowledge_server
+
+# The API and the library pull in rdflib (and pandas/inquirer where used),
+# so they are only imported when first used. The CLI talking to a running
+# daemon never imports them at all.
+__lazy = {
+    'KnowledgeApi': '.knowledge_api',
+    'KnowledgeLibrary': '.knowledge_library',
+    'SearchFilters': '.knowledge_api',
+}
+
+
+def __getattr__(name):
+    if name not in __lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+
+    value = getattr(importlib.import_module(__lazy[name], __name__), name)
+    globals()[name] = value
+
+    return value
 
 
 def __list(filename, format, field, print):
-    library = KnowledgeLibrary()
-    library.load(filename, format)
-    api = KnowledgeApi(library)
+    from .knowledge_api import KnowledgeApi
+
+    api = KnowledgeApi(knowledge_server.library(filename, format))
 
     method = f'list_{field}'
 
     result = getattr(api, method)()
 
     if (print == "JSON"):
-        click.echo(json.dumps({"{field}": result}))
+        click.echo(json.dumps({field: result}, ensure_ascii=False))
     else:
         click.echo(list(map(lambda item: str(item), result)))
 
 
-@click.group()
-def edu_graph():
-    """A CLI for querying learning materials from a RDF based educational graph"""
+def __filtered_api(filename, format, age, topic, lang, education, concept, query=None):
+    from .knowledge_api import KnowledgeApi
 
+    library = knowledge_server.library(filename, format)
+
+    return __apply_filters(KnowledgeApi(library), age, topic, lang, education, concept, query)
 
-@click.argument('filename')
-@click.option('--format', help="Format of the specified file", required=True, type=str)
-@click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
-@click.option('-a', '--age', help="Age range for the search (eg. 8-10)", required=False, type=str)
-@click.option('-t', '--topic', help="The topic to search materials for", required=False, type=str)
-@click.option('-l', '--lang', help="The programming language which materials are for", required=False, type=str)
-@click.option('-e', '--education', help="The education frield the material are focused for. (eg. mathematicians, musicians, all)", required=False, type=str, default="всички")
-@click.option('-c', '--concept', help="The concept to learn", required=False, type=str)
-@edu_graph.command(help="Search within the graph for a materials based on a set of criterias")
-def search(filename, format, print, age, topic, lang, education, concept):
-    library = KnowledgeLibrary()
-    library.load(filename, format)
-    api = KnowledgeApi(library)
 
+def __apply_filters(api, age, topic, lang, education, concept, query=None):
     if age:
         api.set_age(age)
     if topic:
@@ -49,22 +61,183 @@ def search(filename, format, print, age, topic, lang, education, concept):
         api.set_education(education)
     if concept:
         api.set_concept(concept)
+    if query:
+        api.set_query(query)
+
+    return api
+
+
+__batch_library = None
+
+# Filters of a batch search line, each one a string when given
+BATCH_FILTERS = ('age', 'topic', 'lang', 'education', 'concept', 'query')
+
+
+def __batch_search(line):
+    """Run one JSONL line of a batch search against the shared library
+    """
+    from .knowledge_api import KnowledgeApi
+
+    try:
+        query = json.loads(line)
+
+        for name in BATCH_FILTERS:
+            if query.get(name) is not None and not isinstance(query[name], str):
+                raise ValueError(f"{name} must be a string")
+
+        api = __apply_filters(KnowledgeApi(__batch_library), query.get('age'), query.get('topic'), query.get(
+            'lang'), query.get('education', "всички"), query.get('concept'), query.get('query'))
+        result = api.search()
+    except (ValueError, AttributeError, TypeError) as error:
+        return json.dumps({"query": line.strip(), "error": str(error)}, ensure_ascii=False)
+
+    return json.dumps({
+        "query": query,
+        "results": list(map(lambda item: {"id": item[0], "title": item[2], "course": item[1]}, result)),
+    }, ensure_ascii=False)
+
+
+def __search_batch(filename, format, batch, workers):
+    global __batch_library
+
+    __batch_library = knowledge_server.library(filename, format)
+
+    lines = filter(lambda line: line.strip(), batch)
+
+    if workers <= 1:
+        for line in lines:
+            click.echo(__batch_search(line))
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # forked workers inherit the loaded library instead of loading their own
+    context = multiprocessing.get_context(
+        'fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        for output in executor.map(__batch_search, lines, chunksize=64):
+            click.echo(output)
+
+
+class RoutedGroup(click.Group):
+    """Command group sending read only commands to a running `edu_graph serve`
+    daemon, and running them in-process when there is none
+    """
+
+    routed = ('search', 'facets', 'path', 'recommend', 'ages', 'topics',
+              'languages', 'concepts', 'educations')
+
+    def invoke(self, ctx):
+        args = [*ctx.protected_args, *ctx.args]
+
+        if ctx.params.get('profile'):
+            from .knowledge_metrics import metrics
+            ctx.call_on_close(lambda: click.echo(metrics.report(), err=True))
+
+        if (knowledge_server.serving or ctx.params.get('local') or ctx.params.get('profile') or not args
+                or args[0] not in self.routed or '-b' in args or '--batch' in args):
+            return super().invoke(ctx)
+
+        response = knowledge_server.request(args)
+
+        if response is None:
+            return super().invoke(ctx)
+
+        output, code = response
+        click.echo(output, nl=False)
+        ctx.exit(code)
+
+
+@click.group(cls=RoutedGroup)
+@click.option('--local', help="Run in-process even when a daemon is running", is_flag=True)
+@click.option('--profile', help="Run in-process and print the time spent in every query to stderr", is_flag=True)
+def edu_graph(local, profile):
+    """A CLI for querying learning materials from a RDF based educational graph"""
+
+
+@click.argument('filename')
+@click.option('--format', help="Format of the specified file", required=True, type=str)
+@click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
+@click.option('-a', '--age', required=False, type=str,
+              help="Age range for the search: a stored range (eg. 8-10) matches exactly, any other "
+                   "age (eg. 12) or range (eg. 9-12) every stored range containing or overlapping it")
+@click.option('-t', '--topic', help="The topic to search materials for", required=False, type=str)
+@click.option('-l', '--lang', help="The programming language which materials are for", required=False, type=str)
+@click.option('-e', '--education', required=False, type=str, default="всички",
+              help="The education frield the material are focused for. (eg. mathematicians, "
+                   "musicians, all)")
+@click.option('-c', '--concept', help="The concept to learn", required=False, type=str)
+@click.option('-q', '--query', required=False, type=str,
+              help="Words to look for in titles, concepts and keywords, results are ranked by "
+                   "relevance")
+@click.option('-b', '--batch', required=False, type=click.File('r'),
+              help="JSONL file (or - for stdin) with one search per line, using the keys age, "
+                   "topic, lang, concept, education and query. Results are printed as JSONL in "
+                   "input order")
+@click.option('-w', '--workers', help="Number of worker processes for --batch", required=False, type=int, default=1)
+@edu_graph.command(help="Search within the graph for a materials based on a set of criterias")
+def search(filename, format, print, age, topic, lang, education, concept, query, batch, workers):
+    if batch:
+        __search_batch(filename, format, batch, workers)
+        return
+
+    api = __filtered_api(filename, format, age, topic, lang, education, concept, query)
 
     result = api.search()
 
     if (print == "JSON"):
         click.echo(json.dumps(
-            list(map(lambda item: {"id": item[0], "title": item[2], "course": item[1]}, result)), ensure_ascii=False).encode('utf8').decode())
+            list(map(lambda item: {"id": item[0], "title": item[2], "course": item[1]}, result)),
+            ensure_ascii=False).encode('utf8').decode())
     else:
         click.echo(
             list(map(lambda item: "{} - {} ({})".format(item[0], item[2], item[1]), result)))
 
 
+@click.argument('filename')
+@click.option('--format', help="Format of the specified file", required=True, type=str)
+@click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
+@click.option('-a', '--age', required=False, type=str,
+              help="Age range for the search: a stored range (eg. 8-10) matches exactly, any other "
+                   "age (eg. 12) or range (eg. 9-12) every stored range containing or overlapping it")
+@click.option('-t', '--topic', help="The topic to search materials for", required=False, type=str)
+@click.option('-l', '--lang', help="The programming language which materials are for", required=False, type=str)
+@click.option('-e', '--education', required=False, type=str, default="всички",
+              help="The education frield the material are focused for. (eg. mathematicians, "
+                   "musicians, all)")
+@click.option('-c', '--concept', help="The concept to learn", required=False, type=str)
+@click.option('-q', '--query', required=False, type=str,
+              help="Words to look for in titles, concepts and keywords, results are ranked by "
+                   "relevance")
+@edu_graph.command(help="List all facets with the number of matching materials per value, together "
+                        "with the search results")
+def facets(filename, format, print, age, topic, lang, education, concept, query):
+    api = __filtered_api(filename, format, age, topic, lang, education, concept, query)
+
+    result = api.facets()
+    results = result.pop("results")
+
+    if (print == "JSON"):
+        output = {field: list(map(lambda item: {"value": item[0], "count": item[1]}, values))
+                  for field, values in result.items()}
+        output["results"] = list(map(
+            lambda item: {"id": item[0], "title": item[2], "course": item[1]}, results))
+        click.echo(json.dumps(output, ensure_ascii=False))
+    else:
+        for field, values in result.items():
+            click.echo("{}: {}".format(field, ", ".join(
+                map(lambda item: "{} ({})".format(item[0], item[1]), values))))
+        click.echo(
+            list(map(lambda item: "{} - {} ({})".format(item[0], item[2], item[1]), results)))
+
+
 @click.argument('filename')
 @click.option('--format', help="Format of the specified file", required=True, type=str)
 @click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
 @edu_graph.command(help="List all available ages within all the matarials")
-def ages(filename, format):
+def ages(filename, format, print):
     __list(filename, format, "ages", print)
 
 
@@ -100,11 +273,172 @@ def educations(filename, format, print):
     __list(filename, format, "educations", print)
 
 
+@click.argument('filename')
+@click.option('--format', help="Format of the specified file", required=True, type=str)
+@click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
+@click.option('-m', '--material', help="The material to learn (eg. T5.3)", required=False, type=str)
+@click.option('-k', '--known', required=False, type=str, multiple=True,
+              help="A material known already, can be repeated")
+@click.option('-b', '--batch', required=False, type=click.File('r'),
+              help="JSONL file (or - for stdin) with one profile per line, using the keys material "
+                   "and known (a list). Paths are printed as JSONL in input order")
+@edu_graph.command(help="Plan the learning path to a material, prerequisites first, skipping what is known already")
+def path(filename, format, print, material, known, batch):
+    from .knowledge_api import KnowledgeApi
+
+    api = KnowledgeApi(knowledge_server.library(filename, format))
+
+    if batch:
+        profiles = [json.loads(line) for line in batch if line.strip()]
+        paths = api.learning_paths(
+            [(profile["material"], profile.get("known", [])) for profile in profiles])
+
+        for profile, result in zip(profiles, paths):
+            click.echo(json.dumps({
+                "profile": profile,
+                "path": list(map(lambda item: {"id": item[0], "title": item[2], "course": item[1]}, result)),
+            }, ensure_ascii=False))
+        return
+
+    if not material:
+        raise click.UsageError("Missing option '-m' / '--material' (or '-b' / '--batch').")
+
+    result = api.learning_path(material, known)
+
+    if (print == "JSON"):
+        click.echo(json.dumps(
+            list(map(lambda item: {"id": item[0], "title": item[2], "course": item[1]}, result)), ensure_ascii=False))
+    else:
+        click.echo(
+            list(map(lambda item: "{} - {} ({})".format(item[0], item[2], item[1]), result)))
+
+
+@click.argument('filename')
+@click.option('--format', help="Format of the specified file", required=True, type=str)
+@click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
+@click.option('-m', '--material', help="The material learned (eg. T5.3)", required=True, type=str)
+@click.option('-n', '--limit', help="Number of materials per recommendation", required=False, default=5, type=int)
+@edu_graph.command(help="Recommend materials similar to a material and the materials it unlocks")
+def recommend(filename, format, print, material, limit):
+    from .knowledge_api import KnowledgeApi
+
+    api = KnowledgeApi(knowledge_server.library(filename, format))
+
+    result = api.recommend(material, limit)
+
+    if (print == "JSON"):
+        click.echo(json.dumps({
+            name: list(map(lambda item: {"id": item[0], "title": item[2], "course": item[1]}, rows))
+            for name, rows in result.items()
+        }, ensure_ascii=False))
+    else:
+        for name, rows in result.items():
+            click.echo("{}: {}".format(name.capitalize(), list(
+                map(lambda item: "{} - {} ({})".format(item[0], item[2], item[1]), rows))))
+
+
+@click.argument('output')
+@click.argument('filename')
+@click.option('--format', help="Format of the specified file", required=True, type=str)
+@edu_graph.command(help="Compile the facet bundle which the frontend filters with in the browser")
+def bundle(filename, output, format):
+    from . import knowledge_bundle
+
+    library = knowledge_server.library(filename, format)
+    compiled = knowledge_bundle.write(library, output)
+
+    click.echo("{} materials in {}".format(len(compiled["materials"]), output))
+
+
+@click.argument('spreadsheet')
+@click.argument('filename')
+@click.option('--format', help="Format of the specified file", required=True, type=str)
+@click.option('-p', '--print', help="Print format", required=True, default="plain", type=click.Choice(['plain', 'JSON']))
+@click.option('-b', '--bundle', required=False, type=str,
+              help="Also write the facet bundle of the synced graph to this file")
+@edu_graph.command(help="Apply the changes of an edited spreadsheet to an existing graph file")
+def sync(filename, spreadsheet, format, print, bundle):
+    from .knowledge_library import KnowledgeLibrary
+
+    if format == 'sqlite':
+        library = KnowledgeLibrary(store=filename)
+    else:
+        library = KnowledgeLibrary()
+        library.load(filename, format)
+
+    delta = library.update(spreadsheet)
+
+    if (delta["added"] or delta["removed"]) and not library.persistent:
+        library.export(filename, format)
+
+    if bundle:
+        from . import knowledge_bundle
+
+        knowledge_bundle.write(library, bundle)
+
+    if (print == "JSON"):
+        click.echo(json.dumps({
+            "added": len(delta["added"]),
+            "removed": len(delta["removed"]),
+            "materials": delta["materials"],
+        }, ensure_ascii=False))
+    else:
+        click.echo("+{} -{} triples in {} materials: {}".format(
+            len(delta["added"]), len(delta["removed"]), len(delta["materials"]),
+            ", ".join(delta["materials"])))
+
+
+@click.argument('database')
+@click.argument('source')
+@click.option('--format', help="Format of the source file, or ods for a spreadsheet", required=True, type=str)
+@edu_graph.command(help="Build a persistent SQLite store from a graph file or spreadsheet, queried "
+                        "by the other commands with --format sqlite")
+def store(source, database, format):
+    from .knowledge_library import KnowledgeLibrary
+
+    library = KnowledgeLibrary(store=database)
+
+    if format == 'ods':
+        library.generate(source)
+    else:
+        library.load(source, format)
+
+    click.echo("{} triples in {}".format(len(library.graph), database))
+
+
+@click.argument('filename', required=False)
+@click.option('--format', help="Format of the specified file", required=False, type=str)
+@click.option('-s', '--socket', required=False, type=str,
+              help="Socket to listen on (default: $EDU_GRAPH_SOCKET, or a socket in $XDG_RUNTIME_DIR "
+                   "or in a private per-user directory of the temp dir)")
+@edu_graph.command(help="Keep graphs loaded in a daemon which the other commands use while it runs")
+def serve(filename, format, socket):
+    knowledge_server.serving = True
+
+    if filename:
+        knowledge_server.library(filename, format)
+
+    server = knowledge_server.KnowledgeServer(edu_graph, socket)
+    click.echo(f"Listening on {server.path}", err=True)
+
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
 @edu_graph.command(help="Sample command showing interactive questionere")
 def sample():
     """Sample function showing how to load, generate, export and use the interactive
     CLI in order to get user profile and learning path
     """
+    from .knowledge_api import KnowledgeApi
+    from .knowledge_library import KnowledgeLibrary
+
     library = KnowledgeLibrary()
 
     library.load("data/rdf.json", "json-ld")
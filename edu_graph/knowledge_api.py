@@ -1,32 +1,103 @@
-import inquirer as inq
-from rdflib.term import BNode
+from rdflib.namespace import RDFS, SDO
+from rdflib.term import BNode, Literal
+import heapq
 import pprint as pp
+import time
+from typing import NamedTuple
+
+from .knowledge_index import FACETS, NON_SPECIFIC, age_range
+from .knowledge_metrics import metrics, rows, timed
+from .namespace import OER
+
+
+SEARCH_QUERY = """
+    SELECT DISTINCT ?m ?course ?title
+    WHERE {
+        %(filters)s
+        ?m rdfs:label ?title .
+        ?m oer:forCourse ?course .
+    }
+    ORDER BY ?m ?course ?title
+"""
+
+VALUES_QUERY = """
+    SELECT DISTINCT ?value
+    WHERE {
+        %(filters)s
+        ?m rdfs:label ?title .
+        ?m oer:forCourse ?course .
+        ?m %(predicate)s ?value .
+    }
+    ORDER BY ?value
+"""
+
+MISSING_QUERY = """
+    ASK {
+        %(filters)s
+        ?m rdfs:label ?title .
+        ?m oer:forCourse ?course .
+        FILTER NOT EXISTS {?m %(predicate)s ?any_value} .
+    }
+"""
+
+DEPS_QUERY = """
+    SELECT DISTINCT ?material ?course ?title
+    WHERE {
+        ?m oer:coursePrerequisites* ?material .
+        ?material rdfs:label ?title .
+        ?material oer:forCourse ?course .
+    }
+    ORDER BY ?material ?course ?title
+"""
+
+# Filters results are cached by, the others do not change the results
+CACHED_FILTERS = (*FACETS, 'query')
+
+
+class SearchFilters(NamedTuple):
+    """Immutable search filters, passed per call to search, facets and the
+    list_* methods instead of being set in the user data of a shared
+    KnowledgeApi, so one api can serve many threads at once.
+    """
+    age: str = None
+    topic: str = None
+    language: str = None
+    edu_level: str = None
+    concept: str = None
+    query: str = None
+
+
+class ResultPage:
+    """One page of search rows, produced lazily while iterating.
+
+    total is the number of rows of the whole search and cursor the value to
+    pass to get the next page, None on the last one.
+    """
+
+    def __init__(self, rows, total, cursor):
+        self.__rows = rows
+        self.total = total
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.__rows)
+
+    def materialized(self):
+        """The same page with its rows built, so it can be iterated repeatedly
+        """
+        return ResultPage(list(self.__rows), self.total, self.cursor)
 
 
 class KnowledgeApi:
+    __prepared = {}
+
     def __init__(self, library):
         self.library = library
         self.user_data = {}
 
-    def __language_where_clause(self):
-        if (not self.user_data['language'] or self.user_data['language'] == 'Non-specific'):
-            return 'FILTER NOT EXISTS {?m sdo:inLanguage ?language}'
-        else:
-            return '?m sdo:inLanguage "' + self.user_data['language'] + '"'
-
-    def __concept_where_clause(self):
-        if (not self.user_data['concept'] or self.user_data['concept'] == 'Non-specific'):
-            return 'FILTER NOT EXISTS {?m sdo:teaches ?concept}'
-        else:
-            return '?m sdo:teaches "' + self.user_data['concept'] + '"'
-
-    def __edu_level_where_clause(self):
-        if (not self.user_data['edu_level'] or self.user_data['edu_level'] == 'Non-specific'):
-            return 'FILTER NOT EXISTS {?m sdo:educationalLevel ?edu_level}'
-        else:
-            return '?m sdo:educationalLevel "' + self.user_data['edu_level'] + '"'
-
     def __ask_for_age(self):
+        import inquirer as inq
+
         ages = self.list_ages()
 
         questions = [
@@ -39,6 +110,8 @@ class KnowledgeApi:
         self.user_data.update(inq.prompt(questions))
 
     def __ask_for_topic(self):
+        import inquirer as inq
+
         topics = self.list_topics()
 
         questions = [
@@ -51,6 +124,8 @@ class KnowledgeApi:
         self.user_data.update(inq.prompt(questions))
 
     def __ask_for_lang(self):
+        import inquirer as inq
+
         languages = self.list_languages()
 
         questions = [
@@ -63,6 +138,7 @@ class KnowledgeApi:
         self.user_data.update(inq.prompt(questions))
 
     def __ask_for_concept(self):
+        import inquirer as inq
 
         concepts = self.list_concepts()
 
@@ -76,6 +152,7 @@ class KnowledgeApi:
         self.user_data.update(inq.prompt(questions))
 
     def __ask_for_level(self):
+        import inquirer as inq
 
         edu_levels = self.list_educations()
 
@@ -89,22 +166,15 @@ class KnowledgeApi:
         self.user_data.update(inq.prompt(questions))
 
     def __ask_for_material(self):
+        import inquirer as inq
+
+        filters = dict(self.user_data)
+
+        for name in ('language', 'concept', 'edu_level'):
+            if not filters.get(name):
+                filters[name] = NON_SPECIFIC
 
-        available_materials = self.library.graph.query(
-            """
-            SELECT DISTINCT ?m ?course ?title
-            WHERE {
-                ?m sdo:typicalAgeRange '""" + self.user_data['age'] + """' .
-                ?m oer:forTopic '""" + self.user_data['topic'] + """' .
-                """ + self.__language_where_clause() + """ .
-                """ + self.__concept_where_clause() + """ .
-                """ + self.__edu_level_where_clause() + """ .
-                ?m rdfs:label ?title .
-                ?m oer:forCourse ?course .
-            }
-            ORDER BY ?course
-            """
-        )
+        available_materials = self.__search(filters)
 
         edu_materials = []
 
@@ -121,25 +191,15 @@ class KnowledgeApi:
         self.user_data.update(inq.prompt(questions))
 
     def __ask_for_already_known(self):
-        node, course, title = self.user_data['edu_material']
-
-        course_deps_result_set = self.library.graph.query(
-            """
-            SELECT DISTINCT ?material ?title
-            WHERE {
-                ?m oer:coursePrerequisites* ?material .
-                ?material rdfs:label ?title .
-            }
-            ORDER BY ?material
-            """, initBindings={'m': node}
-        )
+        import inquirer as inq
 
-        course_deps = []
+        node, course, title = self.user_data['edu_material']
 
-        for row in course_deps_result_set:
-            if node in row[0]:
-                continue
-            course_deps.append((str(row[1]), row[0]))
+        if self.library.prerequisites is not None:
+            course_deps = [(str(row[2]), row[0])
+                           for row in self.__indexed_deps(node) if row[0] != node]
+        else:
+            course_deps = self.__queried_already_known(node)
 
         questions = [
             inq.Checkbox('already_known',
@@ -150,23 +210,299 @@ class KnowledgeApi:
 
         self.user_data.update(inq.prompt(questions))
 
-    def __build_query(self):
-        query = []
+    def __queried_already_known(self, node):
+        course_deps_result_set = [(row[0], row[2])
+                                  for row in self.__query('deps', m=node)]
+
+        course_deps = []
+
+        for row in course_deps_result_set:
+            if row[0] == node:
+                continue
+            course_deps.append((str(row[1]), row[0]))
+
+        return course_deps
+
+    def __indexed_deps(self, node):
+        """Rows (material, course, title) for the node and all of its prerequisites
+        """
+        return self.__rows()(self.library.prerequisites.closure(node))
+
+    def __rows(self):
+        """The rows method of the shards or of the facet index
+        """
+        if self.library.shards is not None:
+            return self.library.shards.rows
+
+        return self.library.facet_index().rows
+
+    def __grouped(self, materials):
+        """Material -> rows of many materials, fetched at once
+        """
+        grouped = {}
+
+        for row in self.__rows()(materials):
+            grouped.setdefault(row[0], []).append(row)
+
+        return grouped
+
+    def __query(self, shape, filters=None, facet=None, **bindings):
+        """Run one of the query shapes through a prepared query.
+
+        Queries are compiled once per shape, facet and set of active
+        filters and cached on the class. Filter values and other terms are
+        passed as initBindings and never spliced into the query text.
+        """
+        filters = filters or {}
+        active = tuple((name, filters[name] == NON_SPECIFIC)
+                       for name in FACETS if filters.get(name))
+        key = (shape, facet, active)
+
+        query = self.__prepared.get(key)
+        if query is None:
+            query = self.__prepared[key] = self.__prepare(shape, facet, active)
+
+        for name, missing in active:
+            if not missing:
+                bindings[f'filter_{name}'] = Literal(filters[name])
+
+        start = time.perf_counter()
+        result = self.library.graph.query(query, initBindings=bindings)
+        metrics.observe(f'sparql:{shape}',
+                        time.perf_counter() - start, rows(result))
+
+        return result
+
+    def __prepare(self, shape, facet, active):
+        from rdflib.plugins.sparql import prepareQuery
+
+        clauses = []
+
+        for name, missing in active:
+            predicate = FACETS[name].n3()
+
+            if missing:
+                clauses.append(
+                    f'FILTER NOT EXISTS {{?m {predicate} ?any_{name}}} .')
+            else:
+                clauses.append(f'?m {predicate} ?filter_{name} .')
+
+        text = {
+            'search': SEARCH_QUERY,
+            'values': VALUES_QUERY,
+            'missing': MISSING_QUERY,
+            'deps': DEPS_QUERY,
+        }[shape] % {
+            'filters': '\n        '.join(clauses),
+            'predicate': FACETS[facet].n3() if facet else '',
+        }
+
+        return prepareQuery(text, initNs={'oer': OER, 'rdfs': RDFS, 'sdo': SDO})
+
+    def __scores(self, filters):
+        """Material -> rank of the full-text query in the filters, None without one
+        """
+        if not filters.get('query') or self.library.shards is not None:
+            # shards apply the full-text query themselves and return the
+            # scores with their rows
+            return None
+
+        return self.library.text_index().search(filters['query'])
 
-        if (self.user_data.get('age')):
-            query.append("""?m sdo:typicalAgeRange '""" +
-                         self.user_data['age'] + """' .""")
-        if (self.user_data.get('topic')):
-            query.append("""?m oer:forTopic '""" +
-                         self.user_data['topic'] + """' .""")
-        if (self.user_data.get('language')):
-            query.append("""""" + self.__language_where_clause() + """ .""")
-        if (self.user_data.get('concept')):
-            query.append("""""" + self.__concept_where_clause() + """ .""")
-        if (self.user_data.get('edu_level')):
-            query.append("""""" + self.__edu_level_where_clause() + """ .""")
+    def __matched(self, index, filters):
+        materials = index.match(filters)
+        scores = self.__scores(filters)
 
-        return query
+        if scores is not None:
+            materials = materials & scores.keys()
+
+        return materials, scores
+
+    def __index(self, filters):
+        """The facet index, or None to query the graph through SPARQL. Ages
+        other than the stored ranges are matched numerically, so they need
+        an index even then.
+        """
+        if self.library.index is not None:
+            return self.library.index
+
+        if self.library.shards is not None:
+            return None
+
+        age = filters.get('age')
+
+        if (age and age != NON_SPECIFIC and age_range(age) is not None
+                and (None, FACETS['age'], Literal(age)) not in self.library.graph):
+            return self.library.facet_index()
+
+        return None
+
+    def __search(self, filters):
+        if self.library.shards is not None:
+            return self.library.shards.search(self.__key_filters(filters))[0]
+
+        index = self.__index(filters)
+
+        if index is not None:
+            materials, scores = self.__matched(index, filters)
+
+            if scores is None:
+                return index.rows(materials)
+
+            return index.rows(sorted(materials, key=lambda material: (-scores[material], str(material))),
+                              ordered=True)
+
+        result = list(self.__query('search', filters))
+        scores = self.__scores(filters)
+
+        if scores is None:
+            return result
+
+        result = [row for row in result if row[0] in scores]
+        result.sort(key=lambda row: (-scores[row[0]], str(row[0])))
+
+        return result
+
+    def __page(self, filters, limit, cursor, index=None, materials=None):
+        """Page through the search by material id, or by rank when there is
+        a full-text query, starting after the cursor material
+        """
+        index = index or self.__index(filters)
+        scores = self.__scores(filters)
+
+        if index is not None:
+            if materials is None:
+                materials = index.match(filters)
+            if scores is not None:
+                materials = materials & scores.keys()
+            total = index.total(materials)
+            rows = index.iter_rows
+        else:
+            if self.library.shards is not None:
+                found, scores = self.library.shards.search(self.__key_filters(filters))
+            else:
+                found = self.__query('search', filters)
+
+            grouped = {}
+            for row in found:
+                if scores is None or row[0] in scores:
+                    grouped.setdefault(row[0], []).append(row)
+            materials = grouped.keys()
+            total = sum(map(len, grouped.values()))
+            rows = lambda page: (row for material in page for row in sorted(grouped[material]))
+
+        if scores is None:
+            key = str
+            bound = cursor
+        else:
+            key = lambda material: (-scores[material], str(material))
+            bound = cursor and (-scores.get(BNode(cursor), float('inf')), cursor)
+
+        after = (material for material in materials
+                 if cursor is None or key(material) > bound)
+
+        if limit is None:
+            return ResultPage(rows(sorted(after, key=key)), total, None)
+
+        page = heapq.nsmallest(limit + 1, after, key=key)
+        next_cursor = str(page[limit - 1]) if len(page) > limit else None
+
+        return ResultPage(rows(page[:limit]), total, next_cursor)
+
+    def __filters(self, filters):
+        """Filters of a call: the given SearchFilters, or the user data when omitted
+        """
+        return self.user_data if filters is None else filters._asdict()
+
+    def __cached(self, key, compute):
+        """Result of compute, kept in the library cache until the graph changes
+        """
+        return self.library.cache.get(self.library.version, key, compute)
+
+    @staticmethod
+    def __key(filters):
+        """Filters normalized to a hashable tuple, ignoring empty ones
+        """
+        if filters is None:
+            return None
+
+        return tuple((name, filters[name]) for name in CACHED_FILTERS if filters.get(name))
+
+    @classmethod
+    def __key_filters(cls, filters):
+        """Filters as a plain dict of the non empty ones, e.g. to send to shards
+        """
+        key = cls.__key(filters)
+
+        return None if key is None else dict(key)
+
+    def __list(self, facet, filters, non_specific=False):
+        """Values of a facet among the materials matching filters, among all
+        materials when filters is None
+        """
+        if self.library.shards is not None:
+            compute = lambda: self.library.shards.values(facet, self.__key_filters(filters))
+        elif self.library.index is not None:
+            compute = lambda: self.__list_indexed(facet, filters, non_specific)
+        else:
+            compute = lambda: self.__list_queried(facet, filters, non_specific)
+
+        return list(self.__cached(('list', facet, self.__key(filters), non_specific), compute))
+
+    def __list_queried(self, facet, filters, non_specific=False):
+        filters = filters or {}
+        index = self.__index(filters)
+
+        if index is not None or filters.get('query'):
+            # full-text matches and numeric ages are not expressible in SPARQL
+            return self.__list_indexed(facet, filters, non_specific,
+                                       index or self.library.facet_index())
+
+        values = [row[0] for row in self.__query('values', filters, facet)]
+
+        if non_specific and self.__query('missing', filters, facet).askAnswer:
+            values.insert(0, NON_SPECIFIC)
+
+        return values
+
+    def __list_indexed(self, facet, filters, non_specific=False, index=None):
+        index = index or self.library.index
+        materials = self.__matched(index, filters)[0] if filters is not None else None
+
+        return index.values(facet, materials, non_specific=non_specific)
+
+    def __facets(self, filters, limit, cursor):
+        names = ('topic', 'language', 'concept', 'edu_level')
+
+        if self.library.shards is not None:
+            index = materials = None
+            counts = self.library.shards.counts(self.__key_filters(filters), names)
+            ages = self.library.shards.ages()
+        else:
+            index = self.library.facet_index()
+            materials, scores = self.__matched(index, filters)
+            counts = index.counts(materials, names)
+            ages = index.value_counts('age')
+
+        return {
+            "ages": ages,
+            "topics": self.__counted(counts['topic'], False),
+            "languages": self.__counted(counts['language'], True),
+            "concepts": self.__counted(counts['concept'], True),
+            "educations": self.__counted(counts['edu_level'], True),
+            "results": list(self.__page(filters, None, None, index, materials))
+            if limit is None and cursor is None
+            else self.__page(filters, limit, cursor, index, materials).materialized(),
+        }
+
+    def __counted(self, counter, non_specific):
+        values = [(value, counter[value])
+                  for value in sorted(value for value in counter if value != NON_SPECIFIC)]
+
+        if non_specific and counter[NON_SPECIFIC]:
+            values.insert(0, (NON_SPECIFIC, counter[NON_SPECIFIC]))
+
+        return values
 
     def prompt_for_user_profile(self):
         self.user_data = {}
@@ -181,22 +517,9 @@ class KnowledgeApi:
     def get_learning_path_by_criteria(self):
         node, course, title = self.user_data['edu_material']
 
-        qRes = self.library.graph.query(
-            """
-            SELECT DISTINCT ?material ?title
-            WHERE {
-                ?m oer:coursePrerequisites* ?material .
-                ?material rdfs:label ?title .
-            }
-            ORDER BY ?material
-            """, initBindings={'m': node}
-        )
-
-        course_materials_to_learn = []
-        for row in qRes:
-            if row[0] in self.user_data['already_known']:
-                continue
-            course_materials_to_learn.append(row[0] + " " + row[1])
+        course_materials_to_learn = [
+            row[0] + " " + row[2]
+            for row in self.learning_path(node, self.user_data['already_known'])]
 
         print("Learning path is as follows:")
         for material in course_materials_to_learn:
@@ -218,200 +541,148 @@ class KnowledgeApi:
     def set_education(self, education):
         self.user_data['edu_level'] = education
 
-    def search(self):
-        """Search for learning materials based on the user data. Edit user data in order to search no precise."""
+    def set_query(self, query):
+        self.user_data['query'] = query
 
-        query = self.__build_query()
+    @timed('search')
+    def search(self, limit: int = None, cursor: str = None, filters: SearchFilters = None):
+        """Search for learning materials based on the user data, or on filters
+        when given. Edit user data in order to search no precise.
 
-        result_set = self.library.graph.query(
-            """
-            SELECT DISTINCT ?m ?course ?title
-            WHERE {
-                """ + ''.join(query) + """
-                ?m rdfs:label ?title .
-                ?m oer:forCourse ?course .
-            }
-            ORDER BY ?m
-            """
-        )
+        Results are ordered by material id, or by rank when a full-text query
+        is set. With limit or cursor a ResultPage of at most limit materials
+        after the cursor is returned instead of a list."""
+        filters = self.__filters(filters)
+        key = self.__key(filters)
 
-        return result_set
+        if limit is None and cursor is None:
+            return list(self.__cached(('search', key), lambda: self.__search(filters)))
 
-    def search_deps(self, node: str = None):
+        if limit is None:
+            return self.__page(filters, limit, cursor)
 
-        if not node:
-            return []
+        return self.__cached(('page', key, limit, cursor),
+                             lambda: self.__page(filters, limit, cursor).materialized())
 
-        result_set = self.library.graph.query(
-            """
-            SELECT DISTINCT ?material ?course ?title
-            WHERE {
-                ?m oer:coursePrerequisites* ?material .
-                ?material rdfs:label ?title .
-                ?material oer:forCourse ?course .
-            }
-            ORDER BY ?material
-            """, initBindings={'m': BNode(node.strip())}
-        )
+    @timed('facets', lambda result: rows(result["results"]))
+    def facets(self, limit: int = None, cursor: str = None, filters: SearchFilters = None):
+        """Compute every facet listing together with per-value match counts,
+        plus the search results, in one pass over the matching materials.
 
-        return result_set
+        Returns a dict with "ages", "topics", "languages", "concepts" and
+        "educations" as lists of (value, count) pairs, in the same order
+        and filtered the same way as the list_* methods, and "results" as
+        returned by search with the same limit and cursor.
+        """
+        filters = self.__filters(filters)
 
-    def list_ages(self):
-        available_ages = self.library.graph.query(
-            """
-            SELECT DISTINCT ?age
-            WHERE {
-                ?m sdo:typicalAgeRange ?age
-            }
-            ORDER BY ?age
-            """
-        )
+        if limit is None and cursor is not None:
+            return self.__facets(filters, limit, cursor)
+
+        return self.__copied(self.__cached(('facets', self.__key(filters), limit, cursor),
+                                           lambda: self.__facets(filters, limit, cursor)))
 
-        ages = []
+    @staticmethod
+    def __copied(facets):
+        """Copy of cached facets which callers may change. Only the lists need
+        copying, their (value, count) pairs and rows are immutable tuples.
+        """
+        return {name: list(value) if isinstance(value, list) else value
+                for name, value in facets.items()}
 
-        for row in available_ages:
-            ages.append(row[0])
+    @timed('search_deps')
+    def search_deps(self, node: str = None):
 
-        return ages
+        if not node:
+            return []
 
-    def list_topics(self, filter: bool = True):
+        node = BNode(node.strip())
 
-        if filter:
-            query = self.__build_query()
+        if self.library.prerequisites is not None:
+            compute = lambda: self.__indexed_deps(node)
         else:
-            query = []
+            compute = lambda: list(self.__query('deps', m=node))
+
+        return list(self.__cached(('deps', node), compute))
+
+    @timed('search_deps_bulk', lambda result: sum(map(len, result.values())))
+    def search_deps_bulk(self, nodes):
+        """Return a node -> prerequisite rows map for many materials at once
+        """
+        if self.library.prerequisites is None:
+            return {node.strip(): self.search_deps(node) for node in nodes}
+
+        nodes = [BNode(node.strip()) for node in nodes]
+        closures = self.library.prerequisites.closures(nodes)
+
+        if self.library.shards is not None:
+            # one request to the shards for the materials of every closure
+            grouped = self.__grouped(set().union(*closures.values()))
+
+            return {str(node): [row for material in sorted(closure, key=str) for row in grouped.get(material, ())]
+                    for node, closure in closures.items()}
+
+        return {str(node): self.library.index.rows(closure) for node, closure in closures.items()}
+
+    @timed('learning_path')
+    def learning_path(self, node, known=()):
+        """Return (material, course, title) rows to learn for node, prerequisites
+        first, leaving out the known materials and everything they require
+        """
+        return self.learning_paths([(node, known)])[0]
+
+    @timed('learning_paths', lambda result: sum(map(len, result)))
+    def learning_paths(self, profiles):
+        """Return the learning path rows of many (node, known) profiles at
+        once, in input order, e.g. for a whole class of students
+        """
+        profiles = [(node.strip(), [item.strip() for item in known or ()])
+                    for node, known in profiles]
+        paths = self.library.planner().plans(profiles)
+        grouped = self.__grouped(set().union(*paths))
+
+        return [[row for material in path for row in grouped.get(material, ())]
+                for path in paths]
+
+    @timed('recommend', lambda result: len(result["similar"]) + len(result["next"]))
+    def recommend(self, node: str = None, limit: int = 5):
+        """Recommend what to learn after node: "similar" rows of the materials
+        closest to it by concepts, keywords, topics and languages, most
+        similar first, and "next" rows of the materials whose prerequisites
+        are all covered once node is learned. Recommendations are computed
+        for all materials at once when first asked for after the graph
+        changes, so each call is a lookup.
+        """
+        if not node:
+            return {"similar": [], "next": []}
 
-        available_topics = self.library.graph.query(
-            """
-            SELECT DISTINCT ?topic
-            WHERE {
-                """ + ''.join(query) + """
-                ?m oer:forTopic ?topic
-            }
-            ORDER BY ?topic
-            """
-        )
+        node = BNode(node.strip())
+        recommender = self.library.recommender()
+        similar = [material for material, score in recommender.similar(node, limit)]
+        unlocked = recommender.unlocked(node)[:limit]
+        grouped = self.__grouped({*similar, *unlocked})
 
-        topics = []
+        return {
+            "similar": [row for material in similar for row in grouped.get(material, ())],
+            "next": [row for material in unlocked for row in grouped.get(material, ())],
+        }
 
-        for row in available_topics:
-            topics.append(row[0])
+    @timed('list_ages')
+    def list_ages(self):
+        return self.__list('age', None)
 
-        return topics
+    @timed('list_topics')
+    def list_topics(self, filter: bool = True, filters: SearchFilters = None):
+        return self.__list('topic', self.__filters(filters) if filter else None)
 
-    def list_languages(self, filter: bool = True):
+    @timed('list_languages')
+    def list_languages(self, filter: bool = True, filters: SearchFilters = None):
+        return self.__list('language', self.__filters(filters) if filter else None, non_specific=True)
 
-        if filter:
-            query = self.__build_query()
-        else:
-            query = []
-
-        available_languages = self.library.graph.query(
-            """
-            SELECT DISTINCT ?language
-            WHERE {
-                """ + ''.join(query) + """
-                ?m sdo:inLanguage ?language .
-            }
-            ORDER BY ?language
-            """
-        )
-
-        languages = []
-
-        entries_without_language = self.library.graph.query(
-            """
-            SELECT DISTINCT ?language
-            WHERE {
-                """ + ''.join(query) + """
-                FILTER NOT EXISTS {?m sdo:inLanguage ?language} .
-            }
-            ORDER BY ?language
-            """
-        )
-
-        if len(entries_without_language) > 0:
-            languages = ['Non-specific']
-
-        for row in available_languages:
-            languages.append(row[0])
-
-        return languages
-
-    def list_concepts(self, filter: bool = True):
-
-        if filter:
-            query = self.__build_query()
-        else:
-            query = []
-
-        available_concepts = self.library.graph.query(
-            """
-            SELECT DISTINCT ?concept
-            WHERE {
-                """ + ''.join(query) + """
-                ?m sdo:teaches ?concept .
-            }
-            ORDER BY ?concept
-            """
-        )
-
-        concepts = []
-
-        entries_without_concepts = self.library.graph.query(
-            """
-            SELECT DISTINCT ?concept
-            WHERE {
-                """ + ''.join(query) + """
-                FILTER NOT EXISTS {?m sdo:teaches ?concept} .
-            }
-            ORDER BY ?concept
-            """
-        )
-
-        if len(entries_without_concepts) > 0:
-            concepts = ['Non-specific']
-
-        for row in available_concepts:
-            concepts.append(row[0])
-
-        return concepts
-
-    def list_educations(self, filter: bool = True):
-
-        if filter:
-            query = self.__build_query()
-        else:
-            query = []
-
-        available_levels = self.library.graph.query(
-            """
-            SELECT DISTINCT ?edu_level
-            WHERE {
-                """ + ''.join(query) + """
-                ?m sdo:educationalLevel ?edu_level .
-            }
-            ORDER BY ?edu_level
-            """
-        )
-
-        edu_levels = []
-
-        entries_without_edu_levels = self.library.graph.query(
-            """
-            SELECT DISTINCT ?edu_level
-            WHERE {
-                """ + ''.join(query) + """
-                FILTER NOT EXISTS {?m sdo:educationalLevel ?edu_level} .
-            }
-            ORDER BY ?edu_level
-            """
-        )
-
-        if len(entries_without_edu_levels) > 0:
-            edu_levels = ['Non-specific']
-
-        for row in available_levels:
-            edu_levels.append(row[0])
-
-        return edu_levels
+    @timed('list_concepts')
+    def list_concepts(self, filter: bool = True, filters: SearchFilters = None):
+        return self.__list('concept', self.__filters(filters) if filter else None, non_specific=True)
+
+    @timed('list_educations')
+    def list_educations(self, filter: bool = True, filters: SearchFilters = None):
+        return self.__list('edu_level', self.__filters(filters) if filter else None, non_specific=True)
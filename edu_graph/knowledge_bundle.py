@@ -0,0 +1,106 @@
+import base64
+import json
+import os
+
+from .knowledge_index import FACETS, NON_SPECIFIC, age_range
+
+# Format of the bundle, changed whenever its layout does
+VERSION = 1
+
+# Recommendations kept per material
+RECOMMENDATIONS = 5
+
+
+def encode(positions, count):
+    """Encode a set of material positions as whichever is smaller: a
+    base64 bitmap (bit i of byte i // 8 set for position i) or the sorted
+    list of positions
+    """
+    positions = sorted(positions)
+
+    if len(positions) * 4 < (count + 7) // 8:
+        return positions
+
+    bits = bytearray((count + 7) // 8)
+
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def build(library):
+    """Compile the catalog into a columnar facet bundle for clients filtering
+    on their own.
+
+    Materials are numbered in the order of their ids, which is the order
+    of search results. The bundle holds the rows of every material, per
+    facet the sorted values with the set of materials having each one and
+    the set of materials without any value, the parsed range of every age,
+    the direct prerequisites of every material and its recommendations,
+    see encode for how sets are stored.
+    """
+    if library.shards is not None:
+        raise ValueError("Bundles are built from a single catalog, not from shards")
+
+    index = library.facet_index()
+    prerequisites = library.prerequisite_index()
+    recommender = library.recommender()
+
+    materials = sorted(index.match({}), key=str)
+    position = {material: i for i, material in enumerate(materials)}
+    count = len(materials)
+
+    facets = {}
+
+    for name in FACETS:
+        values = index.values(name)
+
+        facets[name] = {
+            "values": [str(value) for value in values],
+            "sets": [encode((position[material] for material in index.match({name: value})), count)
+                     for value in values],
+            "missing": encode((position[material] for material in index.match({name: NON_SPECIFIC})), count),
+        }
+
+    ages = []
+
+    for value in facets['age']["values"]:
+        interval = age_range(value)
+        ages.append(None if interval is None else
+                    [interval[0], None if interval[1] == float('inf') else interval[1]])
+
+    def positions(nodes):
+        return sorted(position[node] for node in nodes if node in position)
+
+    return {
+        "version": VERSION,
+        "materials": [str(material) for material in materials],
+        "rows": [[[str(course), str(title)] for material, course, title in index.rows([material])]
+                 for material in materials],
+        "facets": facets,
+        "ages": ages,
+        "requires": [positions(prerequisites.requires.get(material, ())) for material in materials],
+        "similar": [[position[other] for other, score in recommender.similar(material, RECOMMENDATIONS)]
+                    for material in materials],
+        "next": [[position[other] for other in recommender.unlocked(material)[:RECOMMENDATIONS]]
+                 for material in materials],
+    }
+
+
+def write(library, filename):
+    """Build the bundle of the library and write it as JSON, replacing
+    filename only once it is complete. Returns the bundle.
+    """
+    bundle = build(library)
+    temporary = f'{filename}.{os.getpid()}.tmp'
+
+    try:
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(bundle, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporary, filename)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return bundle
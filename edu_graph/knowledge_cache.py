@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+# Results kept per library
+CACHE_SIZE = 1024
+
+
+class ResultCache:
+    """Thread-safe LRU cache of query results for one library version.
+
+    Entries are computed for the version of the library they were asked
+    for. Asking for another version drops everything cached so far, so a
+    library only has to bump its version when its graph changes.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, version, key, compute):
+        """Return the cached result for key, computing and storing it on a miss
+        """
+        with self.__lock:
+            if version != self.version:
+                self.__entries.clear()
+                self.version = version
+
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return self.__entries[key]
+
+            self.misses += 1
+
+        value = compute()
+
+        with self.__lock:
+            if version == self.version:
+                self.__entries[key] = value
+
+                if len(self.__entries) > self.size:
+                    self.__entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        """Return hits, misses, entries and the version cached for
+        """
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.__entries),
+                "version": self.version,
+            }
@@ -0,0 +1,668 @@
+import json
+import math
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections import Counter
+
+from .knowledge_index import FACETS, NON_SPECIFIC, age_range
+from .knowledge_recommend import TOP_K
+from .knowledge_snapshot import decode_term, encode_term
+from .knowledge_text import tokens
+
+MAGIC = b'EDUCMPCT'
+VERSION = 2
+SUFFIX = '.compact'
+
+# magic, version, source checksum, length of the JSON table of contents
+HEADER = struct.Struct('<8sH32sI')
+
+# Arrays start at multiples of this many bytes, so they can be viewed in place
+ALIGN = 8
+
+
+def compact_path(filename):
+    return filename + SUFFIX
+
+
+def term_key(kind, value, extra):
+    """Bytes a term is hashed and compared by in the term table
+    """
+    return b'%d\0%s\0%s' % (kind, value, extra)
+
+
+def __strings(values):
+    """Concatenated UTF-8 strings and the offsets of each of them
+    """
+    offsets = array('Q', [0])
+    blob = bytearray()
+
+    for value in values:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+
+    return offsets, array('B', blob)
+
+
+def __csr(groups, typecode='I'):
+    """Offsets and flat values of a list of lists
+    """
+    offsets = array('Q', [0])
+    values = array(typecode)
+
+    for group in groups:
+        values.extend(group)
+        offsets.append(len(values))
+
+    return offsets, values
+
+
+def __array(typecode, values):
+    """Copy a numpy array into an array of the given type
+    """
+    return array(typecode, values.astype(typecode).tobytes())
+
+
+def write(library, filename, source_checksum=bytes(32)):
+    """Write the indexes of a loaded library as a compact file.
+
+    Every term is stored once in a term table sorted by its string, so
+    term ids order materials as their ids do, with an open addressing hash
+    table (crc32) to find the id of a term. Rows, facet values,
+    prerequisites and full-text postings are flat arrays of term ids or
+    material positions with offsets per entry, and so are the similar and
+    next materials of the library recommender, computed here once for all
+    readers. The file is written next to
+    its final name and renamed over it, so readers never see half of it.
+    """
+    index, prerequisites, text = library.index, library.prerequisites, library.text
+
+    terms = set(index.materials)
+    for rows in index.materials.values():
+        for course, title in rows:
+            terms.update((course, title))
+    for name in FACETS:
+        terms.update(index.facets[name])
+    for node, deps in prerequisites.requires.items():
+        terms.add(node)
+        terms.update(deps)
+    terms.update(text.terms_of)
+
+    encoded = sorted({encode_term(term) for term in terms},
+                     key=lambda item: (item[1], item[0], item[2]))
+    ids = {item: term_id for term_id, item in enumerate(encoded)}
+    term_id = lambda term: ids[encode_term(term)]
+
+    arrays = {}
+    arrays['terms.kinds'] = array('B', (item[0] for item in encoded))
+    arrays['terms.offsets'], arrays['terms.values'] = __strings(item[1] for item in encoded)
+    arrays['terms.extra_offsets'], arrays['terms.extras'] = __strings(item[2] for item in encoded)
+
+    size = 1 << max(4, (2 * len(encoded)).bit_length())
+    table = array('I', bytes(4 * size))
+    for item, number in ids.items():
+        slot = zlib.crc32(term_key(item[0], item[1].encode('utf-8'),
+                                   item[2].encode('utf-8'))) & (size - 1)
+        while table[slot]:
+            slot = (slot + 1) & (size - 1)
+        table[slot] = number + 1
+    arrays['terms.hash'] = table
+
+    materials = sorted(index.materials, key=term_id)
+    position = {material: i for i, material in enumerate(materials)}
+    arrays['materials'] = array('I', map(term_id, materials))
+
+    rows = [sorted(index.materials[material]) for material in materials]
+    arrays['rows.offsets'], arrays['rows.courses'] = __csr(
+        [term_id(course) for course, title in group] for group in rows)
+    arrays['rows.titles'] = array('I', (term_id(title) for group in rows for course, title in group))
+
+    for name in FACETS:
+        values = sorted(index.facets[name])
+        value_position = {value: i for i, value in enumerate(values)}
+
+        arrays[f'{name}.values'] = array('I', map(term_id, values))
+        arrays[f'{name}.offsets'], arrays[f'{name}.materials'] = __csr(
+            sorted(position[material] for material in index.facets[name][value]) for value in values)
+        arrays[f'{name}.of_offsets'], arrays[f'{name}.of'] = __csr(
+            sorted(value_position[value] for value in index.values_of[name].get(material, ()))
+            for material in materials)
+        arrays[f'{name}.missing'] = array('I', sorted(position[material] for material in index.missing[name]))
+
+    nodes = sorted(prerequisites.requires, key=term_id)
+    arrays['deps.nodes'] = array('I', map(term_id, nodes))
+    arrays['deps.offsets'], arrays['deps.targets'] = __csr(
+        sorted(map(term_id, prerequisites.requires[node])) for node in nodes)
+
+    words = sorted(text.postings)
+    arrays['text.offsets'], arrays['text.words'] = __strings(words)
+    postings = [sorted((term_id(material), weight) for material, weight in text.postings[word].items())
+                for word in words]
+    arrays['postings.offsets'], arrays['postings.materials'] = __csr(
+        [material for material, weight in posting] for posting in postings)
+    arrays['postings.weights'] = array('d', (weight for posting in postings for material, weight in posting))
+
+    # the recommender orders materials by id as well, so positions are the same
+    recommender = library.recommender()
+    arrays['similar.offsets'] = __array('Q', recommender.offsets)
+    arrays['similar.targets'] = __array('I', recommender.targets)
+    arrays['similar.scores'] = __array('f', recommender.scores)
+    arrays['next.offsets'] = __array('Q', recommender.next_offsets)
+    arrays['next.targets'] = __array('I', recommender.next_targets)
+
+    contents = {'arrays': {}, 'documents': len(text.terms_of)}
+    offset = 0
+    for name, values in arrays.items():
+        offset += -offset % ALIGN
+        contents['arrays'][name] = [values.typecode, offset, len(values)]
+        offset += len(values) * values.itemsize
+
+    header = json.dumps(contents).encode('utf-8')
+    start = HEADER.size + len(header)
+    start += -start % ALIGN
+
+    temporary = f'{filename}.{os.getpid()}.tmp'
+
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, source_checksum, len(header)))
+            file.write(header)
+
+            for name, values in arrays.items():
+                file.write(bytes(start + contents['arrays'][name][1] - file.tell()))
+                values.tofile(file)
+
+        os.replace(temporary, filename)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def read(filename, source_checksum=None):
+    """Map a compact file, None when it is missing, of another version or
+    was made from another source than the given checksum
+    """
+    try:
+        graph = CompactGraph(filename)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if source_checksum is not None and graph.checksum != source_checksum:
+        return None
+
+    return graph
+
+
+class CompactGraph:
+    """Read-only, memory-mapped view of a compact file.
+
+    The arrays are numpy views straight into the mapping, so nothing is
+    copied on load and all processes mapping the same file share its pages.
+    Terms are decoded only when they are returned.
+    """
+
+    def __init__(self, filename):
+        import numpy as np
+
+        with open(filename, 'rb') as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.checksum, length = HEADER.unpack_from(self.__map)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{filename} is not a compact graph')
+
+        contents = json.loads(self.__map[HEADER.size:HEADER.size + length])
+        start = HEADER.size + length
+        start += -start % ALIGN
+
+        self.documents = contents['documents']
+        self.arrays = {name: np.frombuffer(self.__map, dtype=typecode, count=count, offset=start + offset)
+                       for name, (typecode, offset, count) in contents['arrays'].items()}
+        self.__starts = {name: start + offset for name, (typecode, offset, count) in contents['arrays'].items()}
+
+        self.__kinds = self.arrays['terms.kinds']
+        self.__hash = self.arrays['terms.hash']
+
+    def string(self, name, number):
+        """Raw bytes of string number of a string table
+        """
+        offsets = self.arrays[f'{name}.offsets']
+        start = self.__starts[{'terms': 'terms.values', 'text': 'text.words'}[name]]
+
+        return self.__map[start + int(offsets[number]):start + int(offsets[number + 1])]
+
+    def __extra(self, number):
+        offsets = self.arrays['terms.extra_offsets']
+        start = self.__starts['terms.extras']
+
+        return self.__map[start + int(offsets[number]):start + int(offsets[number + 1])]
+
+    def term(self, number):
+        """Decode the term with the given id
+        """
+        return decode_term(int(self.__kinds[number]), self.string('terms', number).decode('utf-8'),
+                           self.__extra(number).decode('utf-8'))
+
+    def find(self, term):
+        """Id of a term, None when the file does not have it
+        """
+        kind, value, extra = encode_term(term)
+        value, extra = value.encode('utf-8'), extra.encode('utf-8')
+        mask = len(self.__hash) - 1
+        slot = zlib.crc32(term_key(kind, value, extra)) & mask
+
+        while True:
+            number = int(self.__hash[slot])
+
+            if not number:
+                return None
+
+            number -= 1
+            if (self.__kinds[number] == kind and self.string('terms', number) == value
+                    and self.__extra(number) == extra):
+                return number
+
+            slot = (slot + 1) & mask
+
+    def position(self, material):
+        """Position of a material in the materials array, None for other nodes
+        """
+        number = self.find(material)
+
+        if number is None:
+            return None
+
+        materials = self.arrays['materials']
+        position = int(materials.searchsorted(number))
+
+        if position < len(materials) and materials[position] == number:
+            return position
+
+        return None
+
+
+class CompactIndex:
+    """KnowledgeIndex over a CompactGraph, answering the same methods from
+    the mapped arrays. Only the distinct values of the facets are decoded
+    when opened, materials are decoded the first time they are returned
+    and remembered with their position.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.__arrays = graph.arrays
+        self.__materials = graph.arrays['materials']
+        self.__values = {name: [graph.term(int(number)) for number in graph.arrays[f'{name}.values']]
+                         for name in FACETS}
+        self.__value_positions = {name: {value: i for i, value in enumerate(values)}
+                                  for name, values in self.__values.items()}
+        self.__ages = None
+        self.__decoded = {}
+        self.__found = {}
+
+    def __nodes(self, positions):
+        result = []
+
+        for position in range(len(self.__materials))[positions] if isinstance(positions, slice) \
+                else positions.tolist():
+            material = self.__decoded.get(position)
+
+            if material is None:
+                material = self.__decoded[position] = self.graph.term(int(self.__materials[position]))
+                self.__found[material] = position
+
+            result.append(material)
+
+        return result
+
+    def __position(self, material):
+        position = self.__found.get(material)
+
+        if position is not None:
+            return position
+
+        return self.graph.position(material)
+
+    def __positions(self, materials):
+        """Sorted positions of the given materials, skipping other nodes
+        """
+        import numpy as np
+
+        found = (self.__position(material) for material in materials)
+
+        return np.array(sorted(position for position in found if position is not None), dtype='I')
+
+    def __bucket(self, name, value_position):
+        offsets = self.__arrays[f'{name}.offsets']
+
+        return self.__arrays[f'{name}.materials'][offsets[value_position]:offsets[value_position + 1]]
+
+    def __intervals(self):
+        if self.__ages is None:
+            self.__ages = [(*interval, i) for i, interval in
+                           ((i, age_range(value)) for i, value in enumerate(self.__values['age']))
+                           if interval is not None]
+
+        return self.__ages
+
+    def __age_positions(self, low, high):
+        import numpy as np
+
+        buckets = [self.__bucket('age', i) for start, end, i in self.__intervals()
+                   if start <= high and end >= low]
+
+        return np.unique(np.concatenate(buckets)) if buckets else np.array([], dtype='I')
+
+    def __lookup(self, name, value):
+        import numpy as np
+
+        if value == NON_SPECIFIC:
+            return self.__arrays[f'{name}.missing']
+
+        from rdflib import Literal
+
+        found = self.__value_positions[name].get(Literal(value))
+
+        if found is not None:
+            return self.__bucket(name, found)
+
+        if name == 'age':
+            interval = age_range(value)
+            if interval is not None:
+                return self.__age_positions(*interval)
+
+        return np.array([], dtype='I')
+
+    def ages(self, low, high=None):
+        """Return the materials whose age range contains the age low, or
+        overlaps the range low-high when given
+        """
+        return set(self.__nodes(self.__age_positions(low, low if high is None else high)))
+
+    def match(self, user_data):
+        """Return the set of materials matching every filter set in the
+        user data, as KnowledgeIndex.match does
+        """
+        import numpy as np
+
+        arrays = [self.__lookup(name, user_data[name])
+                  for name in FACETS if user_data.get(name)]
+
+        if not arrays:
+            return set(self.__nodes(slice(None)))
+
+        arrays.sort(key=len)
+        result = arrays[0]
+
+        for other in arrays[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+
+        return set(self.__nodes(result))
+
+    def __rows(self, position):
+        offsets = self.__arrays['rows.offsets']
+        start, end = int(offsets[position]), int(offsets[position + 1])
+        courses = self.__arrays['rows.courses'][start:end]
+        titles = self.__arrays['rows.titles'][start:end]
+
+        return [(self.graph.term(int(course)), self.graph.term(int(title)))
+                for course, title in zip(courses, titles)]
+
+    def rows(self, materials, ordered=False):
+        """Return (material, course, title) rows ordered by material, or in
+        the given order when ordered, skipping nodes which are not learning
+        materials (e.g. courses)
+        """
+        if ordered:
+            return list(self.iter_rows(materials))
+
+        return [(material,) + row for position, material in
+                zip(*self.__sorted(materials)) for row in self.__rows(position)]
+
+    def __sorted(self, materials):
+        positions = self.__positions(materials)
+
+        return positions, self.__nodes(positions)
+
+    def iter_rows(self, materials):
+        """Lazily yield the rows of the materials in the given order
+        """
+        for material in materials:
+            position = self.__position(material)
+
+            if position is not None:
+                for row in self.__rows(position):
+                    yield (material,) + row
+
+    def total(self, materials):
+        """Number of rows the materials make up, without building them
+        """
+        offsets = self.__arrays['rows.offsets']
+        positions = self.__positions(materials)
+
+        return int((offsets[positions + 1] - offsets[positions]).sum())
+
+    def __gather(self, name, positions):
+        """Value positions of all the materials at once, and how many
+        values each of them has
+        """
+        import numpy as np
+
+        offsets = self.__arrays[f'{name}.of_offsets']
+        starts = offsets[positions].astype('q')
+        lengths = offsets[positions + 1].astype('q') - starts
+        total = int(lengths.sum())
+
+        # flat indexes of every value, starts[i] .. starts[i] + lengths[i] - 1
+        ends = np.cumsum(lengths)
+        flat = np.arange(total) - np.repeat(ends - lengths, lengths) + np.repeat(starts, lengths)
+
+        return self.__arrays[f'{name}.of'][flat], lengths
+
+    def values(self, name, materials=None, non_specific=False):
+        """List the distinct values of a facet among the given materials
+        (all materials when omitted), optionally prefixed by "Non-specific"
+        when some of them have no value at all.
+        """
+        import numpy as np
+
+        if materials is None:
+            result = list(self.__values[name])
+            missing = len(self.__arrays[f'{name}.missing'])
+        else:
+            values, lengths = self.__gather(name, self.__positions(materials))
+            result = [self.__values[name][i] for i in np.unique(values).tolist()]
+            missing = bool((lengths == 0).any())
+
+        if non_specific and missing:
+            result.insert(0, NON_SPECIFIC)
+
+        return result
+
+    def counts(self, materials, names=FACETS):
+        """Count, in a single pass over the materials, how many of them have
+        each value of the given facets, as KnowledgeIndex.counts does
+        """
+        import numpy as np
+
+        positions = self.__positions(materials)
+        counts = {}
+
+        for name in names:
+            values, lengths = self.__gather(name, positions)
+            found = np.bincount(values, minlength=len(self.__values[name]))
+            counter = Counter({self.__values[name][i]: int(found[i]) for i in np.flatnonzero(found).tolist()})
+            missing = int((lengths == 0).sum())
+
+            if missing:
+                counter[NON_SPECIFIC] = missing
+
+            counts[name] = counter
+
+        return counts
+
+    def value_counts(self, name):
+        """(value, number of materials) pairs of all values of a facet
+        """
+        offsets = self.__arrays[f'{name}.offsets']
+
+        return [(value, int(offsets[i + 1] - offsets[i])) for i, value in enumerate(self.__values[name])]
+
+
+class CompactPrerequisites:
+    """PrerequisiteIndex over a CompactGraph. Closures walk the mapped
+    adjacency arrays, requires is only built when asked for (by the
+    learning path planner).
+    """
+
+    version = 0
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.__nodes = graph.arrays['deps.nodes']
+        self.__offsets = graph.arrays['deps.offsets']
+        self.__targets = graph.arrays['deps.targets']
+        self.__requires = None
+
+    def __deps(self, number):
+        position = int(self.__nodes.searchsorted(number))
+
+        if position < len(self.__nodes) and self.__nodes[position] == number:
+            return self.__targets[self.__offsets[position]:self.__offsets[position + 1]].tolist()
+
+        return ()
+
+    def closure(self, node):
+        """Return the node together with all of its direct and indirect prerequisites
+        """
+        number = self.graph.find(node)
+
+        if number is None:
+            return frozenset((node,))
+
+        seen = {number}
+        stack = [number]
+
+        while stack:
+            for dep in self.__deps(stack.pop()):
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+
+        return frozenset(self.graph.term(number) for number in seen)
+
+    def closures(self, nodes):
+        return {node: self.closure(node) for node in nodes}
+
+    @property
+    def requires(self):
+        """material -> prerequisites map, built on first use
+        """
+        if self.__requires is None:
+            self.__requires = {
+                self.graph.term(int(node)): {self.graph.term(dep) for dep in self.__deps(int(node))}
+                for node in self.__nodes}
+
+        return self.__requires
+
+
+class CompactText:
+    """TextIndex over a CompactGraph, ranking the same way from the mapped postings
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.__count = len(graph.arrays['text.offsets']) - 1
+
+    def __find(self, word):
+        word = word.encode('utf-8')
+        low, high = 0, self.__count
+
+        while low < high:
+            middle = (low + high) // 2
+            if self.graph.string('text', middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.__count and self.graph.string('text', low) == word:
+            return low
+
+        return None
+
+    def __posting(self, number):
+        arrays = self.graph.arrays
+        start, end = arrays['postings.offsets'][number:number + 2]
+
+        return arrays['postings.materials'][start:end], arrays['postings.weights'][start:end]
+
+    def search(self, query):
+        """Return material -> score for the materials matching every term
+        of the query, or None when the query has no terms at all
+        """
+        import numpy as np
+
+        terms = sorted(set(tokens(query or '')))
+
+        if not terms:
+            return None
+
+        found = [self.__find(term) for term in terms]
+
+        if None in found:
+            return {}
+
+        postings = sorted((self.__posting(number) for number in found), key=lambda posting: len(posting[0]))
+        idf = lambda posting: math.log(1 + self.graph.documents / len(posting[0]))
+
+        materials, weights = postings[0]
+        scores = weights * idf(postings[0])
+
+        for posting in postings[1:]:
+            materials, mine, theirs = np.intersect1d(materials, posting[0], assume_unique=True,
+                                                     return_indices=True)
+            scores = scores[mine] + posting[1][theirs] * idf(posting)
+
+        return {self.graph.term(int(material)): float(score) for material, score in zip(materials, scores)}
+
+
+class CompactRecommender:
+    """Recommender over a CompactGraph, reading the recommendations computed
+    when the file was written
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.__materials = graph.arrays['materials']
+
+    def __targets(self, name, material, limit=None):
+        position = self.graph.position(material)
+
+        if position is None:
+            return [], slice(0)
+
+        offsets = self.graph.arrays[f'{name}.offsets']
+        start, end = int(offsets[position]), int(offsets[position + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+
+        targets = self.graph.arrays[f'{name}.targets'][start:end].tolist()
+
+        return [self.graph.term(int(self.__materials[target])) for target in targets], slice(start, end)
+
+    def similar(self, material, limit=TOP_K):
+        """(material, score) pairs of the materials most similar to material
+        """
+        materials, found = self.__targets('similar', material, limit)
+
+        return list(zip(materials, self.graph.arrays['similar.scores'][found].tolist()))
+
+    def unlocked(self, material):
+        """Materials whose prerequisites are satisfied once material is learned
+        """
+        return self.__targets('next', material)[0]
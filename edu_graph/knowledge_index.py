@@ -0,0 +1,335 @@
+import re
+from bisect import bisect_right
+from collections import Counter
+
+from rdflib import Literal
+from rdflib.namespace import RDFS, SDO
+
+from .namespace import OER
+
+NON_SPECIFIC = 'Non-specific'
+
+FACETS = {
+    'age': SDO.typicalAgeRange,
+    'topic': OER.forTopic,
+    'language': SDO.inLanguage,
+    'concept': SDO.teaches,
+    'edu_level': SDO.educationalLevel,
+}
+
+# Age ranges like 8-10, a single age like 12, or an open range like 18+
+AGE = re.compile(r'^\s*(\d+)\s*(?:(-)\s*(\d+)?|(\+))?\s*$')
+
+
+def age_range(value):
+    """Parse an age or age range into an inclusive (low, high) interval,
+    None when the value is not one
+    """
+    match = AGE.match(str(value))
+
+    if match is None:
+        return None
+
+    low, dash, high, plus = match.groups()
+
+    if high is not None:
+        return (int(low), int(high))
+    if dash or plus:
+        return (int(low), float('inf'))
+
+    return (int(low), int(low))
+
+
+class KnowledgeIndex:
+    """In-memory facet index over the learning materials of a graph.
+
+    For every facet predicate it keeps a value -> materials map plus the
+    set of materials without any value (the "Non-specific" bucket), so
+    filtered searches and facet listings become set intersections instead
+    of SPARQL evaluations over the whole graph.
+    """
+
+    def __init__(self, graph):
+        self.materials = {}
+        self.facets = {name: {} for name in FACETS}
+        self.values_of = {name: {} for name in FACETS}
+        self.missing = {}
+        self.__ages = None
+
+        courses = {}
+        for material, course in graph.subject_objects(OER.forCourse):
+            courses.setdefault(material, []).append(course)
+
+        for material, title in graph.subject_objects(RDFS.label):
+            for course in courses.get(material, ()):
+                self.materials.setdefault(material, []).append((course, title))
+
+        for name, predicate in FACETS.items():
+            for material, value in graph.subject_objects(predicate):
+                if material not in self.materials:
+                    continue
+                self.facets[name].setdefault(value, set()).add(material)
+                self.values_of[name].setdefault(material, []).append(value)
+
+            self.missing[name] = set(self.materials) - \
+                set(self.values_of[name])
+
+    def __add(self, graph, material):
+        courses = list(graph.objects(material, OER.forCourse))
+        titles = list(graph.objects(material, RDFS.label))
+
+        if not courses or not titles:
+            return
+
+        self.materials[material] = [(course, title)
+                                    for title in titles for course in courses]
+
+        for name, predicate in FACETS.items():
+            values = list(graph.objects(material, predicate))
+
+            if not values:
+                self.missing[name].add(material)
+                continue
+
+            self.values_of[name][material] = values
+            for value in values:
+                self.facets[name].setdefault(value, set()).add(material)
+
+    def refresh(self, graph, materials):
+        """Re-read the given materials from the graph, leaving the rest of
+        the index untouched
+        """
+        self.__ages = None
+
+        for material in materials:
+            self.materials.pop(material, None)
+
+            for name in FACETS:
+                self.missing[name].discard(material)
+
+                for value in self.values_of[name].pop(material, ()):
+                    bucket = self.facets[name][value]
+                    bucket.discard(material)
+
+                    if not bucket:
+                        del self.facets[name][value]
+
+            self.__add(graph, material)
+
+    def __lookup(self, name, value):
+        if value == NON_SPECIFIC:
+            return self.missing[name]
+
+        found = self.facets[name].get(Literal(value))
+
+        if found is None and name == 'age':
+            interval = age_range(value)
+            if interval is not None:
+                return self.ages(*interval)
+
+        return found or set()
+
+    def __intervals(self):
+        """Age values parsed into intervals, sorted by their lower bound
+        """
+        if self.__ages is None:
+            intervals = sorted((interval + (value,) for value, interval in
+                                ((value, age_range(value)) for value in self.facets['age'])
+                                if interval is not None), key=lambda item: item[:2])
+            self.__ages = (intervals, [interval[0] for interval in intervals])
+
+        return self.__ages
+
+    def ages(self, low, high=None):
+        """Return the materials whose age range contains the age low, or
+        overlaps the range low-high when given
+        """
+        high = low if high is None else high
+        intervals, starts = self.__intervals()
+        result = set()
+
+        for start, end, value in intervals[:bisect_right(starts, high)]:
+            if end >= low:
+                result |= self.facets['age'][value]
+
+        return result
+
+    def match(self, user_data):
+        """Return the set of materials matching every filter set in the user data.
+        Empty filters are ignored, "Non-specific" matches materials without a value.
+        A stored age range is matched exactly, any other age or range
+        matches every stored range containing (or overlapping) it.
+        """
+        sets = [self.__lookup(name, user_data[name])
+                for name in FACETS if user_data.get(name)]
+
+        if not sets:
+            return set(self.materials)
+
+        sets.sort(key=len)
+        result = set(sets[0])
+
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                break
+
+        return result
+
+    def rows(self, materials, ordered=False):
+        """Return (material, course, title) rows ordered by material, or in
+        the given order when ordered, skipping nodes which are not learning
+        materials (e.g. courses)
+        """
+        return list(self.iter_rows(materials if ordered else sorted(materials, key=str)))
+
+    def iter_rows(self, materials):
+        """Lazily yield the rows of the materials in the given order
+        """
+        for material in materials:
+            for row in sorted(self.materials.get(material, ())):
+                yield (material,) + row
+
+    def total(self, materials):
+        """Number of rows the materials make up, without building them
+        """
+        return sum(len(self.materials.get(material, ())) for material in materials)
+
+    def values(self, name, materials=None, non_specific=False):
+        """List the distinct values of a facet among the given materials
+        (all materials when omitted), optionally prefixed by "Non-specific"
+        when some of them have no value at all.
+        """
+        if materials is None:
+            values = self.facets[name].keys()
+            missing = self.missing[name]
+        else:
+            values_of = self.values_of[name]
+            values = set()
+            for material in materials:
+                values.update(values_of.get(material, ()))
+            missing = self.missing[name] & materials
+
+        result = sorted(values)
+
+        if non_specific and missing:
+            result.insert(0, NON_SPECIFIC)
+
+        return result
+
+    def value_counts(self, name):
+        """(value, number of materials) pairs of all values of a facet
+        """
+        return [(value, len(self.facets[name][value])) for value in self.values(name)]
+
+    def described(self, materials, names=FACETS):
+        """material -> values of each of the given facets, for many materials at once
+        """
+        return {material: [self.values_of[name].get(material, ()) for name in names]
+                for material in materials}
+
+    def counts(self, materials, names=FACETS):
+        """Count, in a single pass over the materials, how many of them have
+        each value of the given facets. Materials without any value are
+        counted under "Non-specific".
+        """
+        counts = {name: Counter() for name in names}
+
+        for material in materials:
+            for name in names:
+                values = self.values_of[name].get(material)
+
+                if values:
+                    counts[name].update(values)
+                else:
+                    counts[name][NON_SPECIFIC] += 1
+
+        return counts
+
+
+class PrerequisiteIndex:
+    """Reachability index over the oer:coursePrerequisites graph.
+
+    The closure of a node is the set of everything reachable from it
+    including the node itself, the same as the SPARQL property path
+    oer:coursePrerequisites*. Closures are cached as frozensets and reused
+    while walking other nodes, so repeated lookups cost as much as the
+    answer. Edges added or removed through the index invalidate only the
+    cached closures of the nodes depending on them. The edges are read from
+    a graph, or given as (material, dep) pairs.
+    """
+
+    def __init__(self, graph=None, edges=()):
+        self.requires = {}
+        self.required_by = {}
+        self.version = 0
+        self.__closures = {}
+
+        if graph is not None:
+            edges = graph.subject_objects(OER.coursePrerequisites)
+
+        for material, dep in edges:
+            self.requires.setdefault(material, set()).add(dep)
+            self.required_by.setdefault(dep, set()).add(material)
+
+    def __walk(self, node):
+        seen = {node}
+        stack = [node]
+
+        while stack:
+            current = stack.pop()
+
+            for dep in self.requires.get(current, ()):
+                if dep in seen:
+                    continue
+
+                known = self.__closures.get(dep)
+                if known is not None:
+                    seen |= known
+                    continue
+
+                seen.add(dep)
+                stack.append(dep)
+
+        return frozenset(seen)
+
+    def __invalidate(self, node):
+        stack = [node]
+        seen = {node}
+
+        while stack:
+            current = stack.pop()
+            self.__closures.pop(current, None)
+
+            for parent in self.required_by.get(current, ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+
+    def closure(self, node):
+        """Return the node together with all of its direct and indirect prerequisites
+        """
+        result = self.__closures.get(node)
+
+        if result is None:
+            result = self.__closures[node] = self.__walk(node)
+
+        return result
+
+    def closures(self, nodes):
+        """Return a node -> closure map for many nodes at once, sharing the
+        work between nodes with common prerequisites.
+        """
+        return {node: self.closure(node) for node in nodes}
+
+    def add(self, material, dep):
+        self.requires.setdefault(material, set()).add(dep)
+        self.required_by.setdefault(dep, set()).add(material)
+        self.version += 1
+        self.__invalidate(material)
+
+    def remove(self, material, dep):
+        self.requires.get(material, set()).discard(dep)
+        self.required_by.get(dep, set()).discard(material)
+        self.version += 1
+        self.__invalidate(material)
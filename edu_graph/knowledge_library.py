@@ -1,174 +1,396 @@
-import pandas as pd
+import gzip
+import threading
+from contextlib import contextmanager
 
-from rdflib import Graph, Literal, Namespace, RDF, BNode
+from rdflib import Graph, Literal, RDF, BNode
 from rdflib.namespace import FOAF, RDFS, SDO
 
-OER = Namespace("http://oerschema.org/")
+from . import knowledge_snapshot
+from .knowledge_cache import ResultCache
+from .knowledge_index import KnowledgeIndex, PrerequisiteIndex
+from .knowledge_text import TextIndex
+from .namespace import OER
+
+BATCH_SIZE = 10000
+
+# Formats read line by line by knowledge_stream instead of rdflib parsers
+LINE_FORMATS = ('nt', 'nt11', 'ntriples', 'nquads')
+
+# Comma separated spreadsheet columns (by position, after the id) and the
+# predicate each of them populates
+VALUE_COLUMNS = (
+    (2, SDO.typicalAgeRange),   # age ranges: 8-10, 10-14, ...
+    (3, OER.forTopic),          # topics: Програмиране, ...
+    (4, SDO.inLanguage),        # programming languages
+    (5, SDO.teaches),           # concepts
+    (6, SDO.keywords),          # tags
+    (7, SDO.educationalLevel),  # educational level: всички, математици, ...
+)
 
 
 class KnowledgeLibrary:
-    def __init__(self):
-        self.graph = Graph()
+    """A graph of learning materials together with its indexes.
+
+    version is bumped whenever the graph changes through the library
+    (load, generate, update and the prerequisite methods) and invalidates
+    the query results kept in cache. Changes made directly on the graph
+    are not tracked and need a call to changed(). The version of a SQLite
+    store is the generation kept in the store, so it also changes when
+    another process changes the store.
+
+    By default the graph lives in memory. With store, the path of a SQLite
+    database or an opened rdflib Store, it is persistent instead and
+    nothing is loaded in memory. Facets of a SQLite store are answered by
+    SQL queries (StoreIndex), other stores are queried through SPARQL.
+    Indexes which cannot be answered from the store (full text, learning
+    paths) are built on first use and kept until the store changes.
+
+    With compact loading the indexes are read from a memory-mapped compact
+    file instead, shared by every process loading the same catalog, and
+    the graph itself stays empty: such a library is read-only.
+
+    With load_shards the library spreads several catalog sources over
+    worker processes instead, and the api fans its queries out to them.
+    """
+
+    def __init__(self, store=None):
+        self.index = None
+
+        if store is None:
+            self.graph = Graph()
+        else:
+            from .knowledge_store import SQLiteStore, StoreIndex
+
+            if isinstance(store, str):
+                store = SQLiteStore(store)
+            if isinstance(store, SQLiteStore):
+                self.index = StoreIndex(store)
+            self.graph = Graph(store=store)
+
+        self.persistent = store is not None
         self.graph.bind("foaf", FOAF)
         self.graph.bind("oer", OER)
         self.graph.bind('sdo', SDO)
+        self.prerequisites = None
+        self.text = None
+        self.shards = None
+        self.__version = 0
+        self.cache = ResultCache()
+        self.__planner = None
+        self.__recommender = None
+        self.__recommender_lock = threading.Lock()
+        self.__kept = {}
 
     def generate(self, filename=None):
-        if (not filename):
+        """Populate the graph from a spreadsheet of learning materials, given
+        as a file name or as an already read pandas DataFrame.
+
+        Columns are processed as a whole (split, explode, range expansion)
+        and the triples are added to the graph in batches, instead of
+        walking the sheet row by row.
+        """
+        if (filename is None or len(filename) == 0):
             return
 
-        df = pd.read_excel(filename, index_col=0)
-        df = df.dropna(how='all')
+        df = self.__readSheet(filename)
 
-        for row in df.itertuples():
-            course = BNode(row.Index.strip().split('.')[0])
-            self.graph.add((course, RDF.type, OER.Course))
+        self.__addN(self.__sheetTriples(df))
+        self.__build_index()
 
-            material = BNode(row.Index)
-            self.graph.add((material, RDF.type, OER.LearningComponent))
-            self.graph.add((material, OER.forCourse, course))
-            self.graph.add((material, RDFS.label, Literal(row._1)))
+    def update(self, filename=None):
+        """Bring the graph in line with an edited spreadsheet (file name or
+        DataFrame, as for generate) by applying only the difference between
+        the triples of its rows and the triples the graph currently holds
+        for materials and courses.
 
-            self.__populateCourseDependencies(material, row)
-            self.__populateCourseAgeRanges(material, row)
-            self.__populateCourseTopics(material, row)
-            self.__populateCourseLanguages(material, row)
-            self.__populateCourseEduLevels(material, row)
-            self.__populateCourseConcepts(material, row)
-            self.__populateCourseTags(material, row)
+        Returns a dict with the "added" and "removed" triples and the ids
+        of the changed "materials".
+        """
+        if (filename is None or len(filename) == 0):
+            return
 
-    def __populateUnique(self, df, column):
-        unique = df[column].unique()
+        df = self.__readSheet(filename)
 
-        for item in unique:
+        sheet = set(self.__sheetTriples(df))
 
-            if type(item) is not str:
-                continue
+        subjects = set(self.graph.subjects(RDF.type, OER.LearningComponent))
+        subjects.update(self.graph.subjects(RDF.type, OER.Course))
+        current = {triple for subject in subjects
+                   for triple in self.graph.triples((subject, None, None))}
 
-            node = BNode(item.strip())
+        added = sheet - current
+        removed = current - sheet
 
-            self.graph.add((node, RDF.type, SDO.DefinedTerm))
-            self.graph.add((node, SDO.name, Literal(item.strip())))
-            self.graph.add((node, SDO.description, Literal(column)))
+        for triple in removed:
+            self.graph.remove(triple)
+        self.__addN(added)
 
-    def __populateCourseDependencies(self, material, df):
-        """Populate all course dependencies or prerequisites
+        changed = {triple[0] for triple in added | removed}
+
+        if self.persistent or self.index is None:
+            self.__build_index()
+        else:
+            self.index.refresh(self.graph, changed)
+            self.text.refresh(self.graph, changed)
+
+            for material, predicate, dep in removed:
+                if predicate == OER.coursePrerequisites:
+                    self.prerequisites.remove(material, dep)
+            for material, predicate, dep in added:
+                if predicate == OER.coursePrerequisites:
+                    self.prerequisites.add(material, dep)
+
+        self.changed()
+
+        return {
+            "added": added,
+            "removed": removed,
+            "materials": sorted(changed, key=str),
+        }
+
+    def __readSheet(self, filename):
+        """Read the spreadsheet, taking an already read DataFrame as it is
         """
-        dependsOn = str(df._2).split(',')
+        import pandas as pd
 
-        for dep in dependsOn:
-            if dep.find('-') != -1:
+        if not isinstance(filename, pd.DataFrame):
+            filename = pd.read_excel(filename, index_col=0)
 
-                base, ranges = self.__spreadRanges(dep)
+        return filename.dropna(how='all')
 
-                for r in ranges:
-                    self.graph.add(
-                        (material, OER.coursePrerequisites, BNode(f'{base.strip()}.{r}')))
-            else:
-                self.graph.add(
-                    (material, OER.coursePrerequisites, BNode(dep.strip())))
+    def __sheetTriples(self, df):
+        yield from self.__populateCourses(df)
+        yield from self.__populateCourseDependencies(df)
 
-    def __spreadRanges(self, data):
-        """Spread ranges like T1.1-T1.8 to
-        T1.1, T1.2, T1.3 .... T.1.8
+        for position, predicate in VALUE_COLUMNS:
+            yield from self.__populateCourseValues(df, position, predicate)
+
+    def __addN(self, triples):
+        """Add triples to the graph in batches of BATCH_SIZE
         """
-        ranges = data.split('-')
+        batch = []
+
+        for triple in triples:
+            batch.append(triple + (self.graph,))
+
+            if len(batch) >= BATCH_SIZE:
+                self.graph.addN(batch)
+                batch = []
 
-        if len(ranges) != 2:
+        if batch:
+            self.graph.addN(batch)
+
+    def __build_index(self):
+        """(Re)build the in-memory facet, prerequisite and full-text indexes
+        over the whole graph. Graphs assembled by hand, without load or generate,
+        have no indexes and are queried through SPARQL instead, as are
+        persistent graphs.
+        """
+        if self.persistent:
+            self.changed()
             return
 
-        fromParts = ranges[0].split('.')
-        toParts = ranges[1].split('.')
-        base = fromParts[0]
-        fromDep = int(fromParts[1][0:])
-        toDep = int(toParts[1])
+        self.index = KnowledgeIndex(self.graph)
+        self.prerequisites = PrerequisiteIndex(self.graph)
+        self.text = TextIndex(self.graph)
+        self.changed()
 
-        ranges = range(fromDep, toDep + 1)
+    @property
+    def version(self):
+        if hasattr(self.graph.store, 'generation'):
+            return self.graph.store.generation()
 
-        return (base, ranges)
+        return self.__version
 
-    def __populateCourseAgeRanges(self, material, df):
-        """Populate all age ranges for the learning material in a
-        format of a tuples 8-10, 10-20 etc.
+    def changed(self):
+        """Mark the graph as changed, committing a persistent store and
+        dropping cached query results
         """
+        if self.persistent:
+            if hasattr(self.graph.store, 'advance'):
+                self.graph.store.advance()
+            self.graph.commit()
 
-        if type(df[3]) is not str:
-            return
+        self.__version += 1
 
-        ageRanges = str(df[3]).split(',')
+    def add_prerequisite(self, material, dep):
+        """Make dep a prerequisite of material, keeping the prerequisite index up to date
+        """
+        self.graph.add((material, OER.coursePrerequisites, dep))
 
-        for range in ageRanges:
-            self.graph.add(
-                (material, SDO.typicalAgeRange, Literal(range.strip())))
+        if self.prerequisites is not None:
+            self.prerequisites.add(material, dep)
 
-    def __populateCourseTopics(self, material, df):
-        """Populate all course learning material topics (Programming, Python, etc...)
+        self.changed()
+
+    def remove_prerequisite(self, material, dep):
+        """Drop dep from the prerequisites of material, keeping the prerequisite index up to date
         """
+        self.graph.remove((material, OER.coursePrerequisites, dep))
 
-        if type(df[4]) is not str:
-            return
+        if self.prerequisites is not None:
+            self.prerequisites.remove(material, dep)
+
+        self.changed()
 
-        topics = str(df[4]).split(',')
+    def load_shards(self, sources):
+        """Load several catalog sources, (filename, format) pairs, as shards,
+        each in its own worker process. Searches, facet listings and
+        prerequisites are answered by all shards in parallel and merged, and
+        prerequisites may point from one shard to materials in another.
+        The sqlite format opens a persistent store as a shard.
+        """
+        from .knowledge_shards import KnowledgeShards
+
+        if self.shards is not None:
+            self.shards.close()
 
-        for topic in topics:
-            self.graph.add(
-                (material, OER.forTopic, Literal(topic.strip())))
+        self.shards = KnowledgeShards(sources)
+        self.prerequisites = self.shards.prerequisites()
+        self.changed()
 
-    def __populateCourseLanguages(self, material, df):
-        """Populate all course programming languages
+    def __derived(self, name, build):
+        """An index built from the graph, kept until the graph changes
         """
+        version = self.version
+        kept = self.__kept.get(name)
 
-        if type(df[5]) is not str:
-            return
+        if kept is None or kept[0] != version:
+            kept = self.__kept[name] = (version, build())
 
-        items = str(df[5]).split(',')
+        return kept[1]
 
-        for item in items:
-            self.graph.add(
-                (material, SDO.inLanguage, Literal(item.strip())))
+    def facet_index(self):
+        """The facet index, or one built from the graph for graphs without
+        """
+        return self.index or self.__derived('index', lambda: KnowledgeIndex(self.graph))
 
-    def __populateCourseEduLevels(self, material, df):
-        """Set educational level (всички, математици, etc...)
+    def prerequisite_index(self):
+        """The prerequisite index, or one built from the graph for graphs without
         """
+        return self.prerequisites or self.__derived('prerequisites', lambda: PrerequisiteIndex(self.graph))
 
-        if type(df[8]) is not str:
-            return
+    def text_index(self):
+        """The full-text index, or one built from the graph for graphs without
+        """
+        return self.text or self.__derived('text', lambda: TextIndex(self.graph))
+
+    def planner(self):
+        """Return a learning path planner for the current prerequisites,
+        rebuilt only after they change
+        """
+        from .knowledge_planner import LearningPlanner
+
+        prerequisites = self.prerequisite_index()
 
-        scopes = str(df[8]).split(',')
+        if self.__planner is None or not self.__planner.current(prerequisites):
+            self.__planner = LearningPlanner(prerequisites)
 
-        for scope in scopes:
-            self.graph.add(
-                (material, SDO.educationalLevel, Literal(scope.strip())))
+        return self.__planner
 
-    def __populateCourseConcepts(self, material, df):
-        """Populate all course concetps
+    def recommender(self):
+        """Return the recommendations of every material, computed when first
+        asked for and again only after the graph changes. Threads asking at
+        the same time wait for one computation.
         """
+        with self.__recommender_lock:
+            version = self.version
 
-        if type(df[6]) is not str:
-            return
+            if self.__recommender is None or self.__recommender[0] != version:
+                from .knowledge_recommend import Recommender
+                self.__recommender = (version, Recommender(self))
+
+            return self.__recommender[1]
+
+    def __populateUnique(self, df, column):
+        unique = df[column].unique()
 
-        items = str(df[6]).split(',')
+        for item in unique:
+
+            if type(item) is not str:
+                continue
 
-        for item in items:
-            self.graph.add(
-                (material, SDO.teaches, Literal(item.strip())))
+            node = BNode(item.strip())
+
+            self.graph.add((node, RDF.type, SDO.DefinedTerm))
+            self.graph.add((node, SDO.name, Literal(item.strip())))
+            self.graph.add((node, SDO.description, Literal(column)))
 
-    def __populateCourseTags(self, material, df):
-        """Populate all course tags
+    def __populateCourses(self, df):
+        """Populate the courses and the learning materials with their titles
+        """
+        ids = df.index.to_series()
+        materials = ids.map(BNode)
+        courses = ids.str.strip().str.split('.').str[0].map(BNode)
+        labels = df.iloc[:, 0].map(Literal)
+
+        for material, course, label in zip(materials, courses, labels):
+            yield (course, RDF.type, OER.Course)
+            yield (material, RDF.type, OER.LearningComponent)
+            yield (material, OER.forCourse, course)
+            yield (material, RDFS.label, label)
+
+    def __populateCourseDependencies(self, df):
+        """Populate all course dependencies or prerequisites
         """
+        deps = df.iloc[:, 1].astype(str).str.split(',').explode()
+        ranged = deps.str.contains('-', regex=False)
+
+        singles = deps[~ranged].str.strip()
+
+        for material, dep in zip(singles.index, singles):
+            yield (BNode(material), OER.coursePrerequisites, BNode(dep))
+
+        yield from self.__spreadRanges(deps[ranged])
 
-        if type(df[7]) is not str:
+    def __spreadRanges(self, deps):
+        """Spread ranges like T1.1-T1.8 to
+        T1.1, T1.2, T1.3 .... T.1.8
+        for a whole column of material -> range entries at once
+        """
+        if deps.empty:
             return
 
-        items = str(df[7]).split(',')
+        import numpy as np
+
+        bounds = deps.str.split('-', expand=True)
+
+        if bounds.shape[1] != 2:
+            raise ValueError("Invalid prerequisite ranges: " +
+                             ', '.join(deps[bounds[2].notna()]))
+
+        fromParts = bounds[0].str.split('.')
+        base = fromParts.str[0].str.strip().to_numpy()
+        fromDep = fromParts.str[1].astype(int).to_numpy()
+        toDep = bounds[1].str.split('.').str[1].astype(int).to_numpy()
+
+        counts = np.clip(toDep - fromDep + 1, 0, None)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        numbers = np.repeat(fromDep, counts) + offsets
 
-        for item in items:
-            self.graph.add(
-                (material, SDO.keywords, Literal(item.strip())))
+        for material, base, number in zip(np.repeat(deps.index.to_numpy(), counts), np.repeat(base, counts), numbers):
+            yield (BNode(material), OER.coursePrerequisites, BNode(f'{base}.{number}'))
 
-    def export(self, relative_path, format):
+    def __populateCourseValues(self, df, position, predicate):
+        """Populate a comma separated column of the material (age ranges,
+        topics, languages, concepts etc.) as literals of the given predicate
+        """
+        column = df.iloc[:, position]
+        column = column[column.map(type) == str]
+        values = column.str.split(',').explode().str.strip()
+
+        for material, value in zip(values.index, values):
+            yield (BNode(material), predicate, Literal(value))
+
+    def export(self, destination, format, compress=None):
         """Exports the graph into a one of the supported
-        formats and given filename.
+        formats and given destination.
+
+        The destination is a path, absolute or relative to the working
+        directory, or a binary file object. The graph is serialized
+        straight into it (nt and nquads line by line) instead of being
+        built in memory first, and gzip compressed when compress is set or
+        the path ends with .gz.
 
         Supported formats:
         - n3
@@ -181,18 +403,133 @@ class KnowledgeLibrary:
         - xml
         - json-ld
         """
-        import os
-        import sys
+        if format == 'nquads' and not self.graph.context_aware:
+            # a plain graph only has the default graph, whose N-Quads are N-Triples
+            format = 'nt'
+
+        with self.__open(destination, 'wb', compress) as file:
+            self.graph.serialize(destination=file, format=format, encoding='utf-8')
+
+    @contextmanager
+    def __open(self, target, mode, compress=None):
+        """Open a path or wrap a file object, gzip (de)compressing it when
+        compress is set or the path ends with .gz
+        """
+        is_path = not hasattr(target, 'read') and not hasattr(target, 'write')
+
+        if compress is None:
+            compress = is_path and str(target).endswith('.gz')
+
+        if is_path:
+            file = gzip.open(target, mode) if compress else open(target, mode)
+        elif compress:
+            file = gzip.GzipFile(fileobj=target, mode=mode)
+        else:
+            yield target
+            return
+
+        try:
+            yield file
+        finally:
+            file.close()
+
+    def __parse(self, source, format, compress=None):
+        with self.__open(source, 'rb', compress) as file:
+            if format in LINE_FORMATS:
+                from . import knowledge_stream
+
+                self.__addN(knowledge_stream.read(file))
+            elif self.persistent:
+                # rdflib parsers may need a context aware store, parse in
+                # memory and copy the triples over
+                graph = Graph()
+                graph.parse(file, format=format)
+                self.__addN(graph)
+            else:
+                self.graph.parse(file, format=format)
+
+    def __load_store(self, filename, format, compress):
+        """Replace the contents of the persistent store with a file, unless
+        the store says it holds the same file already. The old triples are
+        removed in the same transaction as the new ones are added.
+        """
+        store = self.graph.store
+        source_checksum = knowledge_snapshot.checksum(filename)
 
-        dirname = os.path.dirname(sys.modules['__main__'].__file__)
-        filename = os.path.join(dirname, relative_path)
-        file = open(filename, mode="w+")
-        file.write(self.graph.serialize(format=format).decode('utf-8'))
-        file.close()
+        if hasattr(store, 'loaded') and store.loaded(source_checksum):
+            return
+
+        self.graph.remove((None, None, None))
+        self.__parse(filename, format, compress)
+
+        if hasattr(store, 'mark_loaded'):
+            store.mark_loaded(source_checksum)
+
+        self.__build_index()
+
+    def load_compact(self, filename):
+        """Query a compact file written by knowledge_compact.write, mapped
+        into memory, instead of a graph
+        """
+        from . import knowledge_compact
+
+        graph = knowledge_compact.read(filename)
+
+        if graph is None:
+            raise ValueError(f'{filename} is not a compact graph')
+
+        self.__use_compact(graph)
+
+    def __use_compact(self, graph):
+        from .knowledge_compact import (CompactIndex, CompactPrerequisites,
+                                        CompactRecommender, CompactText)
+
+        self.index = CompactIndex(graph)
+        self.prerequisites = CompactPrerequisites(graph)
+        self.text = CompactText(graph)
+        self.changed()
+        self.__recommender = (self.version, CompactRecommender(graph))
+
+    def __load_compact(self, filename, format, compress):
+        """Map the compact file next to the source, (re)writing it first
+        when it is missing or was made from another version of the file
+        """
+        from . import knowledge_compact
+
+        source_checksum = knowledge_snapshot.checksum(filename)
+        compact_file = knowledge_compact.compact_path(filename)
+        graph = knowledge_compact.read(compact_file, source_checksum)
 
-    def load(self, filename=None, format=None):
+        if graph is None:
+            source = KnowledgeLibrary()
+            source.load(filename, format, compress=compress)
+
+            try:
+                knowledge_compact.write(source, compact_file, source_checksum)
+            except OSError:
+                # nowhere to write it, keep the graph in memory after all
+                self.graph, self.index = source.graph, source.index
+                self.prerequisites, self.text = source.prerequisites, source.text
+                self.changed()
+                return
+
+            graph = knowledge_compact.read(compact_file, source_checksum)
+
+        self.__use_compact(graph)
+
+    def load(self, filename=None, format=None, snapshot=True, compress=None, compact=False):
         """Imports a graph from a file with selected format
 
+        The file is a path or a binary file object and is parsed as a
+        stream, gzip decompressed when compress is set or the path ends
+        with .gz. Unless snapshot is disabled, a binary snapshot stored
+        next to a path (<filename>.snapshot) is used instead of parsing
+        when its checksum matches the file, and written after parsing
+        otherwise. Persistent stores take the place of the snapshot: a file
+        replaces their contents and is parsed into them only once. With compact the library is loaded
+        read-only from a compact file next to the path (<filename>.compact)
+        in the same way, see load_compact.
+
         Supported formats:
         - n3
         - nquads
@@ -207,4 +544,31 @@ class KnowledgeLibrary:
         if (not filename or not format):
             return
 
-        self.graph.parse(filename, format=format)
+        if not snapshot or hasattr(filename, 'read'):
+            self.__parse(filename, format, compress)
+            self.__build_index()
+            return
+
+        if self.persistent:
+            self.__load_store(filename, format, compress)
+            return
+
+        if compact:
+            self.__load_compact(filename, format, compress)
+            return
+
+        source_checksum = knowledge_snapshot.checksum(filename)
+        snapshot_file = knowledge_snapshot.snapshot_path(filename)
+
+        if not knowledge_snapshot.read(self.graph, snapshot_file, source_checksum):
+            empty = len(self.graph) == 0
+            self.__parse(filename, format, compress)
+
+            if empty:
+                try:
+                    knowledge_snapshot.write(
+                        self.graph, snapshot_file, source_checksum)
+                except OSError:
+                    pass
+
+        self.__build_index()
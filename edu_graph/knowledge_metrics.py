@@ -0,0 +1,149 @@
+import functools
+import threading
+import time
+from collections import deque
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Recent durations kept per shape for exact percentiles in reports
+WINDOW = 1024
+
+
+class QueryMetrics:
+    """Per query shape timing, row counts and latency histograms.
+
+    Shapes are the public KnowledgeApi methods (search, list_topics, ...)
+    and the SPARQL query shapes they fall back to (sparql:search, ...).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__shapes = {}
+
+    def observe(self, shape, seconds, rows):
+        with self.__lock:
+            stats = self.__shapes.get(shape)
+
+            if stats is None:
+                stats = self.__shapes[shape] = {
+                    "count": 0,
+                    "seconds": 0.0,
+                    "rows": 0,
+                    "buckets": [0] * len(BUCKETS),
+                    "recent": deque(maxlen=WINDOW),
+                }
+
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["rows"] += rows
+            stats["recent"].append(seconds)
+
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+                    break
+
+    def reset(self):
+        with self.__lock:
+            self.__shapes = {}
+
+    @staticmethod
+    def __percentile(values, fraction):
+        if not values:
+            return 0.0
+
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    def summary(self):
+        """Return shape -> count, total seconds, rows, p50 and p99 of the recent window
+        """
+        with self.__lock:
+            shapes = {shape: dict(stats, recent=sorted(stats["recent"]))
+                      for shape, stats in self.__shapes.items()}
+
+        return {shape: {
+            "count": stats["count"],
+            "seconds": stats["seconds"],
+            "rows": stats["rows"],
+            "p50": self.__percentile(stats["recent"], 0.5),
+            "p99": self.__percentile(stats["recent"], 0.99),
+        } for shape, stats in sorted(shapes.items())}
+
+    def report(self):
+        """Plain text table of the summary, as printed by --profile
+        """
+        lines = ["{:<28} {:>7} {:>10} {:>10} {:>10} {:>9}".format(
+            "query", "count", "total ms", "p50 ms", "p99 ms", "rows")]
+
+        for shape, stats in self.summary().items():
+            lines.append("{:<28} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>9}".format(
+                shape, stats["count"], stats["seconds"] * 1000,
+                stats["p50"] * 1000, stats["p99"] * 1000, stats["rows"]))
+
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """Prometheus text exposition of the histograms and row counters
+        """
+        with self.__lock:
+            shapes = {shape: dict(stats, buckets=list(stats["buckets"]))
+                      for shape, stats in self.__shapes.items()}
+
+        lines = [
+            "# HELP edu_graph_query_seconds Time spent answering knowledge queries",
+            "# TYPE edu_graph_query_seconds histogram",
+        ]
+
+        for shape, stats in sorted(shapes.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats["buckets"]):
+                cumulative += count
+                lines.append(
+                    f'edu_graph_query_seconds_bucket{{shape="{shape}",le="{bound}"}} {cumulative}')
+            lines.append(
+                f'edu_graph_query_seconds_bucket{{shape="{shape}",le="+Inf"}} {stats["count"]}')
+            lines.append(
+                f'edu_graph_query_seconds_sum{{shape="{shape}"}} {stats["seconds"]}')
+            lines.append(
+                f'edu_graph_query_seconds_count{{shape="{shape}"}} {stats["count"]}')
+
+        lines.append(
+            "# HELP edu_graph_query_rows_total Rows returned by knowledge queries")
+        lines.append("# TYPE edu_graph_query_rows_total counter")
+
+        for shape, stats in sorted(shapes.items()):
+            lines.append(
+                f'edu_graph_query_rows_total{{shape="{shape}"}} {stats["rows"]}')
+
+        return "\n".join(lines) + "\n"
+
+
+def rows(result):
+    """Number of rows of a query result, 0 when it has no length
+    """
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+
+metrics = QueryMetrics()
+
+
+def timed(shape, count=rows):
+    """Decorator recording the duration and row count of every call in metrics
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            metrics.observe(shape, time.perf_counter() - start, count(result))
+
+            return result
+
+        return wrapper
+
+    return decorator
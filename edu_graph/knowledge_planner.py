@@ -0,0 +1,141 @@
+import heapq
+import re
+from array import array
+
+from rdflib import BNode
+
+DIGITS = re.compile(r'(\d+)')
+
+
+def natural_key(node):
+    """Sort key ordering ids by their numeric parts, T1.2 before T1.10
+    """
+    return tuple(int(part) if part.isdigit() else part
+                 for part in DIGITS.split(str(node)))
+
+
+class LearningPlanner:
+    """Learning path planner over an integer-indexed prerequisite graph.
+
+    Nodes are numbered in topological order, prerequisites first and ties
+    broken by natural_key, and the oer:coursePrerequisites edges are kept
+    in compressed arrays (offsets into one flat array of node numbers). A
+    path is the prerequisite closure of the target minus everything known
+    or transitively covered by something known, ordered by node number.
+    Nodes caught in prerequisite cycles are numbered after all others.
+    """
+
+    def __init__(self, prerequisites):
+        self.prerequisites = prerequisites
+        self.version = prerequisites.version
+
+        nodes = set(prerequisites.requires)
+        for deps in prerequisites.requires.values():
+            nodes.update(deps)
+
+        self.nodes = self.__order(nodes, prerequisites.requires)
+        self.number = {node: i for i, node in enumerate(self.nodes)}
+
+        self.offsets = array('L', [0])
+        self.targets = array('L')
+
+        for node in self.nodes:
+            self.targets.extend(sorted(self.number[dep]
+                                       for dep in prerequisites.requires.get(node, ())))
+            self.offsets.append(len(self.targets))
+
+    @staticmethod
+    def __order(nodes, requires):
+        """Kahn's algorithm with a heap on natural_key for a stable order
+        """
+        waiting = {node: len(requires.get(node, ())) for node in nodes}
+        required_by = {}
+
+        for node in nodes:
+            for dep in requires.get(node, ()):
+                required_by.setdefault(dep, []).append(node)
+
+        ready = [(natural_key(node), node) for node, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+
+        while ready:
+            _, node = heapq.heappop(ready)
+            order.append(node)
+
+            for parent in required_by.get(node, ()):
+                waiting[parent] -= 1
+                if waiting[parent] == 0:
+                    heapq.heappush(ready, (natural_key(parent), parent))
+
+        if len(order) < len(nodes):
+            placed = set(order)
+            order.extend(sorted((node for node in nodes if node not in placed), key=natural_key))
+
+        return order
+
+    def current(self, prerequisites):
+        """Whether the planner still reflects the given prerequisite index
+        """
+        return self.prerequisites is prerequisites and self.version == prerequisites.version
+
+    def __mark(self, start, marks, stop=None):
+        """Mark start and everything it requires, not descending into
+        nodes marked in stop. Returns the newly marked node numbers.
+        """
+        offsets, targets = self.offsets, self.targets
+        found = []
+        stack = [i for i in start if not marks[i] and not (stop and stop[i])]
+
+        for i in stack:
+            marks[i] = 1
+
+        while stack:
+            current = stack.pop()
+            found.append(current)
+
+            for dep in targets[offsets[current]:offsets[current + 1]]:
+                if not marks[dep] and not (stop and stop[dep]):
+                    marks[dep] = 1
+                    stack.append(dep)
+
+        return found
+
+    def __numbers(self, nodes):
+        return [self.number[node] for node in map(BNode, nodes) if node in self.number]
+
+    def __covered(self, known):
+        covered = bytearray(len(self.nodes))
+        self.__mark(self.__numbers(known), covered)
+        return covered
+
+    def plan(self, target, known=()):
+        """Return the materials to learn for target in order, without the
+        known ones and everything they require
+        """
+        return self.plans([(target, known)])[0]
+
+    def plans(self, profiles):
+        """Return one plan per (target, known) profile, in input order.
+
+        Profiles sharing the same known materials share their coverage.
+        """
+        coverage = {}
+        result = []
+
+        for target, known in profiles:
+            known = frozenset(map(BNode, known or ()))
+
+            covered = coverage.get(known)
+            if covered is None:
+                covered = coverage[known] = self.__covered(known)
+
+            start = self.__numbers([target])
+            if not start:
+                result.append([BNode(target)] if BNode(target) not in known else [])
+                continue
+
+            path = self.__mark(start, bytearray(len(self.nodes)), covered)
+            result.append([self.nodes[i] for i in sorted(path)])
+
+        return result
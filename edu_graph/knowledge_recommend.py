@@ -0,0 +1,192 @@
+from array import array
+
+from rdflib.namespace import SDO
+
+from .knowledge_planner import natural_key
+from .namespace import OER
+
+# Predicates whose values make up the feature vector of a material
+FEATURES = (SDO.teaches, SDO.keywords, OER.forTopic, SDO.inLanguage)
+
+# Similar materials kept per material
+TOP_K = 10
+
+# Features shared by more materials are too common to tell them apart and
+# are left out, which bounds the work per material
+MAX_POSTING = 1000
+
+# Material pairs scored at once, bounding the memory of one batch
+PAIRS = 1 << 22
+
+
+def __csr_offsets(keys, count):
+    """Offsets of the runs of equal keys in a sorted array, one run per key 0..count-1
+    """
+    import numpy as np
+
+    return np.searchsorted(keys, np.arange(count + 1))
+
+
+def __expand(starts, lengths):
+    """Flat indexes starts[i] .. starts[i] + lengths[i] - 1 for every i
+    """
+    import numpy as np
+
+    ends = np.cumsum(lengths)
+
+    return np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(ends - lengths, lengths) \
+        + np.repeat(starts, lengths)
+
+
+def similarities(positions, features, count, top_k=TOP_K):
+    """Top-k cosine similarities between materials given as parallel arrays
+    of (material position, feature id) pairs.
+
+    Features are weighted by inverse document frequency and the vectors
+    normalized, then materials are scored in batches of about PAIRS pairs
+    against every material sharing a feature, all with array operations.
+    Returns CSR offsets per material and the similar positions and scores,
+    most similar first and ties by position.
+    """
+    import numpy as np
+
+    pairs = np.unique(np.asarray(positions, dtype='q') << 32 | np.asarray(features, dtype='q'))
+    rows, cols = (pairs >> 32).astype('q'), (pairs & 0xffffffff).astype('q')
+
+    df = np.bincount(cols)
+    kept = df[cols] <= MAX_POSTING
+    rows, cols = rows[kept], cols[kept]
+
+    weights = np.log(count / df[cols])
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=count))
+    weights = np.divide(weights, norms[rows], out=np.zeros_like(weights), where=norms[rows] > 0)
+
+    offsets = __csr_offsets(rows, count)
+    posting = np.argsort(cols, kind='stable')
+    posting_rows, posting_weights = rows[posting], weights[posting]
+    posting_offsets = __csr_offsets(cols[posting], len(df))
+
+    # pairs every material is scored in, cut into batches of about PAIRS
+    work = np.cumsum(np.bincount(rows, weights=df[cols], minlength=count))
+    found_rows, found_targets, found_scores = [], [], []
+    start = 0
+
+    while start < count:
+        before = work[start - 1] if start else 0
+        end = max(int(np.searchsorted(work, before + PAIRS, side='right')), start + 1)
+        entries = np.arange(offsets[start], offsets[end])
+        start, first = end, start
+
+        if not len(entries):
+            continue
+
+        lengths = df[cols[entries]]
+        flat = __expand(posting_offsets[cols[entries]], lengths)
+        sources = np.repeat(rows[entries], lengths)
+        targets = posting_rows[flat]
+        scores = np.repeat(weights[entries], lengths) * posting_weights[flat]
+
+        other = sources != targets
+        keys, inverse = np.unique((sources[other] - first) * count + targets[other], return_inverse=True)
+        scores = np.bincount(inverse, weights=scores[other])
+        sources, targets = keys // count + first, keys % count
+
+        order = np.lexsort((targets, -scores, sources))
+        sources, targets, scores = sources[order], targets[order], scores[order]
+        rank = np.arange(len(sources)) - np.searchsorted(sources, sources)
+        best = (rank < top_k) & (scores > 0)
+
+        found_rows.append(sources[best])
+        found_targets.append(targets[best])
+        found_scores.append(scores[best])
+
+    if found_rows:
+        sources = np.concatenate(found_rows)
+        targets, scores = np.concatenate(found_targets), np.concatenate(found_scores)
+    else:
+        sources = targets = np.array([], dtype='q')
+        scores = np.array([], dtype='d')
+
+    return __csr_offsets(sources, count), targets, scores
+
+
+class Recommender:
+    """Precomputed "similar" and "next" recommendations for every material.
+
+    Similar materials share concepts, keywords, topics and languages, see
+    similarities. The materials a material unlocks are those requiring it
+    whose prerequisites are all covered by it and its own prerequisites,
+    ordered by natural_key. Everything is computed once, looking up the
+    recommendations of a material is a slice of the arrays.
+    """
+
+    def __init__(self, library, top_k=TOP_K):
+        import numpy as np
+
+        graph = library.graph
+        prerequisites = library.prerequisite_index()
+
+        self.materials = sorted(library.facet_index().match({}), key=str)
+        self.position = {material: i for i, material in enumerate(self.materials)}
+
+        features = {}
+        positions, ids = array('q'), array('q')
+
+        for predicate in FEATURES:
+            for material, value in graph.subject_objects(predicate):
+                position = self.position.get(material)
+
+                if position is not None:
+                    positions.append(position)
+                    ids.append(features.setdefault((predicate, value), len(features)))
+
+        self.offsets, self.targets, self.scores = similarities(
+            positions, ids, len(self.materials), top_k)
+
+        unlocked = {}
+
+        for material, deps in prerequisites.requires.items():
+            if material not in self.position:
+                continue
+
+            for dep in deps:
+                closure = prerequisites.closure(dep)
+
+                if dep in self.position and material not in closure and deps <= closure:
+                    unlocked.setdefault(dep, []).append(material)
+
+        next_offsets = array('Q', [0])
+        next_targets = array('q')
+
+        for material in self.materials:
+            next_targets.extend(self.position[other] for other in
+                                sorted(unlocked.get(material, ()), key=natural_key))
+            next_offsets.append(len(next_targets))
+
+        self.next_offsets = np.frombuffer(next_offsets, dtype='Q')
+        self.next_targets = np.frombuffer(next_targets, dtype='q')
+
+    def similar(self, material, limit=TOP_K):
+        """(material, score) pairs of the materials most similar to material
+        """
+        position = self.position.get(material)
+
+        if position is None:
+            return []
+
+        start = int(self.offsets[position])
+        end = min(int(self.offsets[position + 1]), start + limit)
+
+        return [(self.materials[target], float(score)) for target, score in
+                zip(self.targets[start:end].tolist(), self.scores[start:end].tolist())]
+
+    def unlocked(self, material):
+        """Materials whose prerequisites are satisfied once material is learned
+        """
+        position = self.position.get(material)
+
+        if position is None:
+            return []
+
+        return [self.materials[target] for target in
+                self.next_targets[self.next_offsets[position]:self.next_offsets[position + 1]].tolist()]
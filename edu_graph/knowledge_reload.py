@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+from typing import Any, NamedTuple
+
+# Seconds between two checks of the catalog file
+INTERVAL = 2.0
+
+log = logging.getLogger(__name__)
+
+
+class Catalog(NamedTuple):
+    """One loaded version of a catalog file. Requests take the current
+    catalog once and use it to the end, so a reload never changes the
+    library under a running request.
+    """
+    library: Any
+    api: Any
+    mtime: int
+
+
+class CatalogWatcher:
+    """Keeps a catalog file loaded, reloading it in the background when it changes.
+
+    The new library and its indexes are built on the watcher thread while
+    current keeps serving the previous version, and then swapped in by a
+    single assignment. A file which fails to load (e.g. still being
+    written) leaves the previous version in place and is tried again on
+    its next change. Publish new catalogs by renaming a complete file over
+    the old one. With compact every version is loaded read-only from a
+    memory-mapped compact file, see KnowledgeLibrary.load.
+    """
+
+    def __init__(self, filename, format, interval=INTERVAL, compact=False):
+        self.filename = filename
+        self.format = format
+        self.interval = interval
+        self.compact = compact
+        self.reloads = 0
+        self.error = None
+        self.__failed = None
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.current = self.__build(self.__mtime())
+
+    def __mtime(self):
+        return os.stat(self.filename).st_mtime_ns
+
+    def __build(self, mtime):
+        from .knowledge_api import KnowledgeApi
+        from .knowledge_library import KnowledgeLibrary
+
+        library = KnowledgeLibrary()
+        library.load(self.filename, self.format, compact=self.compact)
+        # computed before the catalog is swapped in, on the watcher thread
+        # for reloads, so requests only look recommendations up
+        library.recommender()
+
+        return Catalog(library, KnowledgeApi(library), mtime)
+
+    def check(self):
+        """Reload the catalog when the file changed since the current
+        version was loaded, returning whether it did
+        """
+        with self.__lock:
+            mtime = self.__mtime()
+
+            if mtime in (self.current.mtime, self.__failed):
+                return False
+
+            try:
+                catalog = self.__build(mtime)
+            except Exception:
+                self.__failed = mtime
+                raise
+
+            self.current = catalog
+            self.reloads += 1
+            self.error = None
+
+            return True
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as error:
+                if str(error) != str(self.error):
+                    log.exception('Reloading %s failed, serving the previous version', self.filename)
+                self.error = error
+
+    def start(self):
+        """Start watching the file on a daemon thread
+        """
+        if self.__thread is None:
+            self.__stop.clear()
+            self.__thread = threading.Thread(
+                target=self.__run, name='catalog-watcher', daemon=True)
+            self.__thread.start()
+
+        return self
+
+    def stop(self):
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
@@ -0,0 +1,200 @@
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+
+import click
+
+serving = False
+
+__libraries = {}
+
+
+def socket_path():
+    """Path of the daemon socket: EDU_GRAPH_SOCKET, or a file in the private
+    per-user directory XDG_RUNTIME_DIR, or else in a private directory of
+    the user in the temp dir
+    """
+    if os.environ.get('EDU_GRAPH_SOCKET'):
+        return os.environ['EDU_GRAPH_SOCKET']
+
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'edu_graph.sock')
+
+    return os.path.join(tempfile.gettempdir(), f'edu_graph-{os.getuid()}', 'daemon.sock')
+
+
+def private_directory(path):
+    """Create the directory of a socket path, readable only by the user,
+    refusing one which belongs to someone else or is open to others
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(directory, 0o700)
+
+    info = os.lstat(directory)
+
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise click.ClickException(
+            f'{directory} must be a directory of your own, not accessible by others')
+
+
+def __peer_uid(connection):
+    """User id of the process at the other end of a Unix socket, None where
+    the platform does not tell
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+
+    credentials = struct.Struct('3i')
+    pid, uid, gid = credentials.unpack(
+        connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size))
+
+    return uid
+
+
+def __open(filename, format):
+    from .knowledge_library import KnowledgeLibrary
+
+    if ',' in filename:
+        result = KnowledgeLibrary()
+        result.load_shards([(name, format) for name in filename.split(',')])
+        return result
+
+    if format == 'sqlite':
+        if not os.path.exists(filename):
+            raise click.ClickException(f'No store at {filename}, build it with the store command')
+        return KnowledgeLibrary(store=filename)
+
+    result = KnowledgeLibrary()
+    result.load(filename, format)
+    return result
+
+
+def library(filename, format):
+    """Return a loaded library for the file, or the store opened when the
+    format is sqlite. Comma separated file names are loaded as shards.
+    While serving, libraries are kept warm and only reloaded when a file
+    changes.
+    """
+    if not serving:
+        return __open(filename, format)
+
+    key = (os.path.abspath(filename), format)
+    mtime = tuple(os.stat(name).st_mtime_ns for name in filename.split(','))
+    cached = __libraries.get(key)
+
+    if cached is None or cached[0] != mtime:
+        cached = __libraries[key] = (mtime, __open(filename, format))
+
+    return cached[1]
+
+
+def request(args, path=None):
+    """Forward CLI arguments to a running daemon.
+
+    Returns (output, exit code), or None when no daemon is listening. A
+    socket, or a daemon behind it, of another user is not trusted with the
+    arguments and is ignored the same way.
+    """
+    path = path or socket_path()
+
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        click.echo(f'Ignoring {path}, it is not a socket of yours', err=True)
+        return None
+
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+    except OSError:
+        return None
+
+    if __peer_uid(client) not in (None, os.getuid()):
+        client.close()
+        click.echo(f'Ignoring {path}, its daemon runs as another user', err=True)
+        return None
+
+    with client, client.makefile('rwb') as stream:
+        stream.write(json.dumps({"args": args, "cwd": os.getcwd()}).encode('utf-8') + b'\n')
+        stream.flush()
+
+        response = stream.readline()
+
+    if not response:
+        return None
+
+    response = json.loads(response)
+    return response["output"], response["code"]
+
+
+class KnowledgeRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            message = json.loads(line)
+            output, code = self.server.run(message["args"], message["cwd"])
+            self.wfile.write(json.dumps(
+                {"output": output, "code": code}).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class KnowledgeServer(socketserver.UnixStreamServer):
+    """Daemon running CLI commands against warm libraries.
+
+    Requests are handled one at a time, each in the working directory of
+    the client that sent it, so relative file names resolve as they would
+    for an in-process run.
+    """
+
+    def __init__(self, command, path=None):
+        self.command = command
+        self.path = path or socket_path()
+
+        if path is None and not os.environ.get('EDU_GRAPH_SOCKET'):
+            private_directory(self.path)
+
+        if os.path.exists(self.path):
+            if request(['--help'], self.path) is not None:
+                raise click.ClickException(
+                    f'A daemon is already listening on {self.path}')
+            os.unlink(self.path)
+
+        super().__init__(self.path, KnowledgeRequestHandler)
+        os.chmod(self.path, 0o600)
+
+    def run(self, args, cwd):
+        output = io.StringIO()
+        code = 0
+
+        os.chdir(cwd)
+
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            try:
+                self.command.main(args=args, prog_name='edu_graph',
+                                  standalone_mode=False)
+            except click.exceptions.Exit as error:
+                code = error.exit_code
+            except click.ClickException as error:
+                error.show()
+                code = error.exit_code
+            except Exception as error:
+                click.echo(f'Error: {error}', err=True)
+                code = 1
+
+        return output.getvalue(), code
+
+    def server_close(self):
+        super().server_close()
+
+        with contextlib.suppress(OSError):
+            os.unlink(self.path)
@@ -0,0 +1,275 @@
+import multiprocessing
+import threading
+from collections import Counter
+
+from .knowledge_index import NON_SPECIFIC, PrerequisiteIndex
+from .knowledge_text import scores, tokens
+
+# KnowledgeApi method listing the values of each facet
+LISTS = {
+    'age': 'list_ages',
+    'topic': 'list_topics',
+    'language': 'list_languages',
+    'concept': 'list_concepts',
+    'edu_level': 'list_educations',
+}
+
+
+def __open(filename, format):
+    from .knowledge_library import KnowledgeLibrary
+
+    if format == 'sqlite':
+        return KnowledgeLibrary(store=filename)
+
+    library = KnowledgeLibrary()
+    library.load(filename, format)
+    return library
+
+
+def __filters(filters):
+    from .knowledge_api import SearchFilters
+
+    return SearchFilters(**filters)
+
+
+def __search(library, api, filters):
+    rows = api.search(filters=__filters(filters))
+    terms = sorted(set(tokens(filters.get('query') or ''))) if filters else []
+
+    if not terms:
+        return rows, None
+
+    # scores need the document frequencies of all shards, see KnowledgeShards.search
+    index = library.text_index()
+    found = {row[0] for row in rows}
+    matches = {material: weights for material, weights in index.matches(terms).items()
+               if material in found}
+
+    return rows, (matches, *index.frequencies(terms))
+
+
+def __values(library, api, facet, filters):
+    if facet == 'age':
+        return api.list_ages()
+
+    return getattr(api, LISTS[facet])(filters is not None, filters=__filters(filters or {}))
+
+
+def __described(library, api, filters, names):
+    index = library.facet_index()
+
+    if filters is None:
+        materials = index.match({})
+    else:
+        materials = {row[0] for row in api.search(filters=__filters(filters))}
+
+    return index.described(materials, names)
+
+
+def __rows(library, api, materials):
+    return library.facet_index().rows(materials, ordered=True)
+
+
+def __edges(library, api):
+    if library.prerequisites is not None:
+        return [(material, dep) for material, deps in library.prerequisites.requires.items()
+                for dep in deps]
+
+    from .namespace import OER
+
+    return list(library.graph.subject_objects(OER.coursePrerequisites))
+
+
+HANDLERS = {
+    'search': __search,
+    'values': __values,
+    'described': __described,
+    'rows': __rows,
+    'edges': __edges,
+}
+
+
+def serve(connection, filename, format):
+    """Worker process: load one shard, then answer requests from the
+    connection until it is closed
+    """
+    from .knowledge_api import KnowledgeApi
+
+    try:
+        library = __open(filename, format)
+        connection.send(('ok', len(library.graph)))
+    except Exception as error:
+        connection.send(('error', error))
+        return
+
+    api = KnowledgeApi(library)
+
+    while True:
+        try:
+            name, args = connection.recv()
+        except EOFError:
+            return
+
+        try:
+            connection.send(('ok', HANDLERS[name](library, api, *args)))
+        except Exception as error:
+            connection.send(('error', error))
+
+
+class KnowledgeShards:
+    """Several catalog sources, each loaded by its own worker process.
+
+    Requests are sent to every shard at once and answered in parallel,
+    the coordinator merges the answers: rows are deduplicated and ordered
+    by material id, or by rank for a full-text query, facet values united and counted once per material. The
+    prerequisite edges of all shards are gathered once, so closures
+    follow links from one shard into another.
+    """
+
+    def __init__(self, sources):
+        # forked workers start without importing the package again
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+        self.sources = list(sources)
+        self.sizes = []
+        self.__ages = None
+        self.__lock = threading.Lock()
+        self.__connections = []
+
+        for filename, format in self.sources:
+            connection, child = context.Pipe()
+            context.Process(target=serve, args=(child, filename, format), daemon=True).start()
+            child.close()
+            self.__connections.append(connection)
+
+        with self.__lock:
+            self.sizes = self.__gather()
+
+    def __gather(self):
+        replies = [connection.recv() for connection in self.__connections]
+
+        for status, value in replies:
+            if status == 'error':
+                raise value
+
+        return [value for status, value in replies]
+
+    def call(self, name, *args):
+        """Run a request on every shard in parallel, returning their answers
+        in shard order
+        """
+        with self.__lock:
+            for connection in self.__connections:
+                connection.send((name, args))
+
+            return self.__gather()
+
+    def close(self):
+        """Stop the worker processes
+        """
+        with self.__lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections = []
+
+    def prerequisites(self):
+        """Prerequisite index over the edges of all shards
+        """
+        return PrerequisiteIndex(edges={edge for edges in self.call('edges') for edge in edges})
+
+    @staticmethod
+    def __merged(answers, order=None):
+        found = {}
+
+        for rows in answers:
+            for row in rows:
+                found.setdefault(row[0], set()).add(row)
+
+        if order is None:
+            order = sorted(found, key=str)
+
+        return [row for material in order for row in sorted(found.get(material, ()))]
+
+    def rows(self, materials, ordered=False):
+        """Return (material, course, title) rows of the materials from every
+        shard, ordered by material, or in the given order when ordered
+        """
+        materials = list(materials)
+
+        return self.__merged(self.call('rows', materials), materials if ordered else None)
+
+    def search(self, filters):
+        """Rows of the materials matching filters in any shard, and material
+        -> score of the full-text query in the filters, None without one.
+
+        Shards return the term weights of their matches with the document
+        frequencies of the terms, so scores are computed here over all
+        shards at once and rank as in a single catalog. Ranked rows are
+        ordered by descending score, then by material id.
+        """
+        answers = self.call('search', filters)
+        ranked = [answer for rows, answer in answers if answer is not None]
+        found = None
+
+        if ranked:
+            matches = {}
+            for shard_matches, frequencies, documents in ranked:
+                for material, weights in shard_matches.items():
+                    matches.setdefault(material, weights)
+
+            found = scores(matches, [sum(counts) for counts in zip(*(answer[1] for answer in ranked))],
+                           sum(answer[2] for answer in ranked))
+
+        order = None if found is None else sorted(
+            found, key=lambda material: (-found[material], str(material)))
+
+        return self.__merged([rows for rows, answer in answers], order), found
+
+    def values(self, facet, filters):
+        """Distinct values of a facet across the shards, "Non-specific"
+        first when any shard lists it
+        """
+        answers = self.call('values', facet, filters)
+        values = {value for answer in answers for value in answer if value != NON_SPECIFIC}
+        result = sorted(values)
+
+        if any(NON_SPECIFIC in answer for answer in answers):
+            result.insert(0, NON_SPECIFIC)
+
+        return result
+
+    def counts(self, filters, names):
+        """Count how many materials matching filters (all when None) have
+        each value of the given facets, as KnowledgeIndex.counts does. A
+        material found in several shards is counted once, with the values
+        of all of them.
+        """
+        described = {}
+
+        for answer in self.call('described', filters, names):
+            for material, values in answer.items():
+                merged = described.setdefault(material, [set() for name in names])
+                for found, more in zip(merged, values):
+                    found.update(more)
+
+        counts = {name: Counter() for name in names}
+
+        for values in described.values():
+            for name, found in zip(names, values):
+                if found:
+                    counts[name].update(found)
+                else:
+                    counts[name][NON_SPECIFIC] += 1
+
+        return counts
+
+    def ages(self):
+        """(age, number of materials) pairs of all stored age ranges
+        """
+        if self.__ages is None:
+            counts = self.counts(None, ('age',))['age']
+            self.__ages = [(age, counts[age])
+                           for age in sorted(age for age in counts if age != NON_SPECIFIC)]
+
+        return self.__ages
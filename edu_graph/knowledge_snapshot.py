@@ -0,0 +1,175 @@
+import hashlib
+import os
+import struct
+from array import array
+
+from rdflib import BNode, Literal, URIRef
+
+MAGIC = b'EDUGRAPH'
+VERSION = 1
+SUFFIX = '.snapshot'
+
+HEADER = struct.Struct('<8sH32sII')
+
+URI, BLANK, PLAIN, LANG, TYPED = range(5)
+
+
+def snapshot_path(filename):
+    return filename + SUFFIX
+
+
+def checksum(filename):
+    """SHA-256 of the source file the snapshot was made from
+    """
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.digest()
+
+
+def encode_term(term):
+    if isinstance(term, URIRef):
+        return URI, str(term), ''
+    if isinstance(term, BNode):
+        return BLANK, str(term), ''
+    if term.language:
+        return LANG, str(term), term.language
+    if term.datatype:
+        return TYPED, str(term), str(term.datatype)
+
+    return PLAIN, str(term), ''
+
+
+def decode_term(kind, value, extra):
+    if kind == URI:
+        return URIRef(value)
+    if kind == BLANK:
+        return BNode(value)
+    if kind == LANG:
+        return Literal(value, lang=extra)
+    if kind == TYPED:
+        return Literal(value, datatype=URIRef(extra))
+
+    return Literal(value)
+
+
+def write(graph, filename, source_checksum):
+    """Write the graph as a binary snapshot.
+
+    Layout: header (magic, version, source checksum, term count, triple
+    count), term kinds (one byte each), term string lengths (uint32, two
+    per term: value and language/datatype), the UTF-8 string blob and
+    finally the triples as uint32 term ids.
+    """
+    ids = {}
+    kinds = array('B')
+    lengths = array('I')
+    strings = []
+    triples = array('I')
+
+    for triple in graph:
+        for term in triple:
+            term_id = ids.get(term)
+
+            if term_id is None:
+                term_id = ids[term] = len(ids)
+                kind, value, extra = encode_term(term)
+                value = value.encode('utf-8')
+                extra = extra.encode('utf-8')
+                kinds.append(kind)
+                lengths.append(len(value))
+                lengths.append(len(extra))
+                strings.append(value)
+                strings.append(extra)
+
+            triples.append(term_id)
+
+    # one temporary file per process, as several may write the snapshot at once
+    temporary = f'{filename}.{os.getpid()}.tmp'
+
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, source_checksum,
+                                   len(kinds), len(triples) // 3))
+            file.write(kinds.tobytes())
+            file.write(lengths.tobytes())
+            file.write(b''.join(strings))
+            file.write(triples.tobytes())
+
+        os.replace(temporary, filename)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def read(graph, filename, source_checksum=None):
+    """Load a snapshot into the graph. Returns False without touching the
+    graph when the snapshot is missing, of another version, made from a
+    different source file, or truncated or otherwise damaged.
+    """
+    try:
+        with open(filename, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return False
+
+    if len(data) < HEADER.size:
+        return False
+
+    magic, version, checksum, term_count, triple_count = HEADER.unpack_from(data)
+
+    if magic != MAGIC or version != VERSION:
+        return False
+    if source_checksum is not None and checksum != source_checksum:
+        return False
+
+    try:
+        triples = __decode(data, term_count, triple_count)
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return False
+
+    graph.addN((*triple, graph) for triple in triples)
+
+    return True
+
+
+def __decode(data, term_count, triple_count):
+    """Triples of a snapshot, raising ValueError when the data is not as
+    long as its header says
+    """
+    offset = HEADER.size
+
+    kinds = array('B')
+    kinds.frombytes(data[offset:offset + term_count])
+    offset += term_count
+
+    lengths = array('I')
+    lengths.frombytes(data[offset:offset + 2 * term_count * lengths.itemsize])
+    offset += 2 * term_count * lengths.itemsize
+
+    if len(kinds) != term_count or len(lengths) != 2 * term_count:
+        raise ValueError('Truncated snapshot')
+
+    size = offset + sum(lengths) + 3 * triple_count * array('I').itemsize
+
+    if len(data) != size:
+        raise ValueError(f'Snapshot of {len(data)} bytes instead of {size}')
+
+    terms = []
+    for index, kind in enumerate(kinds):
+        value_end = offset + lengths[2 * index]
+        extra_end = value_end + lengths[2 * index + 1]
+        terms.append(decode_term(
+            kind,
+            data[offset:value_end].decode('utf-8'),
+            data[value_end:extra_end].decode('utf-8')))
+        offset = extra_end
+
+    ids = array('I')
+    ids.frombytes(data[offset:])
+
+    return [(terms[ids[i]], terms[ids[i + 1]], terms[ids[i + 2]])
+            for i in range(0, len(ids), 3)]
@@ -0,0 +1,535 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from rdflib import Literal, URIRef
+from rdflib.namespace import RDFS
+from rdflib.store import NO_STORE, VALID_STORE, Store
+
+from .knowledge_index import FACETS, NON_SPECIFIC, age_range
+from .knowledge_snapshot import decode_term, encode_term
+from .namespace import OER
+
+BATCH_SIZE = 10000
+
+# Bytes of the database file each connection maps into memory, shared
+# through the page cache by every process reading the same store
+MMAP_SIZE = 1 << 30
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS terms (
+        id INTEGER PRIMARY KEY,
+        kind INTEGER NOT NULL,
+        value TEXT NOT NULL,
+        extra TEXT NOT NULL,
+        UNIQUE (kind, value, extra)
+    );
+    CREATE TABLE IF NOT EXISTS triples (
+        s INTEGER NOT NULL,
+        p INTEGER NOT NULL,
+        o INTEGER NOT NULL,
+        PRIMARY KEY (s, p, o)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+    CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+    CREATE TABLE IF NOT EXISTS namespaces (
+        prefix TEXT PRIMARY KEY,
+        uri TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sources (
+        checksum BLOB PRIMARY KEY
+    );
+    CREATE TABLE IF NOT EXISTS generation (
+        value INTEGER NOT NULL
+    );
+"""
+
+SELECT_TRIPLES = """
+    SELECT s.kind, s.value, s.extra, p.kind, p.value, p.extra, o.kind, o.value, o.extra
+    FROM triples t
+    JOIN terms s ON s.id = t.s
+    JOIN terms p ON p.id = t.p
+    JOIN terms o ON o.id = t.o
+"""
+
+TERM_ID = "(SELECT id FROM terms WHERE kind = ? AND value = ? AND extra = ?)"
+
+# Term ids passed to a query as one JSON array parameter
+IDS = "(SELECT value FROM json_each(?))"
+
+# Whether the subject {0} is a learning material: it has a course and a title
+IS_MATERIAL = """
+    EXISTS (SELECT 1 FROM triples course WHERE course.s = {0} AND course.p = ?)
+    AND EXISTS (SELECT 1 FROM triples title WHERE title.s = {0} AND title.p = ?)
+"""
+
+# Materials decoded by one query
+CHUNK_SIZE = 1000
+
+
+class SQLiteStore(Store):
+    """rdflib store keeping the triples in a SQLite database file.
+
+    Terms are stored once and triples as three term ids, indexed in the
+    spo, pos and osp orders, so triple patterns are answered from the
+    file without loading the graph. Every thread gets its own connection,
+    the database runs in WAL mode and is memory-mapped, so many threads
+    and processes can read one store while it is being written. Changes
+    are visible to others after commit().
+
+    The generation counts the changes made to the store by any process,
+    so readers can tell that results they derived from it are outdated.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+
+    def __init__(self, configuration=None, identifier=None):
+        self.path = None
+        self.__local = threading.local()
+        super().__init__(configuration, identifier)
+
+    def open(self, configuration, create=True):
+        if not create and not os.path.exists(configuration):
+            return NO_STORE
+
+        self.path = configuration
+        self.__local = threading.local()
+        connection = self.__connection()
+        connection.executescript(SCHEMA)
+
+        if connection.execute('SELECT 1 FROM generation').fetchone() is None:
+            connection.execute('INSERT INTO generation VALUES (0)')
+
+        connection.commit()
+
+        return VALID_STORE
+
+    def __connection(self):
+        connection = getattr(self.__local, 'connection', None)
+
+        if connection is None:
+            connection = self.__local.connection = sqlite3.connect(self.path)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+
+        return connection
+
+    def close(self, commit_pending_transaction=False):
+        connection = getattr(self.__local, 'connection', None)
+
+        if connection is not None:
+            if commit_pending_transaction:
+                connection.commit()
+            connection.close()
+            self.__local.connection = None
+
+    def commit(self):
+        self.__connection().commit()
+
+    def rollback(self):
+        self.__connection().rollback()
+
+    def __id(self, connection, term, ids):
+        term_id = ids.get(term)
+
+        if term_id is None:
+            encoded = encode_term(term)
+            connection.execute(
+                'INSERT OR IGNORE INTO terms (kind, value, extra) VALUES (?, ?, ?)', encoded)
+            term_id = ids[term] = connection.execute(
+                'SELECT id FROM terms WHERE kind = ? AND value = ? AND extra = ?', encoded).fetchone()[0]
+
+        return term_id
+
+    def add(self, triple, context, quoted=False):
+        self.addN([(*triple, context)])
+
+    def addN(self, quads):
+        connection = self.__connection()
+        ids = {}
+        rows = []
+
+        for s, p, o, _ in quads:
+            rows.append((self.__id(connection, s, ids), self.__id(connection, p, ids),
+                         self.__id(connection, o, ids)))
+
+            if len(rows) >= BATCH_SIZE:
+                connection.executemany('INSERT OR IGNORE INTO triples VALUES (?, ?, ?)', rows)
+                rows = []
+
+        if rows:
+            connection.executemany('INSERT OR IGNORE INTO triples VALUES (?, ?, ?)', rows)
+
+    def __where(self, pattern):
+        clauses = []
+        params = []
+
+        for column, term in zip('spo', pattern):
+            if term is not None:
+                clauses.append(f't.{column} = {TERM_ID}')
+                params.extend(encode_term(term))
+
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def remove(self, pattern, context=None):
+        where, params = self.__where(pattern)
+
+        self.__connection().execute('DELETE FROM triples AS t' + where, params)
+
+    def triples(self, pattern, context=None):
+        where, params = self.__where(pattern)
+
+        for row in self.__connection().execute(SELECT_TRIPLES + where, params):
+            yield (decode_term(*row[0:3]), decode_term(*row[3:6]), decode_term(*row[6:9])), iter(())
+
+    def __len__(self, context=None):
+        return self.__connection().execute('SELECT COUNT(*) FROM triples').fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        current = self.namespace(prefix)
+
+        if current is not None and (not override or current == URIRef(str(namespace))):
+            # every library binds its prefixes when opened, which must not
+            # leave a write transaction open for other processes to wait on
+            return
+
+        connection = self.__connection()
+        pending = connection.in_transaction
+
+        connection.execute('DELETE FROM namespaces WHERE uri = ?', (str(namespace),))
+        connection.execute('INSERT OR REPLACE INTO namespaces VALUES (?, ?)',
+                           (prefix, str(namespace)))
+
+        if not pending:
+            connection.commit()
+
+    def execute(self, query, parameters=()):
+        """Run a read query on the connection of the calling thread
+        """
+        return self.__connection().execute(query, parameters)
+
+    def namespace(self, prefix):
+        row = self.__connection().execute(
+            'SELECT uri FROM namespaces WHERE prefix = ?', (prefix,)).fetchone()
+
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        row = self.__connection().execute(
+            'SELECT prefix FROM namespaces WHERE uri = ?', (str(namespace),)).fetchone()
+
+        return row[0] if row else None
+
+    def namespaces(self):
+        for prefix, uri in self.__connection().execute('SELECT prefix, uri FROM namespaces'):
+            yield prefix, URIRef(uri)
+
+    def loaded(self, checksum):
+        """Whether the store holds the source file with this checksum
+        """
+        return self.__connection().execute(
+            'SELECT 1 FROM sources WHERE checksum = ?', (checksum,)).fetchone() is not None
+
+    def mark_loaded(self, checksum):
+        """Remember the source file the store now holds, in place of the previous one
+        """
+        connection = self.__connection()
+        connection.execute('DELETE FROM sources')
+        connection.execute('INSERT INTO sources VALUES (?)', (checksum,))
+
+    def generation(self):
+        """Number of changes committed to the store so far
+        """
+        return self.__connection().execute('SELECT value FROM generation').fetchone()[0]
+
+    def advance(self):
+        """Count a change, committed together with it
+        """
+        self.__connection().execute('UPDATE generation SET value = value + 1')
+
+
+class StoreIndex:
+    """KnowledgeIndex over a SQLiteStore, answering the same methods with
+    SQL over the term ids instead of holding the catalog in memory. The
+    store is read on every call, so the answers follow changes made by
+    other processes. Materials are decoded the first time they are
+    returned and remembered with their ids.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.__predicates = {}
+        self.__decoded = {}
+        self.__found = {}
+
+    def __term(self, term):
+        row = self.store.execute('SELECT id FROM terms WHERE kind = ? AND value = ? AND extra = ?',
+                                 encode_term(term)).fetchone()
+
+        return row[0] if row else None
+
+    def __predicate(self, predicate):
+        # ids never change once stored, unknown predicates may still be added
+        found = self.__predicates.get(predicate)
+
+        if found is None:
+            found = self.__term(predicate)
+            if found is not None:
+                self.__predicates[predicate] = found
+
+        return -1 if found is None else found
+
+    def __material(self, subject='t.s'):
+        """SQL condition and parameters telling learning materials apart
+        """
+        return IS_MATERIAL.format(subject), [self.__predicate(OER.forCourse), self.__predicate(RDFS.label)]
+
+    def __nodes(self, ids):
+        missing = [number for number in ids if number not in self.__decoded]
+
+        for start in range(0, len(missing), CHUNK_SIZE):
+            chunk = json.dumps(missing[start:start + CHUNK_SIZE])
+
+            for number, *term in self.store.execute(
+                    f'SELECT id, kind, value, extra FROM terms WHERE id IN {IDS}', (chunk,)):
+                material = self.__decoded[number] = decode_term(*term)
+                self.__found[material] = number
+
+        return [self.__decoded[number] for number in ids]
+
+    def __ids(self, materials):
+        """Ids of the given materials, skipping nodes which are not stored
+        """
+        result = []
+
+        for material in materials:
+            number = self.__found.get(material)
+
+            if number is None:
+                number = self.__term(material)
+                if number is None:
+                    continue
+                self.__decoded[number] = material
+                self.__found[material] = number
+
+            result.append(number)
+
+        return json.dumps(result)
+
+    def __values(self, query, parameters):
+        """Decoded values of the rows (value id, ...) of a query, in the same order
+        """
+        rows = self.store.execute(query, parameters).fetchall()
+
+        if not rows:
+            return []
+
+        ids = json.dumps(sorted({row[0] for row in rows}))
+        terms = {number: decode_term(*term) for number, *term in self.store.execute(
+            f'SELECT id, kind, value, extra FROM terms WHERE id IN {IDS}', (ids,))}
+
+        return [(terms[row[0]],) + tuple(row[1:]) for row in rows]
+
+    def __all_values(self, name):
+        """(value, number of materials) pairs of all values of a facet, sorted by value
+        """
+        condition, parameters = self.__material()
+
+        return sorted(self.__values(
+            f'SELECT t.o, COUNT(*) FROM triples t WHERE t.p = ? AND {condition} GROUP BY t.o',
+            [self.__predicate(FACETS[name])] + parameters))
+
+    def __age_ids(self, low, high):
+        """Ids of the stored age ranges overlapping low-high
+        """
+        ids = []
+
+        for value, number in self.__values('SELECT DISTINCT o, o FROM triples WHERE p = ?',
+                                           (self.__predicate(FACETS['age']),)):
+            interval = age_range(value)
+
+            if interval is not None and interval[0] <= high and interval[1] >= low:
+                ids.append(number)
+
+        return ids
+
+    def __matching(self, ids, name):
+        return f'SELECT s FROM triples WHERE p = ? AND o IN {IDS}', [self.__predicate(FACETS[name]), json.dumps(ids)]
+
+    def ages(self, low, high=None):
+        """Return the materials whose age range contains the age low, or
+        overlaps the range low-high when given
+        """
+        query, parameters = self.__matching(self.__age_ids(low, low if high is None else high), 'age')
+
+        return set(self.__nodes([row[0] for row in self.store.execute(query, parameters)]))
+
+    def match(self, user_data):
+        """Return the set of materials matching every filter set in the
+        user data, as KnowledgeIndex.match does
+        """
+        condition, parameters = self.__material('m.s')
+        query = f'SELECT m.s FROM triples m WHERE m.p = ? AND {condition}'
+        parameters = [self.__predicate(OER.forCourse)] + parameters
+
+        for name in FACETS:
+            value = user_data.get(name)
+
+            if not value:
+                continue
+
+            if value == NON_SPECIFIC:
+                query += ' EXCEPT SELECT s FROM triples WHERE p = ?'
+                parameters.append(self.__predicate(FACETS[name]))
+                continue
+
+            number = self.__term(Literal(value))
+            interval = age_range(value) if name == 'age' else None
+
+            if number is not None and self.store.execute(
+                    'SELECT 1 FROM triples WHERE p = ? AND o = ? LIMIT 1',
+                    (self.__predicate(FACETS[name]), number)).fetchone():
+                ids = [number]
+            elif interval is not None:
+                ids = self.__age_ids(*interval)
+            else:
+                return set()
+
+            matching, more = self.__matching(ids, name)
+            query += ' INTERSECT ' + matching
+            parameters += more
+
+        return set(self.__nodes([row[0] for row in self.store.execute(query, parameters)]))
+
+    def __rows(self, ids):
+        """material id -> sorted (course, title) pairs of the materials
+        """
+        found = {}
+        rows = self.store.execute(f"""
+            SELECT t.s, c.kind, c.value, c.extra, l.kind, l.value, l.extra
+            FROM triples t
+            JOIN terms c ON c.id = t.o
+            JOIN triples lt ON lt.s = t.s AND lt.p = ?
+            JOIN terms l ON l.id = lt.o
+            WHERE t.p = ? AND t.s IN {IDS}
+        """, (self.__predicate(RDFS.label), self.__predicate(OER.forCourse), ids))
+
+        for number, *terms in rows:
+            found.setdefault(number, []).append((decode_term(*terms[0:3]), decode_term(*terms[3:6])))
+
+        return {number: sorted(pairs) for number, pairs in found.items()}
+
+    def rows(self, materials, ordered=False):
+        """Return (material, course, title) rows ordered by material, or in
+        the given order when ordered, skipping nodes which are not learning
+        materials (e.g. courses)
+        """
+        return list(self.iter_rows(materials if ordered else sorted(materials, key=str)))
+
+    def iter_rows(self, materials):
+        """Lazily yield the rows of the materials in the given order, reading
+        them from the store CHUNK_SIZE materials at a time
+        """
+        materials = list(materials)
+
+        for start in range(0, len(materials), CHUNK_SIZE):
+            chunk = materials[start:start + CHUNK_SIZE]
+            found = self.__rows(self.__ids(chunk))
+
+            for material in chunk:
+                for row in found.get(self.__found.get(material), ()):
+                    yield (material,) + row
+
+    def total(self, materials):
+        """Number of rows the materials make up, without building them
+        """
+        return self.store.execute(f"""
+            SELECT COUNT(*)
+            FROM triples t
+            JOIN triples l ON l.s = t.s AND l.p = ?
+            WHERE t.p = ? AND t.s IN {IDS}
+        """, (self.__predicate(RDFS.label), self.__predicate(OER.forCourse),
+              self.__ids(materials))).fetchone()[0]
+
+    def values(self, name, materials=None, non_specific=False):
+        """List the distinct values of a facet among the given materials
+        (all materials when omitted), optionally prefixed by "Non-specific"
+        when some of them have no value at all.
+        """
+        predicate = self.__predicate(FACETS[name])
+
+        if materials is None:
+            result = [value for value, count in self.__all_values(name)]
+            condition, parameters = self.__material('m.s')
+            missing = self.store.execute(
+                f'SELECT 1 FROM triples m WHERE m.p = ? AND {condition} AND NOT EXISTS '
+                '(SELECT 1 FROM triples t WHERE t.s = m.s AND t.p = ?) LIMIT 1',
+                [self.__predicate(OER.forCourse)] + parameters + [predicate]).fetchone()
+        else:
+            ids = self.__ids(materials)
+            condition, parameters = self.__material('m.value')
+            result = sorted(value for value, in self.__values(
+                f'SELECT DISTINCT t.o FROM triples t WHERE t.p = ? AND t.s IN {IDS}', (predicate, ids)))
+            missing = self.store.execute(
+                f'SELECT 1 FROM json_each(?) m WHERE {condition} AND NOT EXISTS '
+                '(SELECT 1 FROM triples t WHERE t.s = m.value AND t.p = ?) LIMIT 1',
+                [ids] + parameters + [predicate]).fetchone()
+
+        if non_specific and missing:
+            result.insert(0, NON_SPECIFIC)
+
+        return result
+
+    def counts(self, materials, names=FACETS):
+        """Count how many of the materials have each value of the given
+        facets, as KnowledgeIndex.counts does
+        """
+        ids = self.__ids(materials)
+        counts = {}
+
+        for name in names:
+            predicate = self.__predicate(FACETS[name])
+            counter = Counter(dict(self.__values(
+                f'SELECT t.o, COUNT(*) FROM triples t WHERE t.p = ? AND t.s IN {IDS} GROUP BY t.o',
+                (predicate, ids))))
+            missing = self.store.execute(
+                'SELECT COUNT(*) FROM json_each(?) m WHERE NOT EXISTS '
+                '(SELECT 1 FROM triples t WHERE t.s = m.value AND t.p = ?)', (ids, predicate)).fetchone()[0]
+
+            if missing:
+                counter[NON_SPECIFIC] = missing
+
+            counts[name] = counter
+
+        return counts
+
+    def value_counts(self, name):
+        """(value, number of materials) pairs of all values of a facet
+        """
+        return self.__all_values(name)
+
+    def described(self, materials, names=FACETS):
+        """material -> values of each of the given facets, for many materials at once
+        """
+        materials = list(materials)
+        ids = self.__ids(materials)
+        result = {material: [[] for name in names] for material in materials}
+
+        for i, name in enumerate(names):
+            for value, number in self.__values(
+                    f'SELECT t.o, t.s FROM triples t WHERE t.p = ? AND t.s IN {IDS}',
+                    (self.__predicate(FACETS[name]), ids)):
+                result[self.__decoded[number]][i].append(value)
+
+        return result
+
+    def refresh(self, graph, materials):
+        """Nothing to do, every call reads the store
+        """
@@ -0,0 +1,50 @@
+import re
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.plugins.parsers.ntriples import unquote
+
+IRI = r'<[^>]*>'
+NODE = r'(' + IRI + r'|_:\S*[^\s.])'
+TERM = r'(' + IRI + r'|_:\S*[^\s.]|"(?:[^"\\]|\\.)*"(?:@[a-zA-Z0-9-]+|\^\^<[^>]*>)?)'
+
+# subject, predicate, object and the optional graph name of N-Quads
+LINE = re.compile(r'\s*' + NODE + r'\s+(' + IRI + r')\s+' + TERM +
+                  r'(?:\s+' + NODE + r')?\s*\.\s*(?:#.*)?$')
+
+LITERAL = re.compile(r'"((?:[^"\\]|\\.)*)"(?:@([a-zA-Z0-9-]+)|\^\^<([^>]*)>)?$')
+
+
+def __term(text):
+    if text[0] == '<':
+        return URIRef(unquote(text[1:-1]))
+    if text[0] == '_':
+        return BNode(text[2:])
+
+    value, lang, datatype = LITERAL.match(text).groups()
+
+    return Literal(unquote(value), lang=lang,
+                   datatype=URIRef(unquote(datatype)) if datatype else None)
+
+
+def read(file):
+    """Yield the triples of an N-Triples or N-Quads stream line by line.
+
+    Unlike the rdflib parsers, blank node labels are kept as they are,
+    since materials and courses are identified by them. The graph name of
+    N-Quads lines is ignored.
+    """
+    for number, line in enumerate(file, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        match = LINE.match(line)
+        if match is None:
+            raise ValueError(f'Invalid N-Triples line {number}: {line}')
+
+        subject, predicate, object, _ = match.groups()
+
+        yield (__term(subject), __term(predicate), __term(object))
@@ -0,0 +1,200 @@
+import math
+import re
+
+from rdflib.namespace import RDFS, SDO
+
+from .namespace import OER
+
+# Indexed predicates and the weight of a match in each of them
+FIELDS = {
+    RDFS.label: 3.0,
+    SDO.teaches: 2.0,
+    SDO.keywords: 2.0,
+}
+
+# Letters and digits, so snake_case keywords like Python_основи split in words
+WORD = re.compile(r'[^\W_]+')
+
+STOPWORDS = frozenset((
+    'а', 'в', 'във', 'до', 'е', 'за', 'и', 'или', 'как', 'какво', 'към', 'ли',
+    'на', 'не', 'от', 'по', 'при', 'с', 'се', 'след', 'със', 'че',
+))
+
+
+def __article(word):
+    n = len(word)
+
+    if n > 6 and word.endswith('ият'):
+        return word[:-3]
+    if n > 5 and word.endswith(('ът', 'то', 'те', 'та', 'ия')):
+        return word[:-2]
+    if n > 4 and word.endswith('ят'):
+        return word[:-2]
+
+    return word
+
+
+def __plural(word):
+    n = len(word)
+
+    if n > 6:
+        if word.endswith('овци'):
+            return word[:-3]
+        if word.endswith('еве'):
+            return word[:-3] + 'й'
+    if n > 5:
+        if word.endswith('ове'):
+            return word[:-3]
+        if word.endswith('ища'):
+            return word[:-3]
+        if word.endswith('та'):
+            return word[:-2]
+        if word.endswith('ци'):
+            return word[:-2] + 'к'
+        if word.endswith('зи'):
+            return word[:-2] + 'г'
+    if n > 4:
+        if word.endswith('си'):
+            return word[:-2] + 'х'
+        if word.endswith('и'):
+            return word[:-1]
+
+    return word
+
+
+def stem(word):
+    """Light stemmer for Bulgarian (after J. Savoy), stripping the definite
+    article, plural and a few inflectional endings. Words in other scripts
+    are returned as they are.
+    """
+    if len(word) < 4:
+        return word
+
+    if len(word) > 5 and word.endswith('ища'):
+        return word[:-3]
+
+    word = __plural(__article(word))
+
+    if len(word) > 3 and word.endswith(('я', 'а', 'о', 'е', 'и')):
+        word = word[:-1]
+    if len(word) > 4 and word.endswith('ен'):
+        word = word[:-2] + 'н'
+    if len(word) > 4 and word[-2] == 'ъ':
+        word = word[:-2] + word[-1]
+
+    return word
+
+
+def tokens(text):
+    """Split text in lower case, stemmed words, dropping stop words
+    """
+    words = WORD.findall(str(text).lower().replace('ѝ', 'и'))
+
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+def scores(matches, frequencies, documents):
+    """Material -> score of the matches (material -> weight of each query
+    term), given how many of all documents contain each term. Weights are
+    multiplied by inverse document frequency and summed rarest term first.
+    """
+    if not matches:
+        return {}
+
+    order = sorted(range(len(frequencies)), key=lambda i: frequencies[i])
+    idf = [math.log(1 + documents / frequencies[i]) if frequencies[i] else 0.0
+           for i in range(len(frequencies))]
+    result = {}
+
+    for material, weights in matches.items():
+        score = 0.0
+        for i in order:
+            score += weights[i] * idf[i]
+        result[material] = score
+
+    return result
+
+
+class TextIndex:
+    """Inverted index over the labels, concepts and keywords of the materials.
+
+    Every stemmed term maps to the materials containing it together with
+    the summed weight of the fields it occurs in. Queries match materials
+    containing all of their terms and are ranked by weight times inverse
+    document frequency.
+    """
+
+    def __init__(self, graph=None):
+        self.postings = {}
+        self.terms_of = {}
+
+        if graph is None:
+            return
+
+        for material in set(graph.subjects(OER.forCourse)):
+            self.__add(graph, material)
+
+    def __add(self, graph, material):
+        weights = {}
+
+        for predicate, weight in FIELDS.items():
+            terms = set()
+            for value in graph.objects(material, predicate):
+                terms.update(tokens(value))
+
+            for term in terms:
+                weights[term] = weights.get(term, 0.0) + weight
+
+        if not weights:
+            return
+
+        self.terms_of[material] = set(weights)
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[material] = weight
+
+    def refresh(self, graph, materials):
+        """Re-read the given materials from the graph, leaving the rest of
+        the index untouched
+        """
+        for material in materials:
+            for term in self.terms_of.pop(material, ()):
+                posting = self.postings[term]
+                posting.pop(material, None)
+
+                if not posting:
+                    del self.postings[term]
+
+            if (material, OER.forCourse, None) in graph:
+                self.__add(graph, material)
+
+    def frequencies(self, terms):
+        """Number of materials containing each of the terms, and of all
+        indexed materials
+        """
+        return [len(self.postings.get(term, ())) for term in terms], len(self.terms_of)
+
+    def matches(self, terms):
+        """Material -> weight of each of the terms, for the materials
+        containing all of them
+        """
+        postings = [self.postings.get(term, {}) for term in terms]
+        matches = {}
+
+        for material in min(postings, key=len, default=()):
+            weights = [posting.get(material) for posting in postings]
+
+            if None not in weights:
+                matches[material] = weights
+
+        return matches
+
+    def search(self, query):
+        """Return material -> score for the materials matching every term
+        of the query, or None when the query has no terms at all
+        """
+        terms = sorted(set(tokens(query or '')))
+
+        if not terms:
+            return None
+
+        return scores(self.matches(terms), *self.frequencies(terms))
@@ -0,0 +1,3 @@
+from rdflib import Namespace
+
+OER = Namespace("http://oerschema.org/")
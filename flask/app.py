@@ -1,43 +1,169 @@
 import os
 
-from flask import Flask, request
+from flask import Flask, g, jsonify, request, send_file
 from flask import render_template
 
 from ..edu_graph import KnowledgeLibrary
 from ..edu_graph import KnowledgeApi
+from ..edu_graph import SearchFilters
+from ..edu_graph.knowledge_metrics import metrics
+from ..edu_graph.knowledge_reload import Catalog, CatalogWatcher
 
 app = Flask(__name__)
 
 
 dirname = os.path.dirname(__file__)
 filename = os.path.join(dirname, 'static/rdf.json')
+# Facet bundle of the graph file, written by the bundle or sync --bundle command
+bundle_filename = os.path.join(dirname, 'static/rdf.json.bundle')
 
-library = KnowledgeLibrary()
-library.load(filename, "json-ld")
-api = KnowledgeApi(library)
+# Shared read-only by all request threads, filters are passed per call.
+# The graph file is watched and reloaded in the background when it changes.
+# With EDU_GRAPH_STORE set the graph is kept in that SQLite store, built
+# from the file on first start, instead of in the memory of every worker,
+# and updated in place with the sync command instead of being reloaded.
+# With EDU_GRAPH_COMPACT set every worker maps the same compact file
+# (static/rdf.json.compact) instead of holding its own graph.
+if os.environ.get('EDU_GRAPH_STORE'):
+    watcher = None
+    library = KnowledgeLibrary(store=os.environ['EDU_GRAPH_STORE'])
+    library.load(filename, "json-ld")
+    library.recommender()
+    __stored = Catalog(library, KnowledgeApi(library), os.stat(filename).st_mtime_ns)
+else:
+    watcher = CatalogWatcher(filename, "json-ld", compact=bool(os.environ.get('EDU_GRAPH_COMPACT'))).start()
+
+# Materials per page of results
+PAGE_SIZE = 50
+
+# Changes whenever the page template or its script does, see __etag
+__release = '{:x}'.format(max(os.stat(os.path.join(dirname, name)).st_mtime_ns
+                              for name in ('templates/index.html', 'static/facets.js')))
+
+
+@app.before_request
+def __catalog():
+    """Pin the current catalog for the whole request, a reload swaps in a
+    new one for the next requests only
+    """
+    g.catalog = watcher.current if watcher is not None else __stored
+
+
+def __filters():
+    return SearchFilters(
+        age=request.args.get('age', None),
+        topic=request.args.get('topic', None),
+        language=request.args.get('language', None),
+        edu_level=request.args.get('edu_level', None),
+        concept=request.args.get('concept', None),
+        query=request.args.get('q', None),
+    )
+
+
+def __etag():
+    """Responses only depend on the request and the graph, so the graph
+    file and library version identify them for a given URL
+    """
+    return f'{__release}-{g.catalog.mtime:x}-{g.catalog.library.version}'
+
+
+def __conditional(build):
+    """Answer 304 when the client has the current version, build the response otherwise
+    """
+    etag = __etag()
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build())
+
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+
+    return response
+
+
+def __limit():
+    return max(1, min(request.args.get('limit', PAGE_SIZE, type=int), 1000))
 
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
+    return __conditional(__index)
+
 
-    api.set_age(request.args.get('age', None))
-    api.set_topic(request.args.get('topic', None))
-    api.set_lang(request.args.get('language', None))
-    api.set_education(request.args.get('edu_level', None))
-    api.set_concept(request.args.get('concept', None))
+def __index():
+    filters = __filters()
     material = request.args.get('material', None)
+    cursor = request.args.get('cursor', None)
+
+    api = g.catalog.api
+    facets = api.facets(limit=__limit(), cursor=cursor, filters=filters)
 
     return render_template(
         'index.html',
-        user=api.user_data,
+        user=filters,
         formdata={
-            "ages": api.list_ages(),
-            "topics": api.list_topics(),
-            "concepts": api.list_concepts(),
-            "languages": api.list_languages(),
-            "educations": api.list_educations(),
+            "ages": facets["ages"],
+            "topics": facets["topics"],
+            "concepts": facets["concepts"],
+            "languages": facets["languages"],
+            "educations": facets["educations"],
         },
         material=material,
-        results=api.search(),
-        deps=api.search_deps(material)
+        cursor=cursor,
+        results=facets["results"],
+        deps=api.search_deps(material),
+        recommendations=api.recommend(material),
     )
+
+
+@app.route('/api/search')
+def search():
+    return __conditional(__search)
+
+
+def __search():
+    page = g.catalog.api.search(limit=__limit(), cursor=request.args.get('cursor', None), filters=__filters())
+
+    return jsonify({
+        "total": page.total,
+        "cursor": page.cursor,
+        "results": [{"id": item[0], "title": item[2], "course": item[1]} for item in page],
+    })
+
+
+@app.route('/api/bundle')
+def bundle():
+    """The facet bundle static/facets.js filters with in the browser, sent
+    from its file with an ETag of its own. A bundle older than the graph
+    file is not sent, the page is then filtered by the server.
+    """
+    try:
+        if os.stat(bundle_filename).st_mtime_ns < g.catalog.mtime:
+            return app.response_class(status=404)
+    except FileNotFoundError:
+        return app.response_class(status=404)
+
+    response = send_file(bundle_filename, mimetype='application/json', conditional=True, etag=True)
+    response.cache_control.no_cache = True
+
+    return response
+
+
+@app.route('/metrics')
+def query_metrics():
+    cache = g.catalog.library.cache.stats()
+    reloads = watcher.reloads if watcher is not None else 0
+
+    return app.response_class(metrics.prometheus() + "\n".join([
+        "# HELP edu_graph_cache_hits_total Query results served from the cache",
+        "# TYPE edu_graph_cache_hits_total counter",
+        f"edu_graph_cache_hits_total {cache['hits']}",
+        "# HELP edu_graph_cache_misses_total Query results computed on a cache miss",
+        "# TYPE edu_graph_cache_misses_total counter",
+        f"edu_graph_cache_misses_total {cache['misses']}",
+        "# HELP edu_graph_catalog_reloads_total Times the graph file was reloaded after a change",
+        "# TYPE edu_graph_catalog_reloads_total counter",
+        f"edu_graph_catalog_reloads_total {reloads}",
+    ]) + "\n", mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,451 @@
+/*
+ * Filters the catalog in the browser. The facet bundle of /api/bundle is
+ * fetched once per catalog version, then searches, facet counts,
+ * prerequisites and recommendations are computed from it and rendered the
+ * same way as templates/index.html, without a request per change. Full-text
+ * searches (q) are still answered by the server.
+ */
+(function () {
+  'use strict';
+
+  var NON_SPECIFIC = 'Non-specific';
+  var FACETS = ['age', 'topic', 'language', 'edu_level', 'concept'];
+  var PARAMS = ['q', 'age', 'topic', 'language', 'edu_level', 'concept', 'cursor', 'material', 'limit'];
+  var AGE = /^\s*(\d+)\s*(?:(-)\s*(\d+)?|(\+))?\s*$/;
+
+  var section = document.getElementById('catalog');
+
+  if (!section || !window.fetch || !window.history.pushState) {
+    return;
+  }
+
+  function escape(value) {
+    return String(value).replace(/[&<>"']/g, function (c) {
+      return { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&#34;', "'": '&#39;' }[c];
+    });
+  }
+
+  function ageRange(value) {
+    var match = AGE.exec(value);
+
+    if (!match) {
+      return null;
+    }
+    if (match[3] !== undefined) {
+      return [+match[1], +match[3]];
+    }
+    return [+match[1], match[2] || match[4] ? Infinity : +match[1]];
+  }
+
+  // Positions of a set stored as a base64 bitmap or a list, see knowledge_bundle.encode
+  function positions(set) {
+    if (typeof set !== 'string') {
+      return set;
+    }
+
+    var raw = atob(set);
+    var result = [];
+
+    for (var i = 0; i < raw.length; i++) {
+      for (var byte = raw.charCodeAt(i), bit = 0; byte; byte >>= 1, bit++) {
+        if (byte & 1) {
+          result.push(i * 8 + bit);
+        }
+      }
+    }
+    return result;
+  }
+
+  function Catalog(bundle) {
+    var self = this;
+
+    this.bundle = bundle;
+    this.count = bundle.materials.length;
+    this.position = {};
+    this.sets = {};
+    this.valuesOf = {};
+    this.ageTotals = [];
+
+    bundle.materials.forEach(function (material, i) {
+      self.position[material] = i;
+    });
+
+    FACETS.forEach(function (name) {
+      var facet = bundle.facets[name];
+      var valuesOf = self.valuesOf[name] = new Array(self.count);
+
+      self.sets[name] = facet.sets.map(function (set, value) {
+        var found = positions(set);
+
+        found.forEach(function (i) {
+          (valuesOf[i] = valuesOf[i] || []).push(value);
+        });
+        if (name === 'age') {
+          self.ageTotals.push(found.length);
+        }
+        return self.bitmap(found);
+      });
+      self.sets[name].missing = self.bitmap(positions(facet.missing));
+    });
+  }
+
+  Catalog.prototype.bitmap = function (found) {
+    var bits = new Uint8Array((this.count + 7) >> 3);
+
+    found.forEach(function (i) {
+      bits[i >> 3] |= 1 << (i & 7);
+    });
+    return bits;
+  };
+
+  Catalog.prototype.lookup = function (name, value) {
+    var facet = this.bundle.facets[name];
+    var sets = this.sets[name];
+
+    if (value === NON_SPECIFIC) {
+      return sets.missing;
+    }
+
+    var i = facet.values.indexOf(value);
+
+    if (i >= 0) {
+      return sets[i];
+    }
+
+    var interval = name === 'age' ? ageRange(value) : null;
+    var result = new Uint8Array((this.count + 7) >> 3);
+
+    if (interval) {
+      // every stored range overlapping the age or range
+      this.bundle.ages.forEach(function (range, i) {
+        var high = range && (range[1] === null ? Infinity : range[1]);
+
+        if (range && range[0] <= interval[1] && high >= interval[0]) {
+          for (var j = 0; j < result.length; j++) {
+            result[j] |= sets[i][j];
+          }
+        }
+      });
+    }
+    return result;
+  };
+
+  // Sorted positions of the materials matching every filter, as KnowledgeIndex.match
+  Catalog.prototype.match = function (filters) {
+    var bits = null;
+    var self = this;
+
+    FACETS.forEach(function (name) {
+      if (!filters[name]) {
+        return;
+      }
+
+      var set = self.lookup(name, filters[name]);
+
+      if (bits === null) {
+        bits = set.slice();
+      } else {
+        for (var j = 0; j < bits.length; j++) {
+          bits[j] &= set[j];
+        }
+      }
+    });
+
+    var result = [];
+
+    for (var i = 0; i < this.count; i++) {
+      if (bits === null || bits[i >> 3] & (1 << (i & 7))) {
+        result.push(i);
+      }
+    }
+    return result;
+  };
+
+  // (value, count) pairs of a facet among the materials, as KnowledgeApi.facets
+  Catalog.prototype.counted = function (name, materials, nonSpecific) {
+    var values = this.bundle.facets[name].values;
+    var valuesOf = this.valuesOf[name];
+    var counts = new Array(values.length).fill(0);
+    var missing = 0;
+
+    materials.forEach(function (i) {
+      if (valuesOf[i]) {
+        valuesOf[i].forEach(function (value) {
+          counts[value]++;
+        });
+      } else {
+        missing++;
+      }
+    });
+
+    var result = [];
+
+    values.forEach(function (value, i) {
+      if (counts[i]) {
+        result.push([value, counts[i]]);
+      }
+    });
+    if (nonSpecific && missing) {
+      result.unshift([NON_SPECIFIC, missing]);
+    }
+    return result;
+  };
+
+  Catalog.prototype.rows = function (materials) {
+    var bundle = this.bundle;
+    var result = [];
+
+    materials.forEach(function (i) {
+      bundle.rows[i].forEach(function (row) {
+        result.push([bundle.materials[i], row[0], row[1]]);
+      });
+    });
+    return result;
+  };
+
+  // The material and everything it requires, as KnowledgeApi.search_deps
+  Catalog.prototype.deps = function (material) {
+    var start = material ? this.position[material.trim()] : undefined;
+
+    if (start === undefined) {
+      return [];
+    }
+
+    var seen = {};
+    var stack = [start];
+
+    seen[start] = true;
+    while (stack.length) {
+      this.bundle.requires[stack.pop()].forEach(function (dep) {
+        if (!seen[dep]) {
+          seen[dep] = true;
+          stack.push(dep);
+        }
+      });
+    }
+
+    return this.rows(Object.keys(seen).map(Number).sort(function (a, b) {
+      return a - b;
+    }));
+  };
+
+  Catalog.prototype.recommend = function (material) {
+    var i = material ? this.position[material.trim()] : undefined;
+
+    if (i === undefined) {
+      return { similar: [], next: [] };
+    }
+    return { similar: this.rows(this.bundle.similar[i]), next: this.rows(this.bundle.next[i]) };
+  };
+
+  Catalog.prototype.page = function (params) {
+    var materials = this.match(params);
+    var limit = Math.max(1, Math.min(parseInt(params.limit, 10) || 50, 1000));
+    var bundle = this.bundle;
+    var after = materials.filter(function (i) {
+      return !params.cursor || bundle.materials[i] > params.cursor;
+    });
+    var total = 0;
+
+    materials.forEach(function (i) {
+      total += bundle.rows[i].length;
+    });
+
+    var results = this.rows(after.slice(0, limit));
+
+    results.total = total;
+    results.cursor = after.length > limit ? bundle.materials[after[limit - 1]] : null;
+
+    return {
+      ages: this.bundle.facets.age.values.map(function (value, i) {
+        return [value, this.ageTotals[i]];
+      }, this),
+      topics: this.counted('topic', materials, false),
+      languages: this.counted('language', materials, true),
+      concepts: this.counted('concept', materials, true),
+      educations: this.counted('edu_level', materials, true),
+      results: results
+    };
+  };
+
+  function url(params) {
+    var query = new URLSearchParams();
+
+    PARAMS.forEach(function (name) {
+      if (params[name]) {
+        query.set(name, params[name]);
+      }
+    });
+
+    var search = query.toString();
+
+    return '/' + (search ? '?' + search : '');
+  }
+
+  function lower(value) {
+    return (value || '').toLowerCase();
+  }
+
+  function select(id, label, name, values, params, extra) {
+    var html = '<div class="row mb-3">' +
+      '<label for="' + id + '" class="col-sm-4 col-form-label" aria-required="true">' + label + '</label>' +
+      '<div class="col-sm-8"><select id="' + id + '" class="form-select" name="' + name + '" required>';
+
+    if (extra) {
+      html += '<option value="' + escape(params[name]) + '" selected>' + escape(params[name]) + '</option>';
+    }
+    values.forEach(function (item) {
+      html += '<option value="' + escape(item[0]) + '"' +
+        (lower(params[name]) === lower(item[0]) ? ' selected' : '') + '>' +
+        escape(item[0]) + ' (' + item[1] + ')</option>';
+    });
+
+    return html + '</select></div></div>';
+  }
+
+  function list(title, badge, rows, params, link) {
+    var html = '<h3>' + title + (badge ? ' <span class="badge rounded-pill bg-primary">' + rows.length + '</span>' : '') +
+      '</h3><div class="list-group mb-3">';
+
+    rows.forEach(function (row) {
+      html += '<a href="' + (link ? escape(url(Object.assign({}, params, { material: row[0] }))) : '#') +
+        '" class="list-group-item list-group-item-action">' + escape(row[0]) + ' - ' + escape(row[2]) + '</a>';
+    });
+
+    return html + '</div>';
+  }
+
+  function render(catalog, params) {
+    var facets = catalog.page(params);
+    var results = facets.results;
+    var deps = catalog.deps(params.material);
+    var recommendations = catalog.recommend(params.material);
+    var side = deps.length || recommendations.similar.length || recommendations.next.length;
+    var column = '<div class="col-' + (side ? 4 : 6) + '">';
+    var filters = { q: params.q, age: params.age, topic: params.topic, language: params.language,
+                    edu_level: params.edu_level, concept: params.concept };
+    var html = column + '<h3>Search</h3><form>' +
+      '<div class="row mb-3"><label for="inputQuery" class="col-sm-4 col-form-label">Find</label>' +
+      '<div class="col-sm-8"><input id="inputQuery" class="form-control" type="search" name="q" value="' +
+      escape(params.q || '') + '" placeholder="e.g. кортежи"></div></div>';
+
+    html += select('inputAge', 'Age', 'age', facets.ages, params, params.age &&
+      facets.ages.map(function (item) { return lower(item[0]); }).indexOf(lower(params.age)) < 0);
+    if (params.age) {
+      html += select('inputTopic', 'Topic', 'topic', facets.topics, params);
+    }
+    if (params.topic) {
+      html += select('inputLanguages', 'Languages', 'language', facets.languages, params);
+    }
+    if (params.language) {
+      html += select('inputField', 'Education field', 'edu_level', facets.educations, params);
+    }
+    if (params.edu_level) {
+      html += select('inputConcept', 'Concept', 'concept', facets.concepts, params);
+    }
+    html += '<button type="submit" class="btn btn-primary">Search</button> ' +
+      '<a href="/" type="reset" class="btn btn-danger">Reset</a></form></div>';
+
+    html += column + '<h3>Materials <span class="badge rounded-pill bg-primary">' + results.total +
+      '</span></h3><div class="list-group">';
+    results.forEach(function (row) {
+      html += '<a href="' + escape(url(Object.assign({}, filters, { cursor: params.cursor, material: row[0] }))) +
+        '" class="list-group-item list-group-item-action' +
+        (lower(params.material) === lower(row[0]) ? ' active' : '') + '">' +
+        escape(row[0]) + ' - ' + escape(row[2]) + '</a>';
+    });
+    html += '</div><nav class="mt-3">';
+    if (params.cursor) {
+      html += '<a href="' + escape(url(Object.assign({}, filters, { material: params.material }))) +
+        '" class="btn btn-outline-primary">First</a> ';
+    }
+    if (results.cursor) {
+      html += '<a href="' + escape(url(Object.assign({}, filters, { material: params.material, cursor: results.cursor }))) +
+        '" class="btn btn-outline-primary">Next</a>';
+    }
+    html += '</nav></div>';
+
+    if (side) {
+      var links = Object.assign({}, filters, { cursor: params.cursor });
+
+      html += '<div class="col-4">';
+      if (deps.length) {
+        html += list('Prerequisites', true, deps, links, false);
+      }
+      if (recommendations.next.length) {
+        html += list('Up next', false, recommendations.next, links, true);
+      }
+      if (recommendations.similar.length) {
+        html += list('Similar', false, recommendations.similar, links, true);
+      }
+      html += '</div>';
+    }
+
+    section.innerHTML = html;
+  }
+
+  function parse(search) {
+    var query = new URLSearchParams(search);
+    var params = {};
+
+    query.forEach(function (value, name) {
+      params[name] = value;
+    });
+    return params;
+  }
+
+  fetch(section.dataset.bundle, { credentials: 'same-origin' })
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.statusText);
+      }
+      return response.json();
+    })
+    .then(function (bundle) {
+      var catalog = new Catalog(bundle);
+
+      function show(params, push) {
+        if (params.q) {
+          // full-text searches are ranked by the server
+          window.location.assign(url(params));
+          return;
+        }
+        if (push) {
+          window.history.pushState(null, '', url(params));
+        }
+        render(catalog, params);
+      }
+
+      function submitted(form) {
+        return parse(new URLSearchParams(new FormData(form)).toString());
+      }
+
+      section.addEventListener('change', function (event) {
+        if (event.target.tagName === 'SELECT' && !event.target.form.q.value) {
+          show(submitted(event.target.form), true);
+        }
+      });
+
+      section.addEventListener('submit', function (event) {
+        event.preventDefault();
+        show(submitted(event.target), true);
+      });
+
+      section.addEventListener('click', function (event) {
+        var link = event.target.closest('a');
+
+        if (!link || link.getAttribute('href') === '#' || event.ctrlKey || event.metaKey || event.shiftKey) {
+          return;
+        }
+        event.preventDefault();
+        show(parse(new URL(link.href).search), true);
+      });
+
+      window.addEventListener('popstate', function () {
+        show(parse(window.location.search), false);
+      });
+    })
+    .catch(function () {
+      // without a bundle every change is answered by the server as before
+    });
+})();
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, 'data', 'rdf.json')
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Path of a SQLite store holding the sample catalog
+    """
+    from edu_graph import KnowledgeLibrary
+
+    path = str(tmp_path / 'catalog.sqlite')
+    KnowledgeLibrary(store=path).load(SOURCE, 'json-ld')
+    return path
@@ -0,0 +1,85 @@
+from conftest import SOURCE
+
+
+def test_changing_returned_results_leaves_the_cache_alone():
+    from edu_graph import KnowledgeApi, KnowledgeLibrary, SearchFilters
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    api = KnowledgeApi(library)
+    filters = SearchFilters(age='8-10')
+
+    expected = api.facets(filters=filters)
+    facets = api.facets(filters=filters)
+
+    for value in facets.values():
+        value.clear()
+    facets.clear()
+    api.search(filters=filters).clear()
+    api.list_topics(filters=filters).clear()
+
+    assert api.facets(filters=filters) == expected
+    assert api.search(filters=filters) == expected["results"]
+    assert api.list_topics(filters=filters) == [value for value, count in expected["topics"]]
+
+
+def test_bulk_deps_are_keyed_by_stripped_ids_with_and_without_indexes():
+    from edu_graph import KnowledgeApi, KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    indexed = KnowledgeApi(library).search_deps_bulk([' T5.3', 'T4.1 '])
+
+    library.index = library.prerequisites = None
+    queried = KnowledgeApi(library).search_deps_bulk([' T5.3', 'T4.1 '])
+
+    assert list(indexed) == list(queried) == ['T5.3', 'T4.1']
+    assert indexed == queried
+
+
+def test_prerequisite_changes_invalidate_the_closures_of_dependent_materials():
+    from rdflib import BNode
+    from edu_graph import KnowledgeApi, KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    api = KnowledgeApi(library)
+
+    def deps(node):
+        return {str(row[0]) for row in api.search_deps(node)}
+
+    # T4.1 requires T3.2, cache both closures before changing T3.2
+    assert 'T3.2' in deps('T4.1') and 'T1.1' not in deps('T4.1')
+    assert BNode('T1.1') not in library.prerequisites.closure(BNode('T3.2'))
+
+    library.add_prerequisite(BNode('T3.2'), BNode('T1.1'))
+
+    assert 'T1.1' in deps('T4.1')
+    assert BNode('T1.1') in library.prerequisites.closure(BNode('T4.1'))
+    assert 'T1.1' in {str(row[0]) for row in api.search_deps_bulk(['T4.1'])['T4.1']}
+
+    library.remove_prerequisite(BNode('T3.2'), BNode('T1.1'))
+
+    assert 'T1.1' not in deps('T4.1')
+    assert BNode('T1.1') not in library.prerequisites.closure(BNode('T4.1'))
+
+
+def test_stored_age_ranges_match_exactly_and_other_ranges_by_overlap():
+    from rdflib import Literal
+    from edu_graph import KnowledgeApi, KnowledgeLibrary, SearchFilters
+    from edu_graph.knowledge_index import FACETS
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    api = KnowledgeApi(library)
+
+    def found(age):
+        return {row[0] for row in api.search(filters=SearchFilters(age=age))}
+
+    def stored(age):
+        return set(library.graph.subjects(FACETS['age'], Literal(age)))
+
+    # 58-69 overlaps 58-70, but only its own materials are returned
+    assert found('58-69') == stored('58-69') != stored('58-69') | stored('58-70')
+    assert found('59-69') == stored('58-69') | stored('58-70') | stored('58-71') | stored('58-72')
+    assert found('9-12') == stored('8-10') | stored('10-14')
@@ -0,0 +1,19 @@
+import json
+
+from conftest import SOURCE
+
+
+def test_bundle_command_writes_the_compiled_bundle(tmp_path):
+    from click.testing import CliRunner
+    from edu_graph import KnowledgeLibrary, edu_graph
+    from edu_graph.knowledge_bundle import build
+
+    output = tmp_path / 'rdf.json.bundle'
+    result = CliRunner().invoke(edu_graph, ['--local', 'bundle', SOURCE, str(output), '--format', 'json-ld'])
+
+    assert result.exit_code == 0, result.output
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+
+    assert json.loads(output.read_text(encoding='utf-8')) == json.loads(json.dumps(build(library)))
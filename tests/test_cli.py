@@ -0,0 +1,20 @@
+import json
+
+from conftest import SOURCE
+
+
+def test_batch_search_reports_invalid_lines_and_goes_on():
+    from click.testing import CliRunner
+    from edu_graph import edu_graph
+
+    lines = ['{"lang": ["Python"]}', '{"age": 12}', '[1]', 'not json', '{"age": "8-10", "lang": "Python"}']
+    result = CliRunner().invoke(edu_graph, ['--local', 'search', SOURCE, '--format', 'json-ld', '--batch', '-'],
+                                input='\n'.join(lines) + '\n')
+
+    assert result.exit_code == 0, result.output
+
+    records = [json.loads(line) for line in result.output.splitlines()]
+
+    assert ['error' in record for record in records] == [True, True, True, True, False]
+    assert records[0]["error"] == "lang must be a string"
+    assert records[-1]["results"]
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Loading the CLI, e.g. to talk to a running daemon, must not pay for these
+HEAVY = ('rdflib', 'pandas', 'numpy')
+
+CLI = """
+import edu_graph
+edu_graph.edu_graph(['--help'], standalone_mode=False)
+"""
+
+
+def test_cli_does_not_import_heavy_dependencies():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CLI], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60, check=True)
+
+    # -X importtime lines end with "| <indented module name>"
+    imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if '|' in line}
+
+    assert 'edu_graph' in imported
+    assert not {name for name in imported if name.split('.')[0] in HEAVY}
@@ -0,0 +1,108 @@
+import shutil
+
+import pytest
+
+from conftest import SOURCE
+
+FILTERS = [
+    {},
+    {'age': '8-10'},
+    {'age': '12'},
+    {'age': '18+'},
+    {'age': '9-12', 'topic': 'Програмиране'},
+    {'age': '14-18', 'topic': 'Програмиране', 'language': 'Python'},
+    {'age': '14-18', 'topic': 'Програмиране', 'language': 'Non-specific'},
+    {'age': '14-18', 'language': 'Python', 'edu_level': 'всички', 'concept': 'кортежи'},
+    {'concept': 'Non-specific', 'age': '8-10'},
+    {'language': 'Non-specific'},
+    {'topic': 'nope'},
+    {'query': 'цикли'},
+    {'query': 'кортежи', 'age': '14-18'},
+]
+
+
+def answers(library, filters):
+    from edu_graph import KnowledgeApi, SearchFilters
+
+    api = KnowledgeApi(library)
+    filters = SearchFilters(**filters)
+    page = api.search(limit=5, cursor='T3.1', filters=filters)
+
+    return {
+        'search': api.search(filters=filters),
+        'page': (list(page), page.total, page.cursor),
+        'ages': api.list_ages(),
+        'topics': api.list_topics(filters=filters),
+        'languages': api.list_languages(filters=filters),
+        'concepts': api.list_concepts(filters=filters),
+        'educations': api.list_educations(filters=filters),
+        'all languages': api.list_languages(False),
+        'facets': api.facets(filters=filters),
+    }
+
+
+@pytest.fixture(scope='module')
+def memory():
+    from edu_graph import KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    return library
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_store_answers_as_memory(memory, store, filters):
+    from edu_graph import KnowledgeLibrary
+
+    assert answers(KnowledgeLibrary(store=store), filters) == answers(memory, filters)
+
+
+@pytest.fixture(scope='module')
+def sparql():
+    from edu_graph import KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    # without indexes every answer is queried from the graph
+    library.index = library.prerequisites = None
+    return library
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_sparql_answers_as_memory(memory, sparql, filters):
+    assert answers(sparql, filters) == answers(memory, filters)
+
+
+@pytest.mark.parametrize('material', ['T1.1', 'T3.2', 'T5.3', 'T8.5', 'nope'])
+def test_deps_as_memory(memory, sparql, compact, store, material):
+    from edu_graph import KnowledgeApi, KnowledgeLibrary
+
+    expected = KnowledgeApi(memory).search_deps(material)
+
+    assert KnowledgeApi(sparql).search_deps(material) == expected
+    assert KnowledgeApi(compact).search_deps(material) == expected
+    assert KnowledgeApi(KnowledgeLibrary(store=store)).search_deps(material) == expected
+
+
+@pytest.fixture(scope='module')
+def compact(tmp_path_factory):
+    from edu_graph import KnowledgeLibrary
+
+    source = tmp_path_factory.mktemp('compact') / 'rdf.json'
+    shutil.copy(SOURCE, source)
+
+    library = KnowledgeLibrary()
+    library.load(str(source), 'json-ld', compact=True)
+    return library
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_compact_answers_as_memory(memory, compact, filters):
+    assert answers(compact, filters) == answers(memory, filters)
+
+
+@pytest.mark.parametrize('material', ['T1.1', 'T5.3', 'T8.5'])
+def test_compact_recommends_as_memory(memory, compact, material):
+    from edu_graph import KnowledgeApi
+
+    assert KnowledgeApi(compact).recommend(material) == KnowledgeApi(memory).recommend(material)
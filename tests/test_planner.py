@@ -0,0 +1,67 @@
+import pytest
+from rdflib import BNode
+
+EDGES = [
+    ('T1.2', 'T1.1'),
+    ('T1.10', 'T1.1'),
+    ('T2.1', 'T1.2'),
+    ('T2.1', 'T1.10'),
+    ('T3.1', 'T2.1'),
+    ('T1.9', 'T0.1'),
+    # a cycle, and a material depending on it
+    ('C.1', 'C.2'),
+    ('C.2', 'C.1'),
+    ('T4.1', 'C.1'),
+]
+
+
+@pytest.fixture
+def planner():
+    from edu_graph.knowledge_index import PrerequisiteIndex
+    from edu_graph.knowledge_planner import LearningPlanner
+
+    return LearningPlanner(PrerequisiteIndex(edges=[(BNode(a), BNode(b)) for a, b in EDGES]))
+
+
+def ids(nodes):
+    return [str(node) for node in nodes]
+
+
+def test_nodes_are_ordered_prerequisites_first_with_natural_ties(planner):
+    assert ids(planner.nodes) == ['T0.1', 'T1.1', 'T1.2', 'T1.9', 'T1.10', 'T2.1', 'T3.1',
+                                  'C.1', 'C.2', 'T4.1']
+
+
+def test_plan_lists_the_closure_in_order(planner):
+    assert ids(planner.plan('T3.1')) == ['T1.1', 'T1.2', 'T1.10', 'T2.1', 'T3.1']
+
+
+def test_plan_skips_known_materials_and_what_they_require(planner):
+    assert ids(planner.plan('T3.1', ['T1.2'])) == ['T1.10', 'T2.1', 'T3.1']
+    assert ids(planner.plan('T3.1', ['T2.1'])) == ['T3.1']
+
+
+def test_known_target_needs_no_plan(planner):
+    assert planner.plan('T2.1', ['T2.1']) == []
+    assert planner.plan('T9.9', ['T9.9']) == []
+    assert ids(planner.plan('T9.9')) == ['T9.9']
+
+
+def test_cycles_end_the_plan(planner):
+    assert ids(planner.plan('T4.1')) == ['C.1', 'C.2', 'T4.1']
+    assert ids(planner.plan('T4.1', ['C.2'])) == ['T4.1']
+
+
+def test_profiles_with_the_same_known_materials_share_coverage(planner, monkeypatch):
+    from edu_graph.knowledge_planner import LearningPlanner
+
+    computed = []
+    covered = LearningPlanner._LearningPlanner__covered
+    monkeypatch.setattr(LearningPlanner, '_LearningPlanner__covered',
+                        lambda self, known: computed.append(known) or covered(self, known))
+
+    profiles = [('T3.1', ['T1.2']), ('T2.1', ['T1.2']), ('T3.1', []), ('T4.1', ['T1.2'])]
+    plans = planner.plans(profiles)
+
+    assert len(computed) == 2
+    assert plans == [planner.plan(target, known) for target, known in profiles]
@@ -0,0 +1,72 @@
+import shutil
+import threading
+import time
+
+from conftest import SOURCE
+
+
+def counting(monkeypatch):
+    """Threads a Recommender is built on from now on
+    """
+    from edu_graph import knowledge_recommend
+
+    built = []
+    recommender = knowledge_recommend.Recommender
+
+    def build(library):
+        built.append(threading.current_thread())
+        time.sleep(0.1)
+        return recommender(library)
+
+    monkeypatch.setattr(knowledge_recommend, 'Recommender', build)
+    return built
+
+
+def test_watcher_computes_recommendations_off_the_request_path(monkeypatch, tmp_path):
+    from edu_graph.knowledge_reload import CatalogWatcher
+
+    built = counting(monkeypatch)
+    catalog = tmp_path / 'rdf.json'
+    shutil.copy(SOURCE, catalog)
+
+    watcher = CatalogWatcher(str(catalog), 'json-ld', interval=0.05)
+
+    assert len(built) == 1
+
+    watcher.current.api.recommend('T5.3')
+
+    assert len(built) == 1
+
+    watcher.start()
+    try:
+        catalog.write_bytes(catalog.read_bytes() + b'\n')
+        deadline = time.monotonic() + 30
+
+        while watcher.reloads == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+
+    assert watcher.reloads == 1
+    assert [thread.name for thread in built[1:]] == ['catalog-watcher']
+
+    assert watcher.current.api.recommend('T5.3')['similar']
+    assert len(built) == 2
+
+
+def test_concurrent_first_requests_compute_recommendations_once(monkeypatch):
+    from edu_graph import KnowledgeApi, KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    api = KnowledgeApi(library)
+
+    built = counting(monkeypatch)
+    threads = [threading.Thread(target=api.recommend, args=('T5.3',)) for _ in range(4)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
@@ -0,0 +1,72 @@
+import os
+import stat
+import threading
+
+import click
+import pytest
+
+
+@pytest.fixture
+def default_socket(monkeypatch, tmp_path):
+    import tempfile
+
+    monkeypatch.delenv('EDU_GRAPH_SOCKET', raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+
+
+def test_daemon_listens_in_a_private_directory(default_socket):
+    from edu_graph import edu_graph, knowledge_server
+
+    server = knowledge_server.KnowledgeServer(edu_graph)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        directory = os.path.dirname(server.path)
+
+        assert server.path == knowledge_server.socket_path()
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+        output, code = knowledge_server.request(['--help'])
+
+        assert code == 0 and 'Usage' in output
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_daemon_refuses_a_directory_open_to_others(default_socket):
+    from edu_graph import edu_graph, knowledge_server
+
+    os.mkdir(os.path.dirname(knowledge_server.socket_path()), 0o777)
+    os.chmod(os.path.dirname(knowledge_server.socket_path()), 0o777)
+
+    with pytest.raises(click.ClickException):
+        knowledge_server.KnowledgeServer(edu_graph)
+
+
+def test_client_ignores_what_is_not_a_socket_of_the_user(tmp_path):
+    from edu_graph import knowledge_server
+
+    planted = tmp_path / 'planted.sock'
+    planted.write_text('')
+
+    assert knowledge_server.request(['--help'], str(planted)) is None
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason="changing the owner of a socket needs root")
+def test_client_ignores_a_socket_of_another_user(tmp_path):
+    from edu_graph import edu_graph, knowledge_server
+
+    server = knowledge_server.KnowledgeServer(edu_graph, str(tmp_path / 'other.sock'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        os.chown(server.path, 65534, 65534)
+
+        assert knowledge_server.request(['--help'], server.path) is None
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,59 @@
+import re
+
+import pytest
+
+from conftest import SOURCE
+
+
+@pytest.fixture(scope='module')
+def catalogs(tmp_path_factory):
+    from rdflib import Graph
+    from edu_graph import KnowledgeLibrary
+
+    memory = KnowledgeLibrary()
+    memory.load(SOURCE, 'json-ld')
+
+    directory = tmp_path_factory.mktemp('shards')
+    first, second = Graph(), Graph()
+
+    for triple in memory.graph:
+        number = re.match(r'T(\d+)', str(triple[0]))
+        (first if number and int(number.group(1)) <= 4 else second).add(triple)
+
+    first.serialize(directory / 'first.nt', format='nt', encoding='utf-8')
+    second.serialize(directory / 'second.nt', format='nt', encoding='utf-8')
+
+    shards = KnowledgeLibrary()
+    shards.load_shards([(str(directory / 'first.nt'), 'nt'), (str(directory / 'second.nt'), 'nt')])
+
+    yield memory, shards
+
+    shards.shards.close()
+
+
+@pytest.mark.parametrize('query', ['Кортежи', 'програмиране', 'тип', 'цикли', 'условни оператори'])
+def test_sharded_search_ranks_as_one_catalog(catalogs, query):
+    from edu_graph import KnowledgeApi, SearchFilters
+
+    memory, shards = catalogs
+    filters = SearchFilters(query=query)
+    expected = KnowledgeApi(memory).search(filters=filters)
+
+    assert expected
+    assert KnowledgeApi(shards).search(filters=filters) == expected
+
+
+def test_sharded_search_pages_after_ranking(catalogs):
+    from edu_graph import KnowledgeApi, SearchFilters
+
+    memory, shards = catalogs
+    filters = SearchFilters(query='Кортежи')
+    first = KnowledgeApi(shards).search(limit=1, filters=filters)
+
+    assert [str(row[0]) for row in first] == ['T7.19']
+    assert first.total == len(KnowledgeApi(memory).search(filters=filters))
+
+    rest = KnowledgeApi(shards).search(limit=100, cursor=first.cursor, filters=filters)
+
+    assert 'T7.19' not in [str(row[0]) for row in rest]
+    assert len(list(rest)) + 1 == first.total
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import SOURCE
+
+
+@pytest.fixture
+def source(tmp_path):
+    filename = tmp_path / 'rdf.json'
+    shutil.copy(SOURCE, filename)
+    return str(filename)
+
+
+def loaded(filename):
+    from edu_graph import KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(filename, 'json-ld')
+    return library.graph
+
+
+def test_fresh_snapshot_is_read_instead_of_parsing(source):
+    from rdflib import Graph
+    from edu_graph import knowledge_snapshot
+
+    expected = loaded(source)
+    snapshot = knowledge_snapshot.snapshot_path(source)
+    graph = Graph()
+
+    # no temporary file is left behind
+    assert sorted(os.listdir(os.path.dirname(source))) == ['rdf.json', 'rdf.json.snapshot']
+    assert knowledge_snapshot.read(graph, snapshot, knowledge_snapshot.checksum(source))
+    assert set(graph) == set(expected)
+
+
+def test_stale_snapshot_is_not_read(source):
+    from rdflib import Graph
+    from edu_graph import knowledge_snapshot
+
+    expected = len(loaded(source))
+    snapshot = knowledge_snapshot.snapshot_path(source)
+
+    with open(source, 'a') as file:
+        file.write('\n')
+
+    assert not knowledge_snapshot.read(Graph(), snapshot, knowledge_snapshot.checksum(source))
+    assert len(loaded(source)) == expected
+
+
+@pytest.mark.parametrize('size', [0.5, 0.99])
+def test_truncated_snapshot_is_parsed_again(source, size):
+    from rdflib import Graph
+    from edu_graph import knowledge_snapshot
+
+    expected = len(loaded(source))
+    snapshot = knowledge_snapshot.snapshot_path(source)
+    checksum = knowledge_snapshot.checksum(source)
+
+    with open(snapshot, 'r+b') as file:
+        file.truncate(int(os.path.getsize(snapshot) * size))
+
+    graph = Graph()
+
+    assert not knowledge_snapshot.read(graph, snapshot, checksum)
+    assert len(graph) == 0
+    assert len(loaded(source)) == expected
+    assert knowledge_snapshot.read(Graph(), snapshot, checksum)
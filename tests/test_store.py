@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+from conftest import ROOT, SOURCE
+
+WRITER = """
+import sys
+from rdflib import BNode
+from edu_graph import KnowledgeLibrary
+
+library = KnowledgeLibrary(store=sys.argv[1])
+library.add_prerequisite(BNode('T1.1'), BNode('T8.5'))
+"""
+
+
+def test_opened_store_does_not_block_other_processes(store):
+    from edu_graph import KnowledgeLibrary
+
+    reader = KnowledgeLibrary(store=store)
+    reader.load(SOURCE, 'json-ld')
+
+    writer = subprocess.run([sys.executable, '-c', WRITER, store], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+
+    assert writer.returncode == 0, writer.stderr
+
+
+def test_changes_by_another_process_invalidate_cached_results(store):
+    from edu_graph import KnowledgeApi, KnowledgeLibrary
+
+    reader = KnowledgeLibrary(store=store)
+    api = KnowledgeApi(reader)
+    version = reader.version
+
+    assert 'T8.5' not in [str(row[0]) for row in api.search_deps('T1.1')]
+
+    subprocess.run([sys.executable, '-c', WRITER, store], cwd=ROOT, check=True, timeout=60)
+
+    assert reader.version != version
+    assert 'T8.5' in [str(row[0]) for row in api.search_deps('T1.1')]
+
+
+def test_store_indexes_are_kept_until_the_store_changes(store):
+    from rdflib import BNode
+    from edu_graph import KnowledgeLibrary
+
+    library = KnowledgeLibrary(store=store)
+    text = library.text_index()
+
+    assert library.text_index() is text
+    assert library.prerequisite_index() is library.prerequisite_index()
+
+    library.add_prerequisite(BNode('T1.1'), BNode('T8.5'))
+
+    assert library.text_index() is not text
+
+
+def test_loading_another_file_replaces_the_store_contents(store, tmp_path):
+    from rdflib import Graph
+    from edu_graph import KnowledgeLibrary
+
+    source = Graph().parse(SOURCE, format='json-ld')
+    smaller = tmp_path / 'smaller.nt'
+    smaller.write_text(''.join(sorted(source.serialize(format='nt').splitlines(True))[:100]))
+
+    library = KnowledgeLibrary(store=store)
+    library.load(str(smaller), 'nt')
+
+    assert len(library.graph) == 100
+
+    library.load(SOURCE, 'json-ld')
+
+    assert len(library.graph) == len(source)
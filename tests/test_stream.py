@@ -0,0 +1,81 @@
+import gzip
+import io
+
+import pytest
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import RDFS, XSD
+
+from conftest import SOURCE
+
+LINES = b'''# a comment line
+_:T1.1 <http://www.w3.org/2000/01/rdf-schema#label> "Say \\"hello\\"\\n" .
+_:T1.1 <http://schema.org/inLanguage> "\\u0411\\u0433"@bg-BG .
+_:T1.1 <http://schema.org/position> "3"^^<http://www.w3.org/2001/XMLSchema#integer> . # trailing comment
+
+<http://example.org/a> <http://example.org/b> _:T1.2 <http://example.org/graph> .
+'''
+
+
+def read(data):
+    from edu_graph import knowledge_stream
+
+    return list(knowledge_stream.read(io.BytesIO(data)))
+
+
+def test_terms_are_read_as_written():
+    label, language, position, quad = read(LINES)
+
+    assert label == (BNode('T1.1'), RDFS.label, Literal('Say "hello"\n'))
+    assert language[2] == Literal('Бг', lang='bg-BG')
+    assert position[2] == Literal('3', datatype=XSD.integer)
+    assert quad == (URIRef('http://example.org/a'), URIRef('http://example.org/b'), BNode('T1.2'))
+
+
+@pytest.mark.parametrize('line', [
+    b'_:T1.1 <http://example.org/p> "unterminated .',
+    b'_:T1.1 <http://example.org/p> "no dot"',
+    b'_:T1.1 "literal predicate" "x" .',
+])
+def test_invalid_line_raises_value_error(line):
+    with pytest.raises(ValueError, match='line 2'):
+        read(b'# first\n' + line + b'\n')
+
+
+@pytest.fixture(scope='module')
+def library():
+    from edu_graph import KnowledgeLibrary
+
+    library = KnowledgeLibrary()
+    library.load(SOURCE, 'json-ld', snapshot=False)
+    return library
+
+
+@pytest.mark.parametrize('name', ['catalog.nt', 'catalog.nt.gz'])
+def test_export_and_load_round_trip_through_a_path(library, tmp_path, name):
+    from edu_graph import KnowledgeLibrary
+
+    path = str(tmp_path / name)
+    library.export(path, 'nt')
+
+    if name.endswith('.gz'):
+        with gzip.open(path) as file:
+            assert file.readline()
+
+    loaded = KnowledgeLibrary()
+    loaded.load(path, 'nt', snapshot=False)
+
+    assert set(loaded.graph) == set(library.graph)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_export_and_load_round_trip_through_a_file_object(library, compress):
+    from edu_graph import KnowledgeLibrary
+
+    file = io.BytesIO()
+    library.export(file, 'nt', compress=compress)
+    file.seek(0)
+
+    loaded = KnowledgeLibrary()
+    loaded.load(file, 'nt', compress=compress)
+
+    assert set(loaded.graph) == set(library.graph)
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from conftest import ROOT
+from test_parity import FILTERS, answers
+
+SPREADSHEET = os.path.join(ROOT, 'data', '1619073985303267.ods')
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    import pandas as pd
+
+    sheet = pd.read_excel(SPREADSHEET, index_col=0)
+    edited = sheet.copy()
+
+    edited.loc['T1.2', 'Учебна Единица'] = 'Компилатори'
+    edited.loc['T1.3', 'концепции'] = 'компилатори'
+    edited = edited.drop(index='T1.6')
+    edited.loc['T1.99'] = edited.loc['T1.3']
+    edited.loc['T1.99', 'Учебна Единица'] = 'Нова единица'
+    edited.loc['T1.99', 'Зависи от '] = 'T1.2'
+
+    return sheet, edited
+
+
+@pytest.fixture(scope='module')
+def synced(sheets):
+    from edu_graph import KnowledgeLibrary
+
+    sheet, edited = sheets
+    library = KnowledgeLibrary()
+    library.generate(sheet)
+    delta = library.update(edited)
+
+    generated = KnowledgeLibrary()
+    generated.generate(edited)
+
+    return library, generated, delta
+
+
+def test_update_reports_the_changed_materials(synced):
+    library, generated, delta = synced
+
+    assert {'T1.2', 'T1.3', 'T1.6', 'T1.99'} <= set(map(str, delta["materials"]))
+    assert delta["added"] and delta["removed"]
+
+
+def test_updated_graph_equals_a_generated_one(synced):
+    library, generated, delta = synced
+
+    assert set(library.graph) == set(generated.graph)
+
+
+@pytest.mark.parametrize('filters', FILTERS + [{'query': 'компилатори'}])
+def test_updated_graph_answers_as_a_generated_one(synced, filters):
+    from edu_graph import KnowledgeApi
+
+    library, generated, delta = synced
+
+    assert answers(library, filters) == answers(generated, filters)
+    assert KnowledgeApi(library).search_deps('T1.99') == KnowledgeApi(generated).search_deps('T1.99')